@@ -0,0 +1,84 @@
+'''Benchmark encoding of /track responses on synthetic models.
+
+Compares the indented JSON produced by Flask's jsonify with the compact
+encoding used by the server, in the default and the columnar format, with and
+without compression.
+
+Run from the repository root:
+$ python -m benchmarks.benchmarkSerialization
+
+Usage:
+  benchmarkSerialization.py [-v VOCAB] [-n PERIODS] [-m MAXTERMS] [-r REPEAT]
+                            [-s SEEDS]
+
+  -v VOCAB     Vocabulary size of each model [default: 20000].
+  -n PERIODS   Number of periods [default: 40].
+  -m MAXTERMS  Number of terms tracked per period [default: 50].
+  -r REPEAT    Number of times each encoding is repeated [default: 20].
+  -s SEEDS     Comma separated seed terms [default: w1,w2,w3].
+'''
+import json
+import shutil
+import tempfile
+from docopt import docopt
+
+from shico import VocabularyMonitor
+from shico.format import asColumnar
+from shico.server.app import app, _trackPipeline
+from shico.server.encoding import encodeJSON, compress
+from shico.server.utils import initParamParser
+
+from benchmarks.benchmarkTracking import timeRepeated
+from benchmarks.synthetic import saveSyntheticModels
+
+
+def trackResponse(globPattern, seeds, maxTerms):
+    '''Compute the content of a /track response on the given models.'''
+    vm = VocabularyMonitor(globPattern, useCache=False, useMmap=False,
+                           w2vFormat=False, initSims=True)
+    with app.test_request_context('/track/' + ','.join(seeds)):
+        params = initParamParser().parse_args()
+    params.update(maxTerms=maxTerms, maxRelatedTerms=maxTerms,
+                  aggWordsPerYear=maxTerms)
+    return _trackPipeline(vm, None, seeds, params)
+
+
+def runBenchmarks(response, repeat):
+    '''Time each encoding of the given response. Returns a dictionary of
+    encoding name: (timings, size in bytes).'''
+    # What jsonify produces for non-XHR requests
+    indented = lambda: json.dumps(response, indent=2)
+    compact = lambda: encodeJSON(response)
+    columnar = lambda: encodeJSON(asColumnar(response))
+    body = compact()
+    encoders = [
+        ('jsonify', indented),
+        ('compact', compact),
+        ('compact+gzip', lambda: compress(compact(), 'gzip')),
+        ('compact+deflate', lambda: compress(compact(), 'deflate')),
+        ('columnar', columnar),
+        ('columnar+gzip', lambda: compress(columnar(), 'gzip')),
+        ('gzip only', lambda: compress(body, 'gzip'))
+    ]
+    return {name: (timeRepeated(fn, repeat), len(fn()))
+            for name, fn in encoders}
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    seeds = arguments['-s'].split(',')
+
+    modelDir = tempfile.mkdtemp()
+    try:
+        globPattern = saveSyntheticModels(
+            modelDir, vocabSize=int(arguments['-v']),
+            nPeriods=int(arguments['-n']))
+        response = trackResponse(globPattern, seeds, int(arguments['-m']))
+    finally:
+        shutil.rmtree(modelDir)
+
+    results = runBenchmarks(response, int(arguments['-r']))
+    for name, (timing, size) in sorted(results.items(),
+                                       key=lambda r: r[1][0]['median']):
+        print '%-16s median %8.4fs  %10d bytes' % \
+            (name, timing['median'], size)
@@ -0,0 +1,58 @@
+'''Benchmark kbTokenizer sentence tokenization modes.
+
+Run from the repository root:
+$ python -m benchmarks.benchmarkTokenizer
+
+Usage:
+  benchmarkTokenizer.py [-f FILES] [-r REPEAT]
+
+  -f FILES    Text files to tokenize (glob format is supported)
+              [default: shico/kbTokenizer/example_files/*.txt]
+  -r REPEAT   Number of times each sentence is tokenized [default: 100].
+'''
+import codecs
+import glob
+import time
+from docopt import docopt
+
+from shico.kbTokenizer.kbTokenizer import kbTokenizer
+
+
+def loadSentences(globPattern, tokenizer):
+    '''Split all files in the given glob pattern into sentences.'''
+    sentences = []
+    for fileName in sorted(glob.glob(globPattern)):
+        with codecs.open(fileName, mode='r', encoding='utf8') as fin:
+            text = fin.read()
+        sentences.extend(
+            tokenizer.oPunktSentTokenizer.sentences_from_text(text))
+    return sentences
+
+
+def timeMode(tokenizer, sentences, repeat):
+    '''Time tokenizeSentence over all sentences. Returns the elapsed time in
+    seconds and the tokens produced.'''
+    tokens = [tokenizer.tokenizeSentence(s) for s in sentences]
+    start = time.time()
+    for _ in range(repeat):
+        for s in sentences:
+            tokenizer.tokenizeSentence(s)
+    return time.time() - start, tokens
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    repeat = int(arguments['-r'])
+
+    modes = [('default', kbTokenizer()), ('fused', kbTokenizer(bFused=True))]
+    sentences = loadSentences(arguments['-f'], modes[0][1])
+    print 'Sentences: %d (x%d)' % (len(sentences), repeat)
+
+    reference = None
+    for name, tokenizer in modes:
+        elapsed, tokens = timeMode(tokenizer, sentences, repeat)
+        if reference is None:
+            reference = tokens
+        rate = len(sentences) * repeat / elapsed
+        print '%-8s %8.3fs %10.0f sentences/s  identical: %s' % \
+            (name, elapsed, rate, tokens == reference)
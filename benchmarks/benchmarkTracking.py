@@ -0,0 +1,118 @@
+'''Benchmark the concept tracking pipeline on synthetic models.
+
+Results are written as JSON, and can be compared with compareBenchmarks.py.
+
+Run from the repository root:
+$ python -m benchmarks.benchmarkTracking -o results.json
+
+Usage:
+  benchmarkTracking.py [-o OUTPUT] [-v VOCAB] [-d DIM] [-n PERIODS]
+                       [-r REPEAT] [-s SEEDS]
+
+  -o OUTPUT    File where JSON results are written.
+  -v VOCAB     Vocabulary size of each model [default: 20000].
+  -d DIM       Dimension of word vectors [default: 100].
+  -n PERIODS   Number of periods [default: 20].
+  -r REPEAT    Number of times each benchmark is repeated [default: 5].
+  -s SEEDS     Comma separated seed terms [default: w1,w2,w3].
+'''
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+from docopt import docopt
+
+from shico import VocabularyMonitor, VocabularyAggregator
+from shico.format import yearlyNetwork
+from shico.vocabularyaggregator import _adaptiveAggregation
+from shico.vocabularyembedding import doSpaceEmbedding
+
+from benchmarks.synthetic import saveSyntheticModels
+
+
+def timeRepeated(fn, repeat):
+    '''Call fn repeat times. Returns a dictionary with the minimum, median and
+    maximum duration (in seconds).'''
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return {
+        'min': min(times),
+        'median': float(np.median(times)),
+        'max': max(times),
+        'repeat': repeat
+    }
+
+
+def runBenchmarks(globPattern, seeds, repeat):
+    '''Run all benchmarks on the models in globPattern. Returns a dictionary of
+    benchmark name: timings.'''
+    results = {}
+
+    def load(useMmap):
+        return VocabularyMonitor(globPattern, useCache=False, useMmap=useMmap,
+                                 w2vFormat=False, initSims=True)
+    results['load'] = timeRepeated(lambda: load(False), repeat)
+    results['loadMmap'] = timeRepeated(lambda: load(True), repeat)
+
+    vm = load(True)
+    for algorithm in ['adaptive', 'non-adaptive']:
+        results['trackClouds:' + algorithm] = timeRepeated(
+            lambda: vm.trackClouds(seeds, algorithm=algorithm), repeat)
+
+    vocab, links = vm.trackClouds(seeds)
+    agg = VocabularyAggregator(weighF='Gaussian', wfParam=1.0,
+                               yearsInInterval=5, nWordsPerYear=10)
+    results['_adaptiveAggregation'] = timeRepeated(
+        lambda: _adaptiveAggregation(vocab, n=10, yIntervals=5,
+                                     weightF='Gaussian', param=1.0, freq=5),
+        repeat)
+
+    aggVocab, aggPeriods = agg.aggregate(vocab)
+    results['yearlyNetwork'] = timeRepeated(
+        lambda: yearlyNetwork(aggPeriods, aggVocab, vocab, links), repeat)
+    results['doSpaceEmbedding'] = timeRepeated(
+        lambda: doSpaceEmbedding(vm, vocab, aggPeriods), repeat)
+    return results
+
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    config = {
+        'vocabSize': int(arguments['-v']),
+        'dim': int(arguments['-d']),
+        'nPeriods': int(arguments['-n'])
+    }
+    repeat = int(arguments['-r'])
+    seeds = arguments['-s'].split(',')
+
+    modelDir = tempfile.mkdtemp()
+    try:
+        globPattern = saveSyntheticModels(modelDir, **config)
+        results = runBenchmarks(globPattern, seeds, repeat)
+    finally:
+        shutil.rmtree(modelDir)
+
+    for name, timing in sorted(results.items()):
+        print '%-28s median %8.4fs  min %8.4fs' % \
+            (name, timing['median'], timing['min'])
+
+    if arguments['-o'] is not None:
+        report = {
+            'commit': _gitCommit(),
+            'config': dict(config, seeds=seeds, repeat=repeat),
+            'results': results
+        }
+        with open(arguments['-o'], 'w') as fout:
+            json.dump(report, fout, indent=1, sort_keys=True)
@@ -0,0 +1,50 @@
+'''Compare two benchmark result files (e.g. from two commits) written by
+benchmarkTracking.py. Exits with status 1 if any benchmark has become slower
+by more than the given threshold.
+
+Run from the repository root:
+$ python -m benchmarks.compareBenchmarks base.json new.json
+
+Usage:
+  compareBenchmarks.py BASE NEW [-t THRESHOLD]
+
+  BASE           Reference results.
+  NEW            Results to compare against the reference.
+  -t THRESHOLD   Maximum allowed relative slow down of the median time
+                 [default: 0.2].
+'''
+import json
+import sys
+from docopt import docopt
+
+
+def compareResults(base, new, threshold):
+    '''Compare median times of benchmarks present in both results. Returns a
+    list of (name, baseMedian, newMedian, ratio, regressed) tuples.'''
+    comparison = []
+    for name in sorted(set(base) & set(new)):
+        baseMedian = base[name]['median']
+        newMedian = new[name]['median']
+        ratio = newMedian / baseMedian if baseMedian > 0 else 1.0
+        comparison.append((name, baseMedian, newMedian, ratio,
+                           ratio > 1 + threshold))
+    return comparison
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    with open(arguments['BASE']) as fin:
+        base = json.load(fin)
+    with open(arguments['NEW']) as fin:
+        new = json.load(fin)
+    if base['config'] != new['config']:
+        print 'WARNING: benchmarks were run with different configurations'
+
+    comparison = compareResults(base['results'], new['results'],
+                                float(arguments['-t']))
+    for name, baseMedian, newMedian, ratio, regressed in comparison:
+        print '%-28s %8.4fs -> %8.4fs  x%.2f %s' % \
+            (name, baseMedian, newMedian, ratio,
+             'REGRESSION' if regressed else '')
+    if any(regressed for _, _, _, _, regressed in comparison):
+        sys.exit(1)
@@ -0,0 +1,49 @@
+'''Synthetic stacks of period models, for benchmarking.'''
+import os
+import numpy as np
+from gensim.models.keyedvectors import Word2VecKeyedVectors
+
+from shico.build import saveModel
+
+
+class _VectorsOnly():
+
+    '''Minimal model wrapper, so KeyedVectors can be saved with
+    shico.build.saveModel.'''
+
+    def __init__(self, wv):
+        self.wv = wv
+
+
+def syntheticModels(vocabSize=10000, dim=100, nPeriods=10, drift=0.3,
+                    firstYear=1950, yearsInModel=10, seed=0):
+    '''Generate KeyedVectors for nPeriods consecutive (overlapping) periods.
+    Words are clustered around a number of random topics, and vectors drift
+    slowly from one period to the next, so tracked concepts change gradually
+    as they would on real models. Returns a list of (name, KeyedVectors).'''
+    rand = np.random.RandomState(seed)
+    words = ['w%d' % i for i in range(vocabSize)]
+    nTopics = max(vocabSize // 50, 1)
+    topics = rand.randn(nTopics, dim)
+    vectors = topics[rand.randint(nTopics, size=vocabSize)] + \
+        0.5 * rand.randn(vocabSize, dim)
+
+    models = []
+    for p in range(nPeriods):
+        vectors = vectors + drift * rand.randn(vocabSize, dim)
+        wv = Word2VecKeyedVectors(dim)
+        wv.add(words, vectors.astype(np.float32))
+        name = '%d_%d' % (firstYear + p, firstYear + p + yearsInModel - 1)
+        models.append((name, wv))
+    return models
+
+
+def saveSyntheticModels(modelDir, **kwargs):
+    '''Generate synthetic models (see syntheticModels) and save them in
+    modelDir, in the format written by shico.build. Returns the glob pattern
+    matching the saved models.'''
+    if not os.path.exists(modelDir):
+        os.makedirs(modelDir)
+    for name, wv in syntheticModels(**kwargs):
+        saveModel(_VectorsOnly(wv), modelDir, name)
+    return os.path.join(modelDir, '????_????.kv')
@@ -0,0 +1,120 @@
+'''Align the vector spaces of consecutive models.
+
+Each model is trained independently, so its vector space is arbitrarily
+rotated with respect to the models of other periods. Here, the vectors of each
+model are aligned onto the (aligned) vectors of the model before it, by
+solving the orthogonal Procrustes problem over the words both models share
+(anchor words). The resulting rotation matrices can be saved next to the model
+files (as NAME.align.npy), and are then used by VocabularyMonitor(align=True)
+instead of computing them at load time.
+
+Usage:
+  alignment.py [-f FILES] [-n] [--w2v-format] [-a ANCHORS]
+
+  -f FILES         Path to word2vec model files (glob format is supported)
+                   [default: word2vecModels/????_????.w2v]
+  -n,--non-binary  w2v files are NOT binary.
+  --w2v-format     Models are in word2vec format (not gensim's own format).
+  -a ANCHORS       Maximum number of anchor words (most frequent shared words)
+                   used for each alignment.
+'''
+import os
+import numpy as np
+from sortedcontainers import SortedDict
+
+
+def procrustes(A, B):
+    '''Find the orthogonal matrix R which best maps the rows of A onto the
+    rows of B (i.e. minimizes ||A.R - B||).'''
+    U, _, Vt = np.linalg.svd(A.T.dot(B))
+    return U.dot(Vt)
+
+
+def sharedAnchors(wv0, wv1, maxAnchors=None):
+    '''List words present in the vocabularies of both given KeyedVectors, most
+    frequent (in wv0) first.'''
+    anchors = [w for w in wv0.index2word if w in wv1.vocab]
+    if maxAnchors is not None:
+        anchors = anchors[:maxAnchors]
+    return anchors
+
+
+def unitVectors(wv, words):
+    '''Return matrix with the normalized vectors of the given words (which
+    must be in the vocabulary of the given KeyedVectors).'''
+    idx = [wv.vocab[w].index for w in words]
+    vectors = np.asarray(wv.vectors[idx], dtype=np.float64)
+    norms = np.sqrt((vectors ** 2).sum(axis=1))[:, np.newaxis]
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def alignModels(models, maxAnchors=None):
+    '''Calculate the rotation matrix of every model onto the previous one.
+
+    models      SortedDict of KeyedVectors, keyed by year key.
+    maxAnchors  Maximum number of anchor words used for each alignment.
+
+    Returns a SortedDict of rotation matrices, keyed by year key. Multiplying
+    (unit) vectors of a model by its matrix places them in the vector space of
+    the first model. The matrix of the first model is the identity.
+    '''
+    transforms = SortedDict()
+    prevWV = None
+    prevR = None
+    for key, wv in models.iteritems():
+        if prevWV is None:
+            R = np.eye(wv.vector_size)
+        elif wv.vector_size != prevWV.vector_size:
+            raise ValueError('Cannot align models of different dimensions: ' +
+                             key)
+        else:
+            anchors = sharedAnchors(prevWV, wv, maxAnchors)
+            if len(anchors) == 0:
+                R = prevR
+            else:
+                A = unitVectors(wv, anchors)
+                B = unitVectors(prevWV, anchors).dot(prevR)
+                R = procrustes(A, B)
+        transforms[key] = R
+        prevWV = wv
+        prevR = R
+    return transforms
+
+
+def transformPath(modelFile):
+    '''Path where the alignment matrix of the given model file is stored.'''
+    return os.path.splitext(modelFile)[0] + '.align.npy'
+
+
+def saveTransform(modelFile, R):
+    '''Store alignment matrix R next to the given model file.'''
+    np.save(transformPath(modelFile), R)
+
+
+def loadTransform(modelFile):
+    '''Load alignment matrix stored next to the given model file. Returns None
+    if there is none.'''
+    path = transformPath(modelFile)
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+    from shico.vocabularymonitor import VocabularyMonitor
+
+    arguments = docopt(__doc__)
+    maxAnchors = arguments['-a']
+    maxAnchors = int(maxAnchors) if maxAnchors is not None else None
+
+    vm = VocabularyMonitor(arguments['-f'],
+                           binary=not arguments['--non-binary'],
+                           useCache=False, useMmap=False,
+                           w2vFormat=arguments['--w2v-format'])
+    models = SortedDict({key: vm.getKeyedVectors(key)
+                         for key in vm.getAvailableYears()})
+    for key, R in alignModels(models, maxAnchors).iteritems():
+        print '[%s]: saved alignment' % key
+        saveTransform(vm.getModelFile(key), R)
@@ -0,0 +1,361 @@
+'''Build word2vec models for ShiCo from a corpus of yearly documents.
+
+The corpus is tokenized only once, into one shard per year. Models for each
+(overlapping) period are then trained by streaming the shards of the years in
+that period, with several periods being trained in parallel. Models are saved
+in gensim's native KeyedVectors format, which VocabularyMonitor can load
+memory mapped (w2vFormat=False, useMmap=True).
+
+Both steps are incremental: years whose documents have not changed are not
+tokenized again, and only models covering a changed year shard are trained
+again.
+
+Alternatively, models can be warm started (--warm-start): periods are then
+trained one after the other, each starting from the vectors of the previous
+period and trained further only on the years which the previous period did not
+include. This is much faster for long stacks of overlapping periods, and keeps
+consecutive vector spaces roughly aligned. The full training state of each
+period is kept next to its model (as NAME.state), so that a later build can
+resume from the last unchanged period.
+
+Corpus folder is expected to contain one folder per year, with any number of
+text files (*.txt) inside:
+    corpus/1950/doc1.txt
+    corpus/1950/doc2.txt
+    corpus/1951/...
+
+Usage:
+  build.py CORPUS SHARDS MODELS [-y YEARS] [-s STEP] [-p PROCESSES]
+                                [--size SIZE] [--min-count COUNT]
+                                [--threads THREADS] [--warm-start]
+
+  CORPUS              Folder containing one folder of text files per year.
+  SHARDS              Folder where tokenized year shards are stored.
+  MODELS              Folder where models are stored.
+  -y YEARS            Number of years in each model [default: 10].
+  -s STEP             Years between the start of consecutive models
+                      [default: 1].
+  -p PROCESSES        Number of parallel processes (default: number of CPUs).
+  --size SIZE         Dimensionality of word vectors [default: 100].
+  --min-count COUNT   Ignore words with lower frequency [default: 5].
+  --threads THREADS   Worker threads used to train each model [default: 1].
+  --warm-start        Initialize each period from the previous one.
+'''
+import copy
+import glob
+import gzip
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from multiprocessing import Pool
+
+from gensim.models import Word2Vec
+
+
+def shardPath(shardDir, year):
+    '''Path of the shard containing the sentences of the given year.'''
+    return os.path.join(shardDir, '%d.txt.gz' % year)
+
+
+def writeShard(shardDir, year, sentences):
+    '''Write the given sentences (lists of words) as the shard of the given
+    year, one sentence per line. Returns the checksum of the shard.'''
+    path = shardPath(shardDir, year)
+    with gzip.open(path + '.tmp', 'wb') as fout:
+        for sentence in sentences:
+            if len(sentence) > 0:
+                fout.write(u' '.join(sentence).encode('utf8') + '\n')
+    os.rename(path + '.tmp', path)
+    return _fileChecksum(path)
+
+
+class ShardSentences():
+
+    '''Iterable over the sentences in the shards of the given years. Shards
+    are read from disk on every iteration, so sentences are never all in
+    memory at once (gensim iterates over sentences once per epoch).'''
+
+    def __init__(self, shardDir, years):
+        self._shardDir = shardDir
+        self._years = years
+
+    def __iter__(self):
+        for year in self._years:
+            path = shardPath(self._shardDir, year)
+            if not os.path.exists(path):
+                continue
+            with gzip.open(path, 'rb') as fin:
+                for line in fin:
+                    yield line.decode('utf8').split()
+
+
+def periodName(years):
+    '''Name of the model covering the given years, in the YEAR1_YEAR2 format
+    expected by VocabularyMonitor.'''
+    return '%d_%d' % (years[0], years[-1])
+
+
+def periodWindows(years, yearsInModel, stepYears=1):
+    '''Group the given years in (overlapping) periods of yearsInModel years,
+    starting every stepYears years. Returns a list of lists of years.
+    E.g. for years 1950-1961, yearsInModel=10 and stepYears=1:
+        [[1950, ..., 1959], [1951, ..., 1960], [1952, ..., 1961]]
+    '''
+    y0 = min(years)
+    yN = max(years)
+    return [range(start, start + yearsInModel)
+            for start in range(y0, yN - yearsInModel + 2, stepYears)]
+
+
+def tokenizeCorpus(corpusDir, shardDir, processes=None):
+    '''Tokenize the text files of every year folder in corpusDir into year
+    shards. Years whose files have not changed since the last run are skipped.
+    Returns the manifest of year shards: { year: { source, checksum } }.'''
+    if not os.path.exists(shardDir):
+        os.makedirs(shardDir)
+    manifest = _loadManifest(shardDir)
+
+    jobs = []
+    for yearDir in sorted(glob.glob(os.path.join(corpusDir, '[0-9]' * 4))):
+        year = int(os.path.basename(yearDir))
+        source = _sourceSignature(yearDir)
+        entry = manifest.get(str(year))
+        if entry is not None and entry['source'] == source and \
+                os.path.exists(shardPath(shardDir, year)):
+            continue
+        jobs.append((yearDir, shardDir, year, source))
+
+    pool = Pool(processes)
+    try:
+        for year, source, checksum in pool.imap_unordered(_tokenizeYear, jobs):
+            print '[%d]: tokenized' % year
+            manifest[str(year)] = {'source': source, 'checksum': checksum}
+            _saveManifest(shardDir, manifest)
+    finally:
+        pool.close()
+        pool.join()
+    return manifest
+
+
+def buildModels(shardDir, modelDir, yearsInModel=10, stepYears=1,
+                processes=None, w2vParams=None):
+    '''Train a model for every period covered by the year shards in shardDir.
+    Periods whose shards (and training parameters) have not changed since the
+    last build are skipped. Returns a dictionary with the training time (in
+    seconds) of every model which was built.
+
+    w2vParams are passed on to gensim's Word2Vec.
+    '''
+    if w2vParams is None:
+        w2vParams = {}
+    if not os.path.exists(modelDir):
+        os.makedirs(modelDir)
+    shards = _loadManifest(shardDir)
+    manifest = _loadManifest(modelDir)
+
+    jobs = []
+    years = sorted(int(year) for year in shards.keys())
+    for period in periodWindows(years, yearsInModel, stepYears):
+        name = periodName(period)
+        entry = {
+            'shards': {str(y): shards[str(y)]['checksum']
+                       for y in period if str(y) in shards},
+            'params': w2vParams
+        }
+        if manifest.get(name) == entry and \
+                os.path.exists(modelPath(modelDir, name)):
+            continue
+        jobs.append((shardDir, modelDir, name, period, w2vParams, entry))
+
+    timings = {}
+    pool = Pool(processes)
+    try:
+        for name, entry, seconds in pool.imap_unordered(_trainPeriod, jobs):
+            print '[%s]: trained in %.1fs' % (name, seconds)
+            manifest[name] = entry
+            _saveManifest(modelDir, manifest)
+            timings[name] = seconds
+    finally:
+        pool.close()
+        pool.join()
+    return timings
+
+
+def buildModelsWarmStart(shardDir, modelDir, yearsInModel=10, stepYears=1,
+                         w2vParams=None):
+    '''Train a model for every period covered by the year shards in shardDir,
+    initializing each period with the model of the previous period and
+    training it only on the years which were not in the previous period.
+    Periods are skipped while they (and all periods before them) have not
+    changed since the last build. Returns a dictionary with the training time
+    (in seconds) of every model which was built.
+
+    w2vParams are passed on to gensim's Word2Vec.
+    '''
+    if w2vParams is None:
+        w2vParams = {}
+    if not os.path.exists(modelDir):
+        os.makedirs(modelDir)
+    shards = _loadManifest(shardDir)
+    manifest = _loadManifest(modelDir)
+
+    timings = {}
+    model = None
+    previous = None
+    years = sorted(int(year) for year in shards.keys())
+    for period in periodWindows(years, yearsInModel, stepYears):
+        name = periodName(period)
+        entry = {
+            'shards': {str(y): shards[str(y)]['checksum']
+                       for y in period if str(y) in shards},
+            'params': w2vParams,
+            'warmStart': periodName(previous) if previous else None
+        }
+        # Periods can only be skipped until the first one which changes, as
+        # every later period depends on it.
+        if model is None and manifest.get(name) == entry and \
+                os.path.exists(modelPath(modelDir, name)) and \
+                os.path.exists(statePath(modelDir, name)):
+            previous = period
+            continue
+
+        start = time.time()
+        if model is None and previous is not None:
+            model = Word2Vec.load(statePath(modelDir, periodName(previous)))
+        if model is None:
+            sentences = ShardSentences(shardDir, period)
+            model = Word2Vec(**w2vParams)
+            model.build_vocab(sentences)
+        else:
+            newYears = [y for y in period if y not in previous]
+            sentences = ShardSentences(shardDir, newYears)
+            model.build_vocab(sentences, update=True)
+        model.train(sentences, total_examples=model.corpus_count,
+                    epochs=model.epochs)
+        model.save(statePath(modelDir, name))
+        saveModel(model, modelDir, name)
+
+        timings[name] = time.time() - start
+        print '[%s]: trained in %.1fs' % (name, timings[name])
+        manifest[name] = entry
+        _saveManifest(modelDir, manifest)
+        previous = period
+    return timings
+
+
+def modelPath(modelDir, name):
+    '''Path of the model with the given name.'''
+    return os.path.join(modelDir, name + '.kv')
+
+
+def statePath(modelDir, name):
+    '''Path of the full training state of the model with the given name
+    (only kept for warm started builds).'''
+    return os.path.join(modelDir, name + '.state')
+
+
+def saveModel(model, modelDir, name):
+    '''Save the vectors of the given model for use by VocabularyMonitor.
+    Vectors are normalized and stored as a separate .npy file, so they can be
+    memory mapped when loaded. The model itself is not modified, so it can
+    still be trained further.'''
+    wv = copy.copy(model.wv)
+    norms = np.sqrt((wv.vectors ** 2).sum(axis=1))[:, np.newaxis]
+    wv.vectors = wv.vectors / norms
+    wv.vectors_norm = None
+    wv.save(modelPath(modelDir, name), sep_limit=0)
+
+
+def _tokenizeYear(job):
+    '''Worker: tokenize all text files in a year folder into its shard.'''
+    # kbTokenizer requires nltk, which is only needed for building models
+    from shico.kbTokenizer.kbTokenizer import kbTokenizer
+
+    yearDir, shardDir, year, source = job
+    tokenizer = kbTokenizer(bFused=True)
+
+    def sentences():
+        for textFile in sorted(glob.glob(os.path.join(yearDir, '*.txt'))):
+            for sentence in tokenizer.tokenizeFile(textFile):
+                yield sentence
+    checksum = writeShard(shardDir, year, sentences())
+    return year, source, checksum
+
+
+def _trainPeriod(job):
+    '''Worker: train and save the model of a single period.'''
+    shardDir, modelDir, name, period, w2vParams, entry = job
+    start = time.time()
+    sentences = ShardSentences(shardDir, period)
+    model = Word2Vec(**w2vParams)
+    model.build_vocab(sentences)
+    model.train(sentences, total_examples=model.corpus_count,
+                epochs=model.epochs)
+    saveModel(model, modelDir, name)
+    return name, entry, time.time() - start
+
+
+def _sourceSignature(yearDir):
+    '''Summarize names, sizes and modification times of the text files in a
+    year folder, so changes can be detected without reading them.'''
+    files = []
+    for textFile in sorted(glob.glob(os.path.join(yearDir, '*.txt'))):
+        stat = os.stat(textFile)
+        files.append((os.path.basename(textFile), stat.st_size,
+                      stat.st_mtime))
+    return hashlib.md5(repr(files)).hexdigest()
+
+
+def _fileChecksum(path):
+    '''MD5 checksum of the given file.'''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _loadManifest(folder):
+    '''Load the build manifest stored in the given folder.'''
+    manifestFile = os.path.join(folder, 'manifest.json')
+    if not os.path.exists(manifestFile):
+        return {}
+    with open(manifestFile, 'r') as fin:
+        return json.load(fin)
+
+
+def _saveManifest(folder, manifest):
+    '''Save the build manifest in the given folder.'''
+    manifestFile = os.path.join(folder, 'manifest.json')
+    with open(manifestFile + '.tmp', 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    os.rename(manifestFile + '.tmp', manifestFile)
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+    processes = arguments['-p']
+    processes = int(processes) if processes is not None else None
+    w2vParams = {
+        'size': int(arguments['--size']),
+        'min_count': int(arguments['--min-count']),
+        'workers': int(arguments['--threads'])
+    }
+
+    tokenizeCorpus(arguments['CORPUS'], arguments['SHARDS'],
+                   processes=processes)
+    if arguments['--warm-start']:
+        timings = buildModelsWarmStart(arguments['SHARDS'], arguments['MODELS'],
+                                       yearsInModel=int(arguments['-y']),
+                                       stepYears=int(arguments['-s']),
+                                       w2vParams=w2vParams)
+    else:
+        timings = buildModels(arguments['SHARDS'], arguments['MODELS'],
+                              yearsInModel=int(arguments['-y']),
+                              stepYears=int(arguments['-s']),
+                              processes=processes, w2vParams=w2vParams)
+    print 'Built %d models in %.1fs' % (len(timings), sum(timings.values()))
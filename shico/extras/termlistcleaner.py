@@ -1,4 +1,5 @@
 import editdistance
+from functools32 import lru_cache
 
 
 def cleanTermList(termList):
@@ -9,21 +10,37 @@ def cleanTermList(termList):
 
     termList    A list of (word,weight) tuples to be filtered.
     '''
+    # Cached, as the same lists are cleaned whenever a query is repeated
+    try:
+        return list(_cleanTerms(tuple(termList)))
+    except TypeError:
+        # Unhashable items cannot be cached
+        return _cleanTerms.__wrapped__(termList)
+
+
+@lru_cache(maxsize=1000)
+def _cleanTerms(termList):
     minEditDiff = 0.20
     cleanTerms = []
+    # Kept words, grouped by length
+    keptByLength = {}
     for word, weight in termList:
-        if not _isCloseToList(word, cleanTerms, minEditDiff):
+        if not _isCloseToKept(word, keptByLength, minEditDiff):
             cleanTerms.append((word, weight))
+            keptByLength.setdefault(len(word), []).append(word)
     return cleanTerms
 
 
-def _isCloseToList(word, cleanTerms, minEditDiff):
-    if len(cleanTerms) == 0:
-        return False
-    for known, _ in cleanTerms:
-        diff = float(editdistance.eval(word, known)) / \
-            min(len(word), len(known))
-        if diff < minEditDiff:
-            # print '%s is too close (%2.4f) to %s'%(word, diff, known)
-            return True
+def _isCloseToKept(word, keptByLength, minEditDiff):
+    wordLen = len(word)
+    for knownLen, knownWords in keptByLength.iteritems():
+        shortest = min(wordLen, knownLen)
+        # The edit distance is at least the difference in length, so words
+        # whose lengths differ this much cannot be close
+        if shortest > 0 and abs(wordLen - knownLen) >= minEditDiff * shortest:
+            continue
+        for known in knownWords:
+            diff = float(editdistance.eval(word, known)) / shortest
+            if diff < minEditDiff:
+                return True
     return False
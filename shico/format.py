@@ -1,5 +1,6 @@
 from collections import Counter
 import numpy as np
+from metrics import metrics
 
 
 def getRangeMiddle(first, last=None):
@@ -17,17 +18,12 @@ def yearlyNetwork(aggPeriods, aggResults, results, links):
     '''Build a dictionary of network graph definitions. The key of this
     dictionary are the years and the values are the network definition
     (in the format used by D3).'''
-    seeds = {y: seedResp.keys() for y, seedResp in links.iteritems()}
+    periods = _PeriodGraphs(results, links)
 
     networks = {}
     for year_mu, years in aggPeriods.iteritems():
-        yResults = {y: results[y] for y in years}
-        yLinks = {y: links[y] for y in years}
-        ySeeds = {y: seeds[y] for y in years}
-
-        finalVocab = aggResults[year_mu]
-        networks[year_mu] = _metaToNetwork(
-            yResults, ySeeds, finalVocab, yLinks)
+        finalWords = [w for w, v in aggResults[year_mu]]
+        networks[year_mu] = periods.network(years, finalWords)
     return networks
 
 
@@ -50,82 +46,78 @@ def yearTuplesAsDict(results):
     return {year: _tuplesAsDict(vals) for year, vals in results.iteritems()}
 
 
-def _buildNode(word, counts, seedSet, finalWords):
-    ''' Build a node for a force directed graph in format used by front end'''
-    if word in seedSet:
-        nodeType = 'seed'
-    elif word in finalWords:
-        nodeType = 'word'
-    else:
-        nodeType = 'drop'
-    return {
-        'name': word,
-        'count': counts[word],
-        'type': nodeType
-    }
-
-
-def _buildLink(seed, word, distance, nodeIdx):
-    ''' Build a node for a force directed graph in format used by front end'''
-    seedIdx = nodeIdx[seed]
-    wordIdx = nodeIdx[word]
-    return {
-        'source': seedIdx,
-        'target': wordIdx,
-        'value':  1 / (distance + 1)
-    }
-
-
-def _buildLinks(yLinks, nodeIdx):
-    '''Build a list of links from the given yearly links. For each year group,
-    link all seeds to all their results (with strength proportional to their
-    distance)'''
-    linkList = []
-    # We are not doing anything with the years in yLinks
-    for links in yLinks.values():
-        for seed, results in links.iteritems():
-            for word, distance in results:
-                # TODO: check seeds present in dict more elegantly
-                if seed in nodeIdx and word in nodeIdx:
-                    linkList.append(_buildLink(seed, word, distance, nodeIdx))
-                else:
-                    print 'Seed or word not in index!'
-    return linkList
-
-
-def _buildNodes(wordCounts, seedSet, finalWords):
-    '''Build a set of nodes for the network graph. Also builds an dictionary of
-    words and the ID's used to represent them on the list of nodes.'''
-    nodeIdx = {}
-    nodes = []
-    # Make nodes from unique words
-    uniqueWords = set(wordCounts.keys() + list(seedSet))
-    for idx, w in enumerate(uniqueWords):
-        nodes.append(_buildNode(w, wordCounts, seedSet, finalWords))
-        nodeIdx[w] = idx
-    return nodes, nodeIdx
-
-
-def _metaToNetwork(results, seeds, finalVocab, yLinks):
-    '''Build a network (nodes & links), using aggregated results. Network must
-    be in a format usable by the front end. '''
-    wordCounts = Counter([w for res in results.values() for w, v in res])
-    seedSet = set(w for seed in seeds.values() for w in seed)
-    finalWords = [w for w, v in finalVocab]
-
-    nodes, nodeIdx = _buildNodes(wordCounts, seedSet, finalWords)
-    links = _buildLinks(yLinks, nodeIdx)
-
-    network = {
-        'nodes': nodes,
-        'links': links
-    }
-    return network
+class _PeriodGraphs():
+
+    '''Words, seeds and links of every period, prepared once so networks of
+    aggregated years (which combine sets of periods) are assembled without
+    processing the results of each period again.'''
+
+    def __init__(self, results, links):
+        self._results = {y: [w for w, _ in res]
+                         for y, res in results.iteritems()}
+        self._seeds = {y: seedLinks.keys()
+                       for y, seedLinks in links.iteritems()}
+
+        # Only results and seeds can be nodes, so links to other words are
+        # dropped here (and counted as missing)
+        candidates = set(w for words in self._results.itervalues()
+                         for w in words)
+        candidates.update(w for seeds in self._seeds.itervalues()
+                          for w in seeds)
+        self._links = {}
+        self._missing = {}
+        for y, seedLinks in links.iteritems():
+            periodLinks = [(seed, w, 1 / (d + 1))
+                           for seed, related in seedLinks.iteritems()
+                           for w, d in related if w in candidates]
+            self._links[y] = periodLinks
+            self._missing[y] = sum(len(related)
+                                   for related in seedLinks.itervalues()) - \
+                len(periodLinks)
+
+    def network(self, years, finalWords):
+        '''Build a network (nodes & links) of the given periods. Network must
+        be in a format usable by the front end.'''
+        counts = Counter(w for y in years for w in self._results[y])
+        seedSet = set(w for y in years for w in self._seeds[y])
+        finalWords = set(finalWords)
+
+        nodeWords = counts.keys() + [w for w in seedSet if w not in counts]
+        nodeIdx = {w: i for i, w in enumerate(nodeWords)}
+        nodes = [{'name': w,
+                  'count': counts[w],
+                  'type': 'seed' if w in seedSet else
+                          'word' if w in finalWords else 'drop'}
+                 for w in nodeWords]
+
+        # Link seeds to their results (with strength proportional to their
+        # distance), if both are nodes
+        links = [{'source': nodeIdx[seed], 'target': nodeIdx[w], 'value': v}
+                 for y in years for seed, w, v in self._links[y]
+                 if w in nodeIdx]
+        nMissing = sum(len(self._links[y]) + self._missing[y]
+                       for y in years) - len(links)
+        if nMissing > 0:
+            metrics.increment('network_links_missing', nMissing)
+
+        return {
+            'nodes': nodes,
+            'links': links
+        }
 
 
 def _tuplesAsDict(pairList):
     '''Convert list of (words,weight) to dict of word: weight'''
-    return {word: weight for word, weight in pairList}
+    return {word: float(weight) for word, weight in pairList}
+
+
+def wordLocationsAsDicts(words, locs):
+    '''Wrap the given words and their (x,y) locations (one row of locs per
+    word) in dictionaries. All locations are converted to Python floats at
+    once.'''
+    locs = np.asarray(locs, dtype=float)
+    locs = np.where(np.isnan(locs), 0, locs).tolist()
+    return [{'word': word, 'x': x, 'y': y} for word, (x, y) in zip(words, locs)]
 
 
 def wordLocationAsDict(word,loc):
@@ -135,3 +127,118 @@ def wordLocationAsDict(word,loc):
         'x': 0 if np.isnan(loc[0]) else loc[0],
         'y': 0 if np.isnan(loc[1]) else loc[1]
     }
+
+
+# Node types, as listed in columnar responses
+_nodeTypes = ['seed', 'word', 'drop']
+
+
+def asColumnar(response):
+    '''Convert a /track response (with stream, networks, embedded and vocabs)
+    to the columnar format. Words are replaced by their index in a single
+    string table, and lists of dictionaries by dictionaries of parallel
+    lists. E.g. the stream:
+        { 1950: { 'a': w1, 'b': w2 } }
+    becomes:
+        { 1950: { 'words': [0, 1], 'weights': [w1, w2] } }
+    with strings = ['a', 'b']. Other keys of the response are left as they
+    are.'''
+    strings = []
+    stringIdx = {}
+
+    def index(words):
+        idx = []
+        for w in words:
+            i = stringIdx.get(w)
+            if i is None:
+                i = stringIdx[w] = len(strings)
+                strings.append(w)
+            idx.append(i)
+        return idx
+
+    columnar = dict(response)
+    columnar['stream'] = {
+        year: {'words': index(words.keys()), 'weights': words.values()}
+        for year, words in response['stream'].iteritems()}
+    columnar['networks'] = {
+        year: _networkAsColumnar(net, index)
+        for year, net in response['networks'].iteritems()}
+    columnar['embedded'] = {
+        year: {'words': index([loc['word'] for loc in locs]),
+               'x': [loc['x'] for loc in locs],
+               'y': [loc['y'] for loc in locs]}
+        for year, locs in response['embedded'].iteritems()}
+    columnar['vocabs'] = {
+        period: _vocabsAsColumnar(seedVocabs, index)
+        for period, seedVocabs in response['vocabs'].iteritems()}
+    columnar['strings'] = strings
+    columnar['nodeTypes'] = _nodeTypes
+    return columnar
+
+
+def fromColumnar(columnar):
+    '''Convert a response in the columnar format back to the default
+    format (see asColumnar).'''
+    strings = columnar['strings']
+    nodeTypes = columnar['nodeTypes']
+    response = {key: value for key, value in columnar.iteritems()
+                if key not in ('strings', 'nodeTypes')}
+    response['stream'] = {
+        year: {strings[w]: weight
+               for w, weight in zip(words['words'], words['weights'])}
+        for year, words in columnar['stream'].iteritems()}
+    response['networks'] = {
+        year: {
+            'nodes': [{'name': strings[w], 'count': count,
+                       'type': nodeTypes[t]}
+                      for w, count, t in zip(net['nodes']['names'],
+                                             net['nodes']['counts'],
+                                             net['nodes']['types'])],
+            'links': [{'source': s, 'target': t, 'value': v}
+                      for s, t, v in zip(net['links']['sources'],
+                                         net['links']['targets'],
+                                         net['links']['values'])]
+        }
+        for year, net in columnar['networks'].iteritems()}
+    response['embedded'] = {
+        year: [{'word': strings[w], 'x': x, 'y': y}
+               for w, x, y in zip(locs['words'], locs['x'], locs['y'])]
+        for year, locs in columnar['embedded'].iteritems()}
+    response['vocabs'] = {
+        period: {strings[seed]: [(strings[w], v)
+                                 for w, v in zip(words, values)]
+                 for seed, words, values in zip(vocabs['seeds'],
+                                                vocabs['words'],
+                                                vocabs['values'])}
+        for period, vocabs in columnar['vocabs'].iteritems()}
+    return response
+
+
+def _networkAsColumnar(network, index):
+    '''Convert network nodes and links to parallel lists.'''
+    nodes = network['nodes']
+    links = network['links']
+    typeIdx = {t: i for i, t in enumerate(_nodeTypes)}
+    return {
+        'nodes': {
+            'names': index([node['name'] for node in nodes]),
+            'counts': [node['count'] for node in nodes],
+            'types': [typeIdx[node['type']] for node in nodes]
+        },
+        'links': {
+            'sources': [link['source'] for link in links],
+            'targets': [link['target'] for link in links],
+            'values': [link['value'] for link in links]
+        }
+    }
+
+
+def _vocabsAsColumnar(seedVocabs, index):
+    '''Convert the related words (and their values) of each seed to parallel
+    lists.'''
+    seeds = seedVocabs.keys()
+    return {
+        'seeds': index(seeds),
+        'words': [index([w for w, _ in seedVocabs[seed]]) for seed in seeds],
+        'values': [[v for _, v in seedVocabs[seed]] for seed in seeds]
+    }
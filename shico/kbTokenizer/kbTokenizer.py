@@ -11,25 +11,45 @@ class kbTokenizer:
     '''Tokenizer used to pre-process KB dataset for generating Word2Vec models
     from word2vecModels/*.w2v. '''
 
-    def __init__(self, bLowerCase=True):
+    def __init__(self, bLowerCase=True, bFused=False):
         self.bLowerCase = bLowerCase
+        self.bFused = bFused
 
         self.oPunktSentTokenizer = PunktSentenceTokenizer()
 
         self.sNonTokenChars = (u"[‘’“”…”’“–«»\,‘\]\[;:\-\"'\?!¡¢∞§¶•ª≠∑´®†¨^π"
-                               "ƒ©˙∆˚¬≈√∫~⁄™‹›ﬁﬂ‡°·±—‚„‰∏”`◊ˆ~¯˘¿÷\*\(\)<>="
-                               "\+#^\\\/_]+")
+                               u"ƒ©˙∆˚¬≈√∫~⁄™‹›ﬁﬂ‡°·±—‚„‰∏”`◊ˆ~¯˘¿÷\*\(\)<>="
+                               u"\+#^\\\/_]+")
         self.reNonTokenChars_start = \
             re.compile(u"(\A|\s)%s" % self.sNonTokenChars, re.U)
         self.reNonTokenChars_end = \
             re.compile(u"%s(\.?(\s|\Z))" % self.sNonTokenChars, re.U)
         self.reWhitespace = re.compile("\W+", re.U)
 
+        # Fused mode: both non-token character rules in a single pattern
+        # (using look-arounds, so separators do not need to be put back) and
+        # tokens picked up with findall instead of split. This produces the
+        # same tokens as removeNonTokenChars followed by reWhitespace.split.
+        self.reNonTokenChars = re.compile(
+            u"(?<!\S)%s|%s(?=\.?(\s|\Z))" %
+            (self.sNonTokenChars, self.sNonTokenChars), re.U)
+        self.reToken = re.compile(u"\w+", re.U)
+        # Non-token chars which are not word characters are dropped by findall
+        # anyway, so sentences without any of the remaining ones (e.g. '_')
+        # can skip the substitution altogether.
+        sChars = re.sub(r"\\(.)", r"\1", self.sNonTokenChars[1:-2])
+        sWordChars = u''.join(c for c in sChars if re.match(u"\w", c, re.U))
+        self.reWordNonTokenChars = re.compile(
+            u"[%s]" % re.escape(sWordChars), re.U)
+
     def removeNonTokenChars(self, sString):
         sString = re.sub(self.reNonTokenChars_start, '\g<1>', sString)
         return re.sub(self.reNonTokenChars_end, '\g<1>', sString)
 
     def tokenizeSentence(self, sString):
+        if self.bFused:
+            return self.tokenizeSentenceFused(sString)
+
         aTokens = None
         if self.bLowerCase:
             aTokens = self.reWhitespace.split(
@@ -47,6 +67,15 @@ class kbTokenizer:
         else:
             return aTokens[iStart:]
 
+    def tokenizeSentenceFused(self, sString):
+        '''Single pass version of tokenizeSentence (produces identical
+        tokens).'''
+        if self.bLowerCase:
+            sString = sString.lower()
+        if self.reWordNonTokenChars.search(sString) is not None:
+            sString = self.reNonTokenChars.sub(u'', sString)
+        return self.reToken.findall(sString)
+
     def tokenizeText(self, sText):
         '''
         Input is a utf8 text.
@@ -83,6 +112,8 @@ if __name__ == "__main__":
     oArgsParser = argparse.ArgumentParser(
         description='Tokenize a KB text file.')
     oArgsParser.add_argument('INPUT_FILE')
+    oArgsParser.add_argument('--fused', action='store_true',
+                             help='Use single pass sentence tokenization.')
     oArgs = oArgsParser.parse_args()
 
     # To make the printing go right, we make sure that the output is utf8
@@ -91,7 +122,7 @@ if __name__ == "__main__":
     if sys.stdout.encoding != 'utf8':
         sys.stdout = codecs.getwriter('utf8')(sys.stdout)
 
-    oKbTokenizer = kbTokenizer()
+    oKbTokenizer = kbTokenizer(bFused=oArgs.fused)
 
     aTextTokens = oKbTokenizer.tokenizeFile(oArgs.INPUT_FILE)
 
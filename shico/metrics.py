@@ -0,0 +1,358 @@
+'''Timing and counting instrumentation.
+
+Code is instrumented through the shared `metrics` object:
+
+    with metrics.timer('stage', stage='aggregate'):
+        ...
+    metrics.increment('most_similar_calls')
+
+Nothing is recorded unless metrics are enabled (metrics.enabled = True), or
+the current thread is collecting timings for a single request (see
+metrics.requestTimings), so instrumentation costs next to nothing otherwise.
+Recorded metrics can be exported in the Prometheus text format with
+metrics.render(). Processes serving the same application (e.g. gunicorn
+workers) can share their timers and counters through a directory (see
+metrics.shareAcross), so every process renders the totals of all of them.
+
+A request can also be profiled with cProfile (see metrics.requestProfile).
+Threads working on behalf of the request add their own profile to it.
+'''
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Metrics():
+
+    '''Registry of timers, counters and gauges. Every metric has a name and
+    optionally a set of labels (given as keyword arguments).'''
+
+    def __init__(self, prefix='shico', saveInterval=1.0):
+        self.enabled = False
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._timers = defaultdict(lambda: [0, 0.0])
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._collectors = []
+        self._shareDir = None
+        self._saveInterval = saveInterval
+        self._saveLock = threading.Lock()
+        self._saved = 0.0
+
+    def timer(self, name, **labels):
+        '''Return a context manager which times the code it wraps.'''
+        if not self.enabled and self._requestTimings() is None:
+            return _nullTimer
+        return _Timer(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        '''Record a duration (in seconds).'''
+        timings = self._requestTimings()
+        if timings is not None:
+            if len(labels) > 0:
+                label = ','.join(str(v) for _, v in sorted(labels.items()))
+                timings.setdefault(name, {})[label] = seconds
+            else:
+                timings[name] = seconds
+        if self.enabled:
+            with self._lock:
+                timer = self._timers[_metricKey(name, labels)]
+                timer[0] += 1
+                timer[1] += seconds
+            self._autoSave()
+
+    def increment(self, name, value=1, **labels):
+        '''Increase a counter.'''
+        if self.enabled:
+            with self._lock:
+                self._counters[_metricKey(name, labels)] += value
+            self._autoSave()
+
+    def setGauge(self, name, value, **labels):
+        '''Set the value of a gauge.'''
+        if self.enabled:
+            with self._lock:
+                self._gauges[_metricKey(name, labels)] = value
+
+    def addCollector(self, collector):
+        '''Register a function which is called on render, and returns a list
+        of (name, labels, value) gauges to be included.'''
+        self._collectors.append(collector)
+
+    @contextmanager
+    def requestTimings(self):
+        '''Collect all durations recorded by the current thread in a dictionary
+        (which is yielded). Durations are keyed by their name, and then by
+        their label values (if they have labels). E.g:
+            { 'stage': { 'aggregate': 0.1, ... }, 'load': 1.5 }
+        '''
+        previous = self._requestTimings()
+        timings = {}
+        self._local.timings = timings
+        try:
+            yield timings
+        finally:
+            self._local.timings = previous
+
+    def currentTimings(self):
+        '''Return the dictionary in which the current thread collects
+        durations for a request, or None if it collects none.'''
+        return self._requestTimings()
+
+    @contextmanager
+    def shareTimings(self, timings):
+        '''Collect the durations recorded by the current thread in the given
+        dictionary (as returned by currentTimings in another thread). Used by
+        threads which work on behalf of a request.'''
+        previous = self._requestTimings()
+        self._local.timings = timings
+        try:
+            yield timings
+        finally:
+            self._local.timings = previous
+
+    @contextmanager
+    def requestProfile(self):
+        '''Profile the current thread, and threads which share its profile
+        (see shareProfile), while inside the context. Yields a
+        RequestProfile.'''
+        previous = self.currentProfile()
+        profile = RequestProfile()
+        self._local.profile = profile
+        try:
+            with profile.profiling():
+                yield profile
+        finally:
+            self._local.profile = previous
+
+    def currentProfile(self):
+        '''Return the RequestProfile the current thread is working for, or
+        None if no request is being profiled.'''
+        return getattr(self._local, 'profile', None)
+
+    def shareProfile(self, profile):
+        '''Return a context manager which profiles the current thread into
+        the given RequestProfile (as returned by currentProfile in another
+        thread), or does nothing if profile is None. Used by threads which
+        work on behalf of a request.'''
+        if profile is None:
+            return _nullTimer
+        return self._shareProfile(profile)
+
+    @contextmanager
+    def _shareProfile(self, profile):
+        previous = self.currentProfile()
+        self._local.profile = profile
+        try:
+            with profile.profiling():
+                yield profile
+        finally:
+            self._local.profile = previous
+
+    def shareAcross(self, directory):
+        '''Share timers and counters with the other processes using the given
+        directory. Every process saves its own values there (while recording,
+        at most every saveInterval seconds), and render reports the sums over
+        all processes. Gauges are not shared.'''
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Already created by another process
+            if not os.path.isdir(directory):
+                raise
+        self._shareDir = directory
+
+    def save(self):
+        '''Save the timers and counters of this process in the shared
+        directory (if any).'''
+        if self._shareDir is None:
+            return
+        with self._saveLock:
+            self._save()
+
+    def render(self, extraGauges=None):
+        '''Render all metrics in the Prometheus text format. extraGauges is an
+        optional list of (name, labels, value) gauges to be included. Timers
+        and counters are those of all processes sharing them (see
+        shareAcross).'''
+        lines = []
+        if self._shareDir is not None:
+            self.save()
+            timers, counters = self._loadShared()
+        else:
+            with self._lock:
+                timers = self._timers.items()
+                counters = self._counters.items()
+        timers = sorted(timers)
+        counters = sorted(counters)
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        if extraGauges is not None:
+            gauges += [(_metricKey(name, labels), value)
+                       for name, labels, value in extraGauges]
+        for collector in self._collectors:
+            gauges += [(_metricKey(name, labels), value)
+                       for name, labels, value in collector()]
+
+        typed = set()
+        for (name, labels), (count, total) in timers:
+            self._type(lines, typed, name + '_seconds', 'summary')
+            lines.append(self._line(name + '_seconds_count', labels, count))
+            lines.append(self._line(name + '_seconds_sum', labels, total))
+        for (name, labels), value in counters:
+            self._type(lines, typed, name + '_total', 'counter')
+            lines.append(self._line(name + '_total', labels, value))
+        for (name, labels), value in gauges:
+            self._type(lines, typed, name, 'gauge')
+            lines.append(self._line(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        '''Forget all recorded metrics.'''
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def _requestTimings(self):
+        return getattr(self._local, 'timings', None)
+
+    def _autoSave(self):
+        if self._shareDir is None or \
+                time.time() - self._saved < self._saveInterval:
+            return
+        # Threads recording while another one saves do not wait for it
+        if self._saveLock.acquire(False):
+            try:
+                self._save()
+            finally:
+                self._saveLock.release()
+
+    def _save(self):
+        with self._lock:
+            data = {
+                'timers': [[name, labels, value]
+                           for (name, labels), value
+                           in self._timers.iteritems()],
+                'counters': [[name, labels, value]
+                             for (name, labels), value
+                             in self._counters.iteritems()]
+            }
+        path = os.path.join(self._shareDir, '%d.json' % os.getpid())
+        # Replaced at once, so other processes never read a partial file
+        with open(path + '.tmp', 'w') as fout:
+            json.dump(data, fout)
+        os.rename(path + '.tmp', path)
+        self._saved = time.time()
+
+    def _loadShared(self):
+        '''Sum the timers and counters saved by all processes.'''
+        timers = defaultdict(lambda: [0, 0.0])
+        counters = defaultdict(float)
+        for fileName in os.listdir(self._shareDir):
+            if not fileName.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self._shareDir, fileName)) as fin:
+                    data = json.load(fin)
+            except (IOError, ValueError):
+                # Removed meanwhile
+                continue
+            for name, labels, (count, total) in data['timers']:
+                timer = timers[_sharedKey(name, labels)]
+                timer[0] += count
+                timer[1] += total
+            for name, labels, value in data['counters']:
+                counters[_sharedKey(name, labels)] += value
+        return timers.items(), counters.items()
+
+    def _type(self, lines, typed, name, metricType):
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s_%s %s' % (self._prefix, name, metricType))
+
+    def _line(self, name, labels, value):
+        labelStr = ','.join('%s="%s"' % (k, v) for k, v in labels)
+        if len(labelStr) > 0:
+            labelStr = '{' + labelStr + '}'
+        return '%s_%s%s %r' % (self._prefix, name, labelStr, float(value))
+
+
+class _Timer():
+
+    '''Context manager recording the time spent inside it.'''
+
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry.observe(self._name, time.time() - self._start,
+                               **self._labels)
+        return False
+
+
+class RequestProfile():
+
+    '''cProfile statistics of a request, collected from every thread which
+    works on it.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    @contextmanager
+    def profiling(self):
+        '''Profile the current thread while inside the context.'''
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def stats(self):
+        '''Return the pstats.Stats of all threads profiled so far.'''
+        with self._lock:
+            profiles = list(self._profiles)
+        return pstats.Stats(*profiles)
+
+
+class _NullTimer():
+
+    '''Context manager which does nothing.'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullTimer = _NullTimer()
+
+
+def _metricKey(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _sharedKey(name, labels):
+    '''Metric key of a metric saved in a shared directory.'''
+    return str(name), tuple((str(k), str(v)) for k, v in labels)
+
+
+metrics = Metrics()
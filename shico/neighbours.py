@@ -0,0 +1,165 @@
+'''Precompute the nearest neighbours of the words of each model.
+
+For every word among the most frequent words of a model, its top K neighbours
+(in the whole vocabulary) are computed by multiplying blocks of normalized
+vectors, with blocks spread over several processes. Each block of words is
+compared with the vocabulary a block of columns at a time (keeping a running
+top K, see shico.similarity.topSimilar), so the memory used by each process is
+bounded by the block sizes rather than the size of the vocabulary. Neighbours are stored
+next to the model file, as word ids (int32, NAME.nn-ids.npy) and similarities
+(float16, NAME.nn-sims.npy). VocabularyMonitor(useNeighbours=True) then
+answers most_similar queries for these words (with topn <= K) by looking up
+their row in the table, and scans the model as before for other words.
+
+Usage:
+  neighbours.py [-f FILES] [-n] [--w2v-format] [-k K] [-r ROWS] [-b BLOCK]
+                [-c COLUMNS] [-p PROCESSES]
+
+  -f FILES         Path to word2vec model files (glob format is supported)
+                   [default: word2vecModels/????_????.w2v]
+  -n,--non-binary  w2v files are NOT binary.
+  --w2v-format     Models are in word2vec format (not gensim's own format).
+  -k K             Number of neighbours of each word [default: 100].
+  -r ROWS          Number of (most frequent) words whose neighbours are
+                   computed (default: all words).
+  -b BLOCK         Number of words whose neighbours are computed at once
+                   [default: 256].
+  -c COLUMNS       Number of words each block is compared with at once
+                   [default: 65536].
+  -p PROCESSES     Number of parallel processes (default: number of CPUs).
+'''
+import os
+import numpy as np
+from multiprocessing import Pool
+
+from similarity import topSimilar
+
+# Normalized vectors shared with worker processes (which inherit them when
+# the pool is forked)
+_vectors = None
+
+
+def blockNeighbours(vectors, start, stop, K, columnBlockSize=65536):
+    '''Find the top K neighbours of words start to stop, among all rows of the
+    given (normalized) vectors, comparing them with columnBlockSize rows at a
+    time. A word is not its own neighbour. Returns matrices of neighbour ids
+    and similarities, one row per word, in order of decreasing similarity.'''
+    K = min(K, len(vectors) - 1)
+    return topSimilar(vectors, vectors[start:stop], K,
+                      exclude=[[i] for i in range(start, stop)],
+                      blockSize=columnBlockSize)
+
+
+def topNeighbours(vectors, K=100, nRows=None, blockSize=256, processes=None,
+                  columnBlockSize=65536):
+    '''Find the top K neighbours of the first nRows words (all words if
+    None), in blocks of blockSize words spread over the given number of
+    processes. Each block is compared with columnBlockSize words at a time.
+    Returns an int32 matrix of neighbour ids and a float16 matrix of
+    similarities.'''
+    global _vectors
+    nRows = len(vectors) if nRows is None else min(nRows, len(vectors))
+    K = min(K, len(vectors) - 1)
+    ids = np.empty((nRows, K), dtype=np.int32)
+    sims = np.empty((nRows, K), dtype=np.float16)
+    blocks = [(start, min(start + blockSize, nRows), K, columnBlockSize)
+              for start in range(0, nRows, blockSize)]
+
+    # Set before forking, so workers inherit the vectors instead of each
+    # receiving a copy
+    _vectors = vectors
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        if pool is not None:
+            results = pool.imap(_blockJob, blocks)
+        else:
+            results = (_blockJob(block) for block in blocks)
+        for (start, stop, _, _), (blockIds, blockSims) in zip(blocks,
+                                                               results):
+            ids[start:stop] = blockIds
+            sims[start:stop] = blockSims
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _vectors = None
+    return ids, sims
+
+
+def _blockJob(block):
+    start, stop, K, columnBlockSize = block
+    return blockNeighbours(_vectors, start, stop, K, columnBlockSize)
+
+
+def neighboursPaths(modelFile):
+    '''Paths where the neighbour ids and similarities of the given model file
+    are stored.'''
+    base = os.path.splitext(modelFile)[0]
+    return base + '.nn-ids.npy', base + '.nn-sims.npy'
+
+
+def saveNeighbours(modelFile, ids, sims):
+    '''Store neighbour ids and similarities next to the given model file.'''
+    idsPath, simsPath = neighboursPaths(modelFile)
+    np.save(idsPath, ids)
+    np.save(simsPath, sims)
+
+
+def loadNeighbours(modelFile, mmap=True):
+    '''Load the neighbours stored next to the given model file (memory mapped,
+    unless mmap is False). Returns None if there are none.'''
+    idsPath, simsPath = neighboursPaths(modelFile)
+    if not (os.path.exists(idsPath) and os.path.exists(simsPath)):
+        return None
+    mmapMode = 'r' if mmap else None
+    return np.load(idsPath, mmap_mode=mmapMode), \
+        np.load(simsPath, mmap_mode=mmapMode)
+
+
+class NeighbourTable():
+
+    '''Precomputed neighbours of the words of one model.'''
+
+    def __init__(self, ids, sims, index2word, vocab):
+        self._ids = ids
+        self._sims = sims
+        self._index2word = index2word
+        self._vocab = vocab
+
+    def most_similar(self, term, topn):
+        '''Return the topn (word, similarity) neighbours of term, or None if
+        they are not in the table.'''
+        entry = self._vocab.get(term)
+        if entry is None or entry.index >= len(self._ids) or \
+                topn is None or topn > self._ids.shape[1]:
+            return None
+        ids = self._ids[entry.index, :topn]
+        sims = self._sims[entry.index, :topn].astype(float)
+        return [(self._index2word[i], s)
+                for i, s in zip(ids.tolist(), sims.tolist())]
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+    from shico.vocabularymonitor import VocabularyMonitor
+
+    arguments = docopt(__doc__)
+    nRows = arguments['-r']
+    nRows = int(nRows) if nRows is not None else None
+    processes = arguments['-p']
+    processes = int(processes) if processes is not None else None
+
+    vm = VocabularyMonitor(arguments['-f'],
+                           binary=not arguments['--non-binary'],
+                           useCache=False, useMmap=False,
+                           w2vFormat=arguments['--w2v-format'],
+                           initSims=True)
+    for key in vm.getAvailableYears():
+        wv = vm.getKeyedVectors(key)
+        ids, sims = topNeighbours(wv.vectors_norm, K=int(arguments['-k']),
+                                  nRows=nRows,
+                                  blockSize=int(arguments['-b']),
+                                  columnBlockSize=int(arguments['-c']),
+                                  processes=processes)
+        saveNeighbours(vm.getModelFile(key), ids, sims)
+        print '[%s]: saved neighbours of %d words' % (key, len(ids))
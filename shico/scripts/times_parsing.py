@@ -1,13 +1,38 @@
+'''Convert Times XML archive files to per-year compressed CSV files.
+
+Every 0FFO*.xml file found under the year folders listed in YEAR_FILES is
+streamed article by article and appended to SAVE_PATH/<year>.csv.gz (with
+columns Source, Title, Content). Files are parsed in parallel. Converted files
+are recorded in SAVE_PATH/manifest.json, and are skipped when the conversion
+is run again. Rows appended by an interrupted conversion, whose files were not
+recorded yet, are removed before converting these files again.
+
+Run:
+$ python times_parsing.py yearFiles.txt --orig-path ./ --save-path myTimes/
+
+yearFiles.txt can be created as:
+$ ls ./mnt/times/TDA_GDA/TDA_GDA_1785-2009/ > yearFiles.txt
+'''
+import csv
+import gzip
+import json
+import os
 import re
+from collections import defaultdict
 from HTMLParser import HTMLParser
+from multiprocessing import Pool
 from lxml import etree
 from bs4 import BeautifulSoup
+from glob2 import glob
+
+_reSpaces = re.compile('\ +')
+_html = HTMLParser()
 
 # Helper functions
 
 def getText(textElement):
-    regex = re.compile('\ +')
-    html = HTMLParser()
+    regex = _reSpaces
+    html = _html
 
     text = regex.sub(' ', textElement)
     text = text.strip()
@@ -64,6 +89,16 @@ def getArticlesFromSoup_fast(soup):
         articles.append((title, body))
     return articles
 
+def iterArticles_fast(xmlfile):
+    '''Stream (title, body) tuples for every article in the given XML file.
+    Articles are cleared once they have been read, so memory use is bounded by
+    the size of a single article rather than the whole file.'''
+    for _, article in etree.iterparse(xmlfile, events=('end',), tag='article'):
+        yield getTitle_fast(article), getBody_fast(article)
+        article.clear()
+        while article.getprevious() is not None:
+            del article.getparent()[0]
+
 # Example file load
 # datafile = 'data/times-20101217/0FFO-2010-1217.xml'
 # soup = getSoupFromXML(datafile)
@@ -74,47 +109,130 @@ def getArticlesFromSoup_fast(soup):
 # print 'Content:\n', body
 
 
-# ## Load XML and save as CSV
-from glob2 import glob
-import pandas as pd
-import os
-
-# origPath = 'mnt/times/TDA_GDA/TDA_GDA_1785-2009/'
-origPath = './'
-# yearFiles.txt created as:
-#   ```ls ./mnt/times/TDA_GDA/TDA_GDA_1785-2009/ > yearFiles.txt```
-with open('yearFiles.txt', 'r') as fin:
-    yearFiles = fin.readlines()
-    yearFiles = [ year.strip() for year in yearFiles ]
-savePath = 'myTimes/'
-
-# Save / load as CSV
-for year in yearFiles:
-    yearPath = origPath + year
-    print 'YearPath: ',yearPath
-    for datafile in glob(yearPath + '/**/0FFO*.xml'):
-        print 'Loading   : ',datafile
-
-        yearDir = savePath + year + '/'
-
-        if not os.path.exists(yearDir):
-            print 'create ',yearDir
-            os.makedirs(yearDir)
-
-        saveFile = yearDir + os.path.basename(datafile)
-        saveFile = saveFile.replace('.xml', '.csv')
-
-        if not os.path.exists(saveFile):
-            print '...save as: ',saveFile
-
-            soup = getSoupFromXML_fast(datafile)
-            articles = getArticlesFromSoup_fast(soup)
-
-            df = pd.DataFrame(articles, columns=['Title', 'Content'])
-            df.to_csv(saveFile, encoding='UTF8')
-
-            del soup
-            del articles
-            del df
+# ## Load XML and save as compressed CSV
+
+def readYearFiles(yearFilesPath):
+    '''Read list of year folders (one per line).'''
+    with open(yearFilesPath, 'r') as fin:
+        yearFiles = fin.readlines()
+    return [ year.strip() for year in yearFiles if len(year.strip()) > 0 ]
+
+def loadManifest(savePath):
+    '''Load manifest of converted files ({ source: { year, articles, size } }).
+    size is the size of the year file once the rows of source were appended
+    to it.'''
+    manifestFile = os.path.join(savePath, 'manifest.json')
+    if not os.path.exists(manifestFile):
+        return {}
+    with open(manifestFile, 'r') as fin:
+        return json.load(fin)
+
+def saveManifest(savePath, manifest):
+    '''Save manifest, replacing the previous one only once it has been
+    completely written.'''
+    manifestFile = os.path.join(savePath, 'manifest.json')
+    with open(manifestFile + '.tmp', 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    os.rename(manifestFile + '.tmp', manifestFile)
+
+def findDataFiles(origPath, yearFiles):
+    '''List (year, source, datafile) for every XML file of the given years.
+    source is the path of the datafile relative to origPath.'''
+    dataFiles = []
+    for year in yearFiles:
+        yearPath = os.path.join(origPath, year)
+        for datafile in sorted(glob(yearPath + '/**/0FFO*.xml')):
+            source = os.path.relpath(datafile, origPath)
+            dataFiles.append((year, source, datafile))
+    return dataFiles
+
+def _parseDataFile(job):
+    '''Worker: parse a single XML file into a list of utf8 encoded rows.'''
+    year, source, datafile = job
+    rows = [ (source.encode('utf8'), title.encode('utf8'), body.encode('utf8'))
+             for title, body in iterArticles_fast(datafile) ]
+    return year, source, rows
+
+def appendRows(saveFile, rows):
+    '''Append rows to compressed CSV file (gzip members can be concatenated).
+    The header is only written when the file is created. Returns the size of
+    the file after appending.'''
+    isNew = not os.path.exists(saveFile)
+    with gzip.open(saveFile, 'ab') as fout:
+        writer = csv.writer(fout)
+        if isNew:
+            writer.writerow(['Source', 'Title', 'Content'])
+        writer.writerows(rows)
+    return os.path.getsize(saveFile)
+
+def discardUnrecorded(savePath, manifest):
+    '''Cut rows which are not recorded in the manifest (appended by a
+    conversion interrupted before saving the manifest) from the end of the
+    year files, so they are not appended twice. Year files with entries
+    lacking a size (written by older conversions) are left as they are.'''
+    sizes = defaultdict(int)
+    unknown = set()
+    for entry in manifest.itervalues():
+        if 'size' in entry:
+            sizes[entry['year']] = max(sizes[entry['year']], entry['size'])
+        else:
+            unknown.add(entry['year'])
+    for saveFile in glob(os.path.join(savePath, '*.csv.gz')):
+        year = os.path.basename(saveFile)[:-len('.csv.gz')]
+        if year in unknown or os.path.getsize(saveFile) <= sizes[year]:
+            continue
+        print '...discard unrecorded rows of: ',saveFile
+        if sizes[year] == 0:
+            os.remove(saveFile)
+        else:
+            with open(saveFile, 'r+b') as fout:
+                fout.truncate(sizes[year])
+
+def convertYears(yearFiles, origPath, savePath, processes=None):
+    '''Convert all XML files from the given year folders, skipping files which
+    are already in the manifest. Returns the number of files converted.'''
+    if not os.path.exists(savePath):
+        print 'create ',savePath
+        os.makedirs(savePath)
+
+    manifest = loadManifest(savePath)
+    discardUnrecorded(savePath, manifest)
+    jobs = []
+    for year, source, datafile in findDataFiles(origPath, yearFiles):
+        if source in manifest:
+            print '...aleady exists: ',source
         else:
-            print '...aleady exists: ',saveFile
+            jobs.append((year, source, datafile))
+
+    pool = Pool(processes)
+    try:
+        for year, source, rows in pool.imap_unordered(_parseDataFile, jobs):
+            saveFile = os.path.join(savePath, year + '.csv.gz')
+            print '...save as: ',saveFile,'(%s)'%source
+            size = appendRows(saveFile, rows)
+            manifest[source] = { 'year': year, 'articles': len(rows),
+                                 'size': size }
+            saveManifest(savePath, manifest)
+    finally:
+        pool.close()
+        pool.join()
+    return len(jobs)
+
+if __name__ == '__main__':
+    import argparse
+    oArgsParser = argparse.ArgumentParser(
+        description='Convert Times XML files to per-year compressed CSV.')
+    oArgsParser.add_argument('YEAR_FILES',
+                             help='File listing one year folder per line.')
+    oArgsParser.add_argument('--orig-path', default='./',
+                             help='Folder containing the year folders.')
+    oArgsParser.add_argument('--save-path', default='myTimes/',
+                             help='Folder where CSV files are saved.')
+    oArgsParser.add_argument('--processes', type=int, default=None,
+                             help='Number of parsing processes '
+                                  '(default: number of CPUs).')
+    oArgs = oArgsParser.parse_args()
+
+    yearFiles = readYearFiles(oArgs.YEAR_FILES)
+    convertYears(yearFiles, oArgs.orig_path, oArgs.save_path,
+                 processes=oArgs.processes)
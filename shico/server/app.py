@@ -2,6 +2,11 @@
 
 Usage:
   app.py  [-f FILES] [-n] [-d] [-p PORT] [-c FUNCTIONNAME] [--use-mmap] [--w2v-format]
+          [--align] [--max-anchors ANCHORS] [-w WORKERS] [-t TIMEOUT] [--metrics]
+          [--profile-dir PROFILEDIR] [--profile-token TOKEN]
+          [--track-index INDEX] [--index-concepts CONCEPTS]
+          [--index-presets PRESETS] [--neighbours] [--block-size BLOCK]
+          [--period-workers PERIODWORKERS] [--prefetch PERIODS] [--variants]
 
   -f FILES         Path to word2vec model files (glob format is supported)
                    [default: word2vecModels/195[0-1]_????.w2v]
@@ -12,22 +17,67 @@ Usage:
   -p PORT          Port in which ShiCo should run [default: 8000].
   --use-mmap       ??? [default: False]
   --w2v-format     ??? [default: True]
+  --align          Align vector spaces of consecutive models (uses alignments
+                   saved by shico/alignment.py if available).
+  --max-anchors ANCHORS
+                   Maximum number of anchor words used to align models without
+                   saved alignments [default: 10000].
+  -w WORKERS       Number of /track requests computed at the same time
+                   [default: 2].
+  -t TIMEOUT       Seconds after which a /track request gives up.
+  --metrics        Record timings and counters, served on /metrics.
+  --profile-dir PROFILEDIR
+                   Allow profiling of /track requests, storing profiles in
+                   PROFILEDIR (requires --profile-token).
+  --profile-token TOKEN
+                   Only profile requests presenting TOKEN.
+  --track-index INDEX
+                   Answer /track requests from the index of precomputed
+                   results INDEX (built by shico/server/trackindex.py).
+  --index-concepts CONCEPTS
+                   Concepts to be indexed. The index is rebuilt in the
+                   background when it is missing or out of date.
+  --index-presets PRESETS
+                   Parameter presets to be indexed.
+  --neighbours     Use neighbours precomputed by shico/neighbours.py.
+  --block-size BLOCK
+                   Answer similarity queries by scanning vectors in blocks of
+                   BLOCK words, bounding the memory used by each query.
+  --period-workers PERIODWORKERS
+                   Number of periods tracked at the same time by the
+                   non-adaptive algorithm.
+  --prefetch PERIODS
+                   Number of periods ahead queried speculatively by the
+                   adaptive algorithm (requires --period-workers).
+  --variants       Clean with spelling variants precomputed by
+                   shico/variants.py.
 '''
 from docopt import docopt
 
-from flask import Flask, current_app, jsonify
+from flask import Flask, Response, current_app, jsonify, request, send_file
 from flask.ext.cors import CORS
 
 from shico.vocabularyaggregator import VocabularyAggregator
 from shico.vocabularyembedding import doSpaceEmbedding
 
-from shico.format import yearlyNetwork, getRangeMiddle, yearTuplesAsDict
-from shico.server.utils import initApp
+from shico.format import yearlyNetwork, getRangeMiddle, yearTuplesAsDict, \
+    asColumnar
+from shico.metrics import metrics
+from shico.server.utils import initApp, normalizeTerms, warmTrackIndex
+from shico.server.trackindex import trackTerms, stopCriteria
+from shico.server.validations import validYesNo
+from shico.server.compute import ComputeTimeout, ComputeQueueFull
+from shico.server.encoding import encodeJSON, compress, encodings
 
 
 app = Flask(__name__)
 CORS(app)
 
+# Header asking for a /track request to be profiled
+_profileHeader = 'X-Shico-Profile'
+# Media type of /track responses in the columnar format
+_columnarMimetype = 'application/vnd.shico.columnar+json'
+
 
 @app.route('/load-settings')
 def appData():
@@ -44,44 +94,198 @@ def appData():
     return jsonify(years=years, cleaning=canClean)
 
 
+@app.route('/status')
+def status():
+    '''Report the state of the pool computing /track requests: number of
+    computations queued and running, and requests waiting for them. Also
+    reports the size of the index of precomputed results (if any).'''
+    trackIndex = app.config['trackIndex']
+    return jsonify(compute=app.config['computePool'].status(),
+                   trackIndex=trackIndex.status()
+                   if trackIndex is not None else None)
+
+
+@app.route('/metrics')
+def appMetrics():
+    '''Serve recorded timings and counters in the Prometheus text format.
+    Only available if metrics are enabled. Timings and counters are the totals
+    of all processes sharing them (e.g. the gunicorn workers, see
+    gunicorn_config.py), and otherwise those of the serving process. Gauges
+    are always those of the serving process.'''
+    if not metrics.enabled:
+        return Response('Metrics are not enabled\n', status=404,
+                        mimetype='text/plain')
+    computeStatus = app.config['computePool'].status()
+    computeGauges = [('compute_' + name, {}, value)
+                     for name, value in sorted(computeStatus.items())]
+    return Response(metrics.render(extraGauges=computeGauges),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/profiles')
+def profiles():
+    '''List the ids of stored profiles, newest first. Only available if
+    profiling is enabled.'''
+    profiler, error = _getProfiler()
+    if error is not None:
+        return error
+    return jsonify(profiles=profiler.listProfiles())
+
+
+@app.route('/profiles/<profileId>')
+def profile(profileId):
+    '''Serve a text summary of a stored profile, or the profile itself (in
+    cProfile format) if raw=Yes is given. Only available if profiling is
+    enabled.'''
+    profiler, error = _getProfiler()
+    if error is not None:
+        return error
+    if validYesNo(request.args.get('raw', 'No')):
+        path = profiler.profilePath(profileId)
+        if path is not None:
+            return send_file(path, mimetype='application/octet-stream',
+                             as_attachment=True,
+                             attachment_filename=profileId + '.prof')
+    else:
+        summary = profiler.summary(profileId)
+        if summary is not None:
+            return Response(summary, mimetype='text/plain')
+    return Response('No such profile\n', status=404, mimetype='text/plain')
+
+
 @app.route('/track/<terms>')
 def trackWord(terms):
     '''VocabularyMonitor.trackClouds service. Expects a list of terms to be
     sent to the Vocabulary monitor, and returns a JSON representation of the
-    response.'''
+    response.
+
+    The response is in the columnar format (see format.asColumnar) if
+    format=Columnar is given, or the Accept header prefers
+    application/vnd.shico.columnar+json.
+
+    Requests with a X-Shico-Profile header are profiled, if profiling is
+    enabled. The id of the stored profile is returned in the
+    X-Shico-Profile-Id header.'''
     params = app.config['trackParser'].parse_args()
-    termList = terms.split(',')
-    termList = [term.strip() for term in termList]
-    termList = [term.lower() for term in termList]
-    results, links = \
-        app.config['vm'].trackClouds(termList, maxTerms=params['maxTerms'],
-                                     maxRelatedTerms=params['maxRelatedTerms'],
-                                     startKey=params['startKey'],
-                                     endKey=params['endKey'],
-                                     minSim=params['minSim'],
-                                     wordBoost=params['wordBoost'],
-                                     forwards=params['forwards'],
-                                     sumSimilarity=params['boostMethod'],
-                                     algorithm=params['algorithm'],
-                                     cleaningFunction=app.config['cleaningFunction'] if params[
-            'doCleaning'] else None
-        )
+    # Removed from params, as it does not change what is computed
+    columnar = params.pop('format') == 'columnar' or \
+        request.accept_mimetypes.best_match(
+            ['application/json', _columnarMimetype]) == _columnarMimetype
+    termList = normalizeTerms(terms)
+    profileToken = request.headers.get(_profileHeader)
+    profiler = app.config['profiler']
+    doProfile = profileToken is not None and profiler is not None
+    if doProfile and not profiler.isAllowed(profileToken):
+        response = jsonify(error='Profiling not allowed')
+        response.status_code = 403
+        return response
+
+    # Identical requests already being computed share the same result, but
+    # profiled requests are always computed on their own.
+    key = (tuple(termList), tuple(sorted(params.items())))
+    pipelineArgs = (app.config['vm'], app.config['cleaningFunction'],
+                    termList, params, app.config['trackIndex'])
+    try:
+        if doProfile:
+            profileId, response = app.config['computePool'].run(
+                object(), app.config['computeTimeout'], profiler.run,
+                _trackPipeline, *pipelineArgs)
+        else:
+            response = app.config['computePool'].run(
+                key, app.config['computeTimeout'], _trackPipeline,
+                *pipelineArgs)
+    except (ComputeTimeout, ComputeQueueFull) as e:
+        response = jsonify(error=str(e))
+        response.status_code = 503
+        return response
+    if columnar:
+        response = _jsonResponse(asColumnar(response),
+                                 mimetype=_columnarMimetype)
+    else:
+        response = _jsonResponse(response)
+    if doProfile:
+        response.headers[_profileHeader + '-Id'] = profileId
+    # Values recorded for this request are shared with other processes now,
+    # not when this process records something again
+    metrics.save()
+    return response
+
+
+def _getProfiler():
+    '''Return the profiler, if profiling is enabled and the request presents
+    a valid token. Otherwise, return an error response.'''
+    profiler = app.config['profiler']
+    if profiler is None:
+        return None, Response('Profiling is not enabled\n', status=404,
+                              mimetype='text/plain')
+    if not profiler.isAllowed(request.headers.get(_profileHeader)):
+        return None, Response('Profiling not allowed\n', status=403,
+                              mimetype='text/plain')
+    return profiler, None
+
+
+def _jsonResponse(data, mimetype='application/json', minCompressSize=1024):
+    '''Build a response with data encoded as compact JSON, compressed if the
+    client accepts it (and the response is at least minCompressSize
+    bytes).'''
+    body = encodeJSON(data)
+    encoding = request.accept_encodings.best_match(encodings)
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if encoding is not None and len(body) >= minCompressSize:
+        with metrics.timer('stage', stage='compress'):
+            body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def _trackPipeline(vm, cleaningFunction, termList, params, trackIndex=None):
+    '''Track the given terms (unless they are in trackIndex), aggregate
+    results and build networks and embeddings. Returns a dictionary with the
+    content of the /track response (including the time spent on each step,
+    if requested).'''
+    if params['timings']:
+        with metrics.requestTimings() as timings:
+            response = _trackPipeline(vm, cleaningFunction, termList,
+                                      dict(params, timings=False), trackIndex)
+        response['timings'] = timings
+        return response
+
+    # Precomputed results of popular concepts are taken from the index
+    cached = trackIndex.get(termList, params) \
+        if trackIndex is not None else None
+    if cached is not None:
+        results, links = cached
+    else:
+        with metrics.timer('stage', stage='trackClouds'):
+            results, links = trackTerms(vm, cleaningFunction, termList,
+                                        params)
     agg = VocabularyAggregator(weighF=params['aggWeighFunction'],
                                wfParam=params['aggWFParam'],
                                yearsInInterval=params['aggYearsInInterval'],
                                nWordsPerYear=params['aggWordsPerYear']
                                )
 
-    aggResults, aggMetadata = agg.aggregate(results)
-    print "ResKeys", results.keys()
-    print "AggResKeys", aggResults.keys()
+    with metrics.timer('stage', stage='aggregate'):
+        aggResults, aggMetadata = agg.aggregate(results)
     stream = yearTuplesAsDict(aggResults)
-    networks = yearlyNetwork(aggMetadata, aggResults, results, links)
-    embedded = doSpaceEmbedding(app.config['vm'], results, aggMetadata)
-    return jsonify(stream=stream,
-                   networks=networks,
-                   embedded=embedded,
-                   vocabs=links)
+    with metrics.timer('stage', stage='yearlyNetwork'):
+        networks = yearlyNetwork(aggMetadata, aggResults, results, links)
+    with metrics.timer('stage', stage='doSpaceEmbedding'):
+        embedded = doSpaceEmbedding(vm, results, aggMetadata)
+    response = dict(stream=stream,
+                    networks=networks,
+                    embedded=embedded,
+                    vocabs=links)
+    criteria = stopCriteria(params)
+    if criteria is not None:
+        # Also found for results from the index, which end at the same period
+        trackedKeys = vm.getTrackedYears(params['startKey'], params['endKey'],
+                                         params['forwards'])
+        lastKey = trackedKeys[-1] if len(trackedKeys) > 0 else None
+        response['stopped'] = criteria.whereStopped(termList, results, links,
+                                                    params['forwards'],
+                                                    lastKey)
+    return response
 
 
 if __name__ == "__main__":
@@ -91,11 +295,44 @@ if __name__ == "__main__":
     useMmap = arguments['--use-mmap']
     w2vFormat = arguments['--w2v-format']
     cleaningFunctionStr = arguments['-c']
+    align = arguments['--align']
+    maxAnchors = int(arguments['--max-anchors'])
+    computeWorkers = int(arguments['-w'])
+    computeTimeout = arguments['-t']
+    computeTimeout = float(computeTimeout) if computeTimeout else None
+    enableMetrics = arguments['--metrics']
+    profileDir = arguments['--profile-dir']
+    profileToken = arguments['--profile-token']
+    trackIndexPath = arguments['--track-index']
+    trackIndexConcepts = arguments['--index-concepts']
+    trackIndexPresets = arguments['--index-presets']
+    useNeighbours = arguments['--neighbours']
+    similarityBlockSize = arguments['--block-size']
+    similarityBlockSize = int(similarityBlockSize) \
+        if similarityBlockSize else None
+    periodWorkers = arguments['--period-workers']
+    periodWorkers = int(periodWorkers) if periodWorkers else None
+    prefetchPeriods = arguments['--prefetch']
+    prefetchPeriods = int(prefetchPeriods) if prefetchPeriods else None
+    useVariants = arguments['--variants']
     port = int(arguments['-p'])
 
     with app.app_context():
         initApp(current_app, files, binary, useMmap,
-                w2vFormat, cleaningFunctionStr)
+                w2vFormat, cleaningFunctionStr, align=align,
+                maxAnchors=maxAnchors,
+                computeWorkers=computeWorkers, computeTimeout=computeTimeout,
+                enableMetrics=enableMetrics, profileDir=profileDir,
+                profileToken=profileToken, trackIndexPath=trackIndexPath,
+                trackIndexConcepts=trackIndexConcepts,
+                trackIndexPresets=trackIndexPresets,
+                useNeighbours=useNeighbours,
+                similarityBlockSize=similarityBlockSize,
+                periodWorkers=periodWorkers,
+                prefetchPeriods=prefetchPeriods,
+                useVariants=useVariants)
+        warmTrackIndex(current_app)
 
     app.debug = arguments['-d']
-    app.run(host='0.0.0.0')
+    # Threaded, so cheap requests are served while /track requests compute
+    app.run(host='0.0.0.0', threaded=True)
@@ -0,0 +1,112 @@
+'''Bounded pool for running CPU heavy requests outside of the request
+threads, so cheap requests are not held up behind them.'''
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class ComputeTimeout(Exception):
+    '''Raised when a computation does not finish in time.'''
+    pass
+
+
+class ComputeQueueFull(Exception):
+    '''Raised when too many computations are already waiting.'''
+    pass
+
+
+class ComputePool():
+
+    '''Runs functions on a bounded pool of threads. A request identified by the
+    same key as a request which is already queued or running does not start a
+    new computation but waits for the result of the existing one.
+
+    maxWorkers  Maximum number of computations running at the same time.
+    maxQueued   Maximum number of computations waiting for a free worker
+                (None for no limit).
+    '''
+
+    def __init__(self, maxWorkers=2, maxQueued=None):
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self._maxQueued = maxQueued
+        # Re-entrant, as future callbacks may run while the lock is held
+        self._lock = threading.RLock()
+        self._inFlight = {}
+        self._waiters = {}
+        self._queued = 0
+        self._running = 0
+        self._requests = 0
+        self._coalesced = 0
+
+    def run(self, key, timeout, fn, *args, **kwargs):
+        '''Run fn(*args, **kwargs) on the pool, and return its result. If a
+        computation for the same key is already in flight, wait for its result
+        instead. Raises ComputeTimeout if the result is not ready after timeout
+        seconds (None waits forever); the computation is then cancelled if it
+        has not started yet and nobody else is waiting for it.'''
+        future = self._submit(key, fn, args, kwargs)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            raise ComputeTimeout('Computation did not finish in %s seconds'
+                                 % timeout)
+        finally:
+            self._release(key, future)
+
+    def status(self):
+        '''Return a dictionary with the number of queued and running
+        computations, and the number of requests waiting for them. Also
+        includes the total number of requests received, and how many of them
+        were coalesced with a computation already in flight.'''
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'running': self._running,
+                'waiting': sum(self._waiters.values()),
+                'requests': self._requests,
+                'coalesced': self._coalesced
+            }
+
+    def _submit(self, key, fn, args, kwargs):
+        with self._lock:
+            self._requests += 1
+            future = self._inFlight.get(key)
+            if future is not None:
+                self._coalesced += 1
+            else:
+                if self._maxQueued is not None and \
+                        self._queued >= self._maxQueued:
+                    raise ComputeQueueFull('Too many requests queued')
+                self._queued += 1
+                future = self._executor.submit(self._call, fn, args, kwargs)
+                self._inFlight[key] = future
+                self._waiters[key] = 0
+                future.add_done_callback(
+                    lambda f: self._finished(key, f))
+            self._waiters[key] += 1
+            return future
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _finished(self, key, future):
+        with self._lock:
+            if future.cancelled():
+                self._queued -= 1
+            if self._inFlight.get(key) is future:
+                del self._inFlight[key]
+                del self._waiters[key]
+
+    def _release(self, key, future):
+        with self._lock:
+            if self._inFlight.get(key) is not future:
+                return
+            self._waiters[key] -= 1
+            if self._waiters[key] == 0:
+                future.cancel()
@@ -3,4 +3,19 @@ binary = True
 useMmap = False
 w2vFormat = True
 cleaningFunctionStr = 'shico.extras.cleanTermList'
-
+align = False
+maxAnchors = 10000
+computeWorkers = 2
+computeTimeout = None
+computeMaxQueued = None
+enableMetrics = False
+profileDir = None
+profileToken = None
+trackIndexPath = None
+trackIndexConcepts = None
+trackIndexPresets = None
+useNeighbours = False
+similarityBlockSize = None
+periodWorkers = None
+prefetchPeriods = None
+useVariants = False
@@ -3,3 +3,19 @@ binary = True
 useMmap = True
 w2vFormat = False
 cleaningFunctionStr = '<python.module.function>'
+align = False
+maxAnchors = 10000
+computeWorkers = 2
+computeTimeout = None
+computeMaxQueued = None
+enableMetrics = False
+profileDir = None
+profileToken = None
+trackIndexPath = None
+trackIndexConcepts = None
+trackIndexPresets = None
+useNeighbours = False
+similarityBlockSize = None
+periodWorkers = None
+prefetchPeriods = None
+useVariants = False
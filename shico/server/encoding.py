@@ -0,0 +1,48 @@
+'''Encoding of large responses.
+
+Responses are encoded as compact JSON (without indentation), using ujson if
+it is installed, and compressed with gzip or deflate when the client accepts
+it.
+'''
+import json
+import zlib
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Encodings supported by compress, in order of preference
+encodings = ['gzip', 'deflate']
+
+
+def encodeJSON(data):
+    '''Encode data as compact JSON.'''
+    if ujson is not None:
+        try:
+            return ujson.dumps(data, double_precision=15)
+        except (TypeError, OverflowError):
+            # Objects ujson cannot handle (e.g. NumPy arrays)
+            pass
+    return json.dumps(data, separators=(',', ':'), default=_toBuiltin)
+
+
+def compress(body, encoding, level=1):
+    '''Compress body with the given encoding ('gzip' or 'deflate'). The
+    lowest compression level is used by default, as higher levels take
+    several times longer for little gain on JSON.'''
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+    else:
+        raise ValueError('Unsupported encoding: ' + str(encoding))
+    return compressor.compress(body) + compressor.flush()
+
+
+def _toBuiltin(obj):
+    '''Convert NumPy scalars and arrays to their Python equivalent.'''
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(repr(obj) + ' is not JSON serializable')
@@ -0,0 +1,63 @@
+''' Gunicorn settings for serving ShiCo with models shared by all workers.
+RUN:
+$ gunicorn -c shico/server/gunicorn_config.py shico.server.wsgi:app
+
+Models are loaded once, in the master process, before workers are forked
+(preload_app). Workers then share the memory holding the model vectors
+instead of loading their own copy. Memory mapped models (useMmap = True in
+config.py, with models saved by shico.build) are shared through the page cache
+and are never copied. Check memory use per worker with:
+$ python -m shico.server.memory <master pid>
+
+No threads are started in the master, as workers forked while they hold a
+lock would inherit it held. The index of precomputed results (if any) is
+therefore warmed by the first worker, and picked up by the others when it is
+saved.
+
+Workers share their timers and counters through a temporary directory, so
+/metrics reports the totals of all workers whichever worker serves it.
+'''
+import gc
+import os
+import shutil
+import tempfile
+
+bind = '0.0.0.0:8000'
+timeout = 1200
+workers = 4
+# Threads per worker, so cheap requests are served while /track is computing
+threads = 4
+preload_app = True
+
+# Full garbage collections touch every object loaded by the master (e.g. model
+# vocabularies), which copies the memory pages holding them into every worker.
+# Make them much less frequent in workers.
+gcThresholds = (700, 10, 1000)
+
+# Directory where workers share their metrics (one per master process)
+metricsDir = os.path.join(tempfile.gettempdir(),
+                          'shico-metrics-%d' % os.getpid())
+
+
+def pre_fork(server, worker):
+    from shico.metrics import metrics
+    # Values recorded by the master (e.g. model loading) are saved once, by
+    # the master
+    metrics.shareAcross(metricsDir)
+    metrics.save()
+
+
+def post_fork(server, worker):
+    from shico.metrics import metrics
+    gc.set_threshold(*gcThresholds)
+    # Forget the values inherited from the master
+    metrics.reset()
+
+
+def post_worker_init(worker):
+    from shico.server.utils import warmTrackIndex
+    warmTrackIndex(worker.wsgi)
+
+
+def on_exit(server):
+    shutil.rmtree(metricsDir, ignore_errors=True)
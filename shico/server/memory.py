@@ -0,0 +1,76 @@
+'''Report memory use of a ShiCo server and its (gunicorn) workers.
+
+RSS counts all memory pages a process uses, including pages shared with other
+processes. PSS divides each shared page by the number of processes sharing
+it, so summing the PSS of the master and all workers gives the total memory
+used by the server.
+
+Usage:
+  memory.py PID
+
+  PID    Process id of the server (gunicorn master).
+'''
+import os
+
+
+def processMemory(pid):
+    '''Return a dictionary with the rss, pss, shared and private memory (in kB)
+    of the process with the given pid. Values are read from
+    /proc/<pid>/smaps (Linux only).'''
+    fields = {
+        'Rss': 'rss',
+        'Pss': 'pss',
+        'Shared_Clean': 'shared',
+        'Shared_Dirty': 'shared',
+        'Private_Clean': 'private',
+        'Private_Dirty': 'private'
+    }
+    memory = {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    with open('/proc/%d/smaps' % pid, 'r') as fin:
+        for line in fin:
+            parts = line.split()
+            key = parts[0].rstrip(':')
+            if key in fields and len(parts) == 3:
+                memory[fields[key]] += int(parts[1])
+    return memory
+
+
+def childProcesses(pid):
+    '''Return the list of pids of the child processes of the given pid.'''
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry, 'r') as fin:
+                stat = fin.read()
+        except IOError:
+            continue
+        # Skip process name (which may contain spaces) to find parent pid
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def serverMemory(pid):
+    '''Return a list of (role, pid, memory) for the given server process and
+    its workers.'''
+    processes = [('master', pid, processMemory(pid))]
+    for child in childProcesses(pid):
+        processes.append(('worker', child, processMemory(child)))
+    return processes
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+    processes = serverMemory(int(arguments['PID']))
+    print '%-8s %8s %12s %12s %12s %12s' % \
+        ('role', 'pid', 'rss (kB)', 'pss (kB)', 'shared (kB)', 'private (kB)')
+    for role, pid, memory in processes:
+        print '%-8s %8d %12d %12d %12d %12d' % \
+            (role, pid, memory['rss'], memory['pss'], memory['shared'],
+             memory['private'])
+    print 'Total PSS: %d kB' % sum(m['pss'] for _, _, m in processes)
@@ -0,0 +1,96 @@
+'''Profiling of individual requests.
+
+A request is profiled with cProfile when it asks for it (see app.trackWord),
+and profiling has been enabled by giving the server a directory where
+profiles are stored. Stored profiles can be read with pstats or tools such as
+snakeviz, or summarized by Profiler.summary.
+
+Most of the work of a request is done by other threads than the one running
+it (e.g. most_similar queries of each seed, and periods tracked on
+VocabularyMonitor's pool). These threads profile themselves while working for
+a profiled request (see metrics.shareProfile), and their statistics are
+merged into the stored profile.
+'''
+import os
+import pstats
+import re
+import uuid
+from datetime import datetime
+from StringIO import StringIO
+
+from shico.metrics import metrics
+
+_profileIdRe = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[0-9a-f]{4}$')
+
+
+class Profiler():
+
+    '''Runs functions under cProfile and stores the resulting profiles.
+
+    profileDir   Directory where profiles are stored.
+    token        Secret which requests must present to be profiled, and to
+                 read profiles. If it is None, no request is allowed.
+    maxProfiles  Maximum number of profiles kept; older ones are deleted.
+    '''
+
+    def __init__(self, profileDir, token=None, maxProfiles=50):
+        self._profileDir = profileDir
+        self._token = token
+        self._maxProfiles = maxProfiles
+        if not os.path.exists(profileDir):
+            os.makedirs(profileDir)
+
+    def isAllowed(self, token):
+        '''Check whether the given token allows profiling.'''
+        return self._token is not None and token == self._token
+
+    def run(self, fn, *args, **kwargs):
+        '''Run fn(*args, **kwargs) under the profiler. Returns a tuple with the
+        id of the stored profile and the result of fn. The profile includes
+        threads working on behalf of fn.'''
+        with metrics.requestProfile() as profile:
+            result = fn(*args, **kwargs)
+        # Sortable by time, and unique across processes
+        profileId = datetime.now().strftime('%Y%m%d-%H%M%S-%f-') + \
+            uuid.uuid4().hex[:4]
+        profile.stats().dump_stats(self._path(profileId))
+        self._prune()
+        return profileId, result
+
+    def listProfiles(self):
+        '''List ids of stored profiles, newest first.'''
+        profileIds = [os.path.splitext(f)[0]
+                      for f in os.listdir(self._profileDir)
+                      if f.endswith('.prof')]
+        return sorted([p for p in profileIds if _profileIdRe.match(p)],
+                      reverse=True)
+
+    def profilePath(self, profileId):
+        '''Path of the given profile, or None if there is no such profile.'''
+        if not _profileIdRe.match(profileId):
+            return None
+        path = self._path(profileId)
+        return path if os.path.exists(path) else None
+
+    def summary(self, profileId, limit=50, sortBy='cumulative'):
+        '''Return a text summary of the given profile (the limit functions
+        with the highest cumulative time), or None if there is no such
+        profile.'''
+        path = self.profilePath(profileId)
+        if path is None:
+            return None
+        out = StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.sort_stats(sortBy).print_stats(limit)
+        return out.getvalue()
+
+    def _path(self, profileId):
+        return os.path.join(self._profileDir, profileId + '.prof')
+
+    def _prune(self):
+        for profileId in self.listProfiles()[self._maxProfiles:]:
+            try:
+                os.remove(self._path(profileId))
+            except OSError:
+                # Already removed by another process
+                pass
@@ -0,0 +1,376 @@
+'''Index of precomputed trackClouds results for popular concepts.
+
+The index is built offline for a list of concepts (one comma separated list
+of seed terms per line) and a list of parameter presets (a JSON list of
+/track parameters; parameters which are not given take their default value).
+The server answers /track requests from the index when it can, and tracks the
+terms itself otherwise.
+
+The index records which models it was built from. An index built from other
+models (e.g. before the models were updated) is not used, but can be rebuilt
+by the server in the background (see TrackIndex.warm). Servers sharing an
+index file rebuild it once, in one of their worker processes.
+
+Usage:
+  trackindex.py [-f FILES] [-n] [--w2v-format] [-c FUNCTIONNAME] [-p PRESETS]
+                [--neighbours] [--variants] CONCEPTS INDEX
+
+  -f FILES         Path to word2vec model files (glob format is supported)
+                   [default: word2vecModels/????_????.w2v]
+  -n,--non-binary  w2v files are NOT binary.
+  --w2v-format     Models are in word2vec format (not gensim's own format).
+  -c FUNCTIONNAME  Name of cleaning function used when doCleaning is given.
+  -p PRESETS       JSON file with a list of parameter presets (default is a
+                   single preset with the default parameters).
+  --neighbours     Use neighbours precomputed by shico/neighbours.py (as the
+                   server does with --neighbours).
+  --variants       Clean with spelling variants precomputed by
+                   shico/variants.py (as the server does with --variants).
+'''
+import fcntl
+import gzip
+import json
+import os
+import threading
+import time
+from sortedcontainers import SortedDict
+
+from shico.metrics import metrics
+from shico.vocabularymonitor import StopCriteria
+from shico.variants import variantsPath
+from shico.neighbours import neighboursPaths
+
+# /track parameters which determine the result of trackClouds
+_trackParams = ('maxTerms', 'maxRelatedTerms', 'startKey', 'endKey', 'minSim',
+                'wordBoost', 'forwards', 'boostMethod', 'algorithm',
+                'doCleaning', 'fillCleaned', 'minOverlap', 'minAvgSim',
+                'maxDrift')
+
+
+def trackTerms(vm, cleaningFunction, termList, params):
+    '''Run vm.trackClouds for the given terms with the given /track
+    parameters. Returns the terms and links found.'''
+    return vm.trackClouds(termList, maxTerms=params['maxTerms'],
+                          maxRelatedTerms=params['maxRelatedTerms'],
+                          startKey=params['startKey'],
+                          endKey=params['endKey'],
+                          minSim=params['minSim'],
+                          wordBoost=params['wordBoost'],
+                          forwards=params['forwards'],
+                          sumSimilarity=params['boostMethod'],
+                          algorithm=params['algorithm'],
+                          cleaningFunction=cleaningFunction if params[
+                              'doCleaning'] else None,
+                          fillCleaned=params['fillCleaned'],
+                          stopCriteria=stopCriteria(params)
+                          )
+
+
+def stopCriteria(params):
+    '''StopCriteria given by the /track parameters, or None if there are
+    none.'''
+    rules = {name: params[name]
+             for name in ('minOverlap', 'minAvgSim', 'maxDrift')
+             if params[name] is not None}
+    return StopCriteria(**rules) if len(rules) > 0 else None
+
+
+def indexKey(termList, params):
+    '''Key of the given (normalized) terms and /track parameters in the
+    index.'''
+    # Parameters missing from older indexes do not match any request
+    return (tuple(termList),
+            tuple((name, params.get(name)) for name in _trackParams))
+
+
+def modelSignature(vm):
+    '''Describe the models of the given VocabularyMonitor by the names, sizes
+    and modification times of their files. Models answering queries from
+    precomputed neighbours, or cleaned with precomputed spelling variants,
+    are also described by these files, as results then differ.'''
+    signature = []
+    for key in vm.getAvailableYears():
+        modelFile = vm.getModelFile(key)
+        stat = os.stat(modelFile)
+        entry = [key, os.path.basename(modelFile), stat.st_size,
+                 int(stat.st_mtime)]
+        extraFiles = []
+        if vm.hasNeighbours(key):
+            extraFiles.extend(neighboursPaths(modelFile))
+        if vm.hasVariants(key):
+            extraFiles.append(variantsPath(modelFile))
+        for extraFile in extraFiles:
+            stat = os.stat(extraFile)
+            entry += [os.path.basename(extraFile), stat.st_size,
+                      int(stat.st_mtime)]
+        signature.append(entry)
+    return signature
+
+
+def loadConcepts(path, normalize):
+    '''Read concepts (lists of seed terms) from the given file, one comma
+    separated list per line. Terms are normalized with the given
+    function.'''
+    concepts = []
+    with open(path) as fin:
+        for line in fin:
+            termList = normalize(line)
+            if len(termList) > 0:
+                concepts.append(termList)
+    return concepts
+
+
+def loadPresets(path, parser):
+    '''Read parameter presets from the given JSON file, and validate them with
+    the given /track parameter parser. If path is None, a single preset with
+    the default parameters is returned.'''
+    presets = [{}]
+    if path is not None:
+        with open(path) as fin:
+            presets = json.load(fin)
+    return [_parsePreset(preset, parser) for preset in presets]
+
+
+def _parsePreset(preset, parser):
+    params = {}
+    for arg in parser.args:
+        value = preset.get(arg.name)
+        params[arg.name] = arg.type(value) if value is not None \
+            else arg.default
+    return params
+
+
+class TrackIndex():
+
+    '''Precomputed trackClouds results, keyed by terms and parameters.
+
+    signature  Signature of the models the results are computed on (see
+               modelSignature).
+    cleaning   Name of the cleaning function used for presets with
+               doCleaning.
+    path       File where the index is saved. The index is reloaded when this
+               file changes, so processes sharing it pick up the results of
+               the one which warmed it.
+    checkInterval
+               Minimum number of seconds between lookups checking whether the
+               index file has changed.
+    '''
+
+    def __init__(self, signature=None, cleaning=None, path=None,
+                 checkInterval=10.0):
+        self.signature = signature
+        self.cleaning = cleaning
+        self._path = path
+        self._checkInterval = checkInterval
+        self._checked = None
+        self._mtime = None
+        self._current = False
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reloadLock = threading.Lock()
+        self._warming = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, termList, params):
+        '''Return the terms and links of the given terms and parameters, or
+        None if they are not in the index.'''
+        if self._path is not None and (
+                self._checked is None or
+                time.time() - self._checked >= self._checkInterval):
+            # Lookups do not wait for a reload by another thread, and use the
+            # current entries meanwhile
+            if self._reloadLock.acquire(False):
+                try:
+                    self._reload()
+                finally:
+                    self._reloadLock.release()
+        entry = self._entries.get(indexKey(termList, params))
+        metrics.increment('track_index_lookups',
+                          result='miss' if entry is None else 'hit')
+        return entry
+
+    def add(self, termList, params, results, links):
+        '''Add the terms and links found for the given terms and
+        parameters.'''
+        self._entries[indexKey(termList, params)] = (results, links)
+
+    def build(self, vm, cleaningFunction, concepts, presets):
+        '''Track every concept with every preset, and add the results to the
+        index.'''
+        for termList in concepts:
+            for params in presets:
+                results, links = trackTerms(vm, cleaningFunction, termList,
+                                            params)
+                self.add(termList, params, results, links)
+
+    def warm(self, vm, cleaningFunction, concepts, presets):
+        '''Rebuild the index in a background thread, unless the index file is
+        up to date. The current entries are replaced when the new index is
+        complete, and the index is then saved (if it has a path).
+
+        As it starts a thread, this must not be called in a process which
+        forks afterwards (e.g. the gunicorn master with preload_app). When
+        several processes share the index file, only the first one to call
+        warm rebuilds it (the others pick up the result by reloading).
+        Returns the thread, or None if the index is not rebuilt by this
+        call.'''
+        with self._lock:
+            if self.isWarming():
+                return self._warming
+            lockFile = self._lockFile()
+            if lockFile is False:
+                # Being rebuilt by another process
+                return None
+        # Checked once this process holds the lock, as another process may
+        # have rebuilt the index meanwhile
+        self.reload()
+        if self.isCurrent():
+            if lockFile is not None:
+                lockFile.close()
+            return None
+
+        def rebuild():
+            try:
+                index = TrackIndex(self.signature, self.cleaning, self._path)
+                index.build(vm, cleaningFunction, concepts, presets)
+                if self._path is not None:
+                    index.save()
+                with self._lock:
+                    self._entries = index._entries
+                    self._mtime = index._mtime
+                    self._current = True
+            finally:
+                with self._lock:
+                    self._warming = None
+                if lockFile is not None:
+                    lockFile.close()
+
+        with self._lock:
+            self._warming = threading.Thread(target=rebuild,
+                                             name='track-index-warm')
+            self._warming.daemon = True
+            self._warming.start()
+            return self._warming
+
+    def reload(self):
+        '''Load the entries saved in the index file, if it has changed and
+        was built on the same models and cleaning function. Returns whether
+        entries were loaded.'''
+        if self._path is None:
+            return False
+        with self._reloadLock:
+            return self._reload()
+
+    def _reload(self):
+        self._checked = time.time()
+        try:
+            mtime = os.path.getmtime(self._path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        # Loaded without holding the lock, which is only taken to swap in
+        # the new entries
+        saved = TrackIndex.load(self._path)
+        current = saved.signature == self.signature and \
+            saved.cleaning == self.cleaning
+        with self._lock:
+            self._mtime = mtime
+            if not current:
+                return False
+            self._entries = saved._entries
+            self._current = True
+            return True
+
+    def isCurrent(self):
+        '''Check whether the entries are those of an index built on the same
+        models and cleaning function (loaded from the index file, or
+        warmed).'''
+        return self._current
+
+    def _lockFile(self):
+        '''Take the lock of the index file, held while the index is warmed.
+        Returns the open lock file, False if the lock is held by another
+        process, or None if the index has no file.'''
+        if self._path is None:
+            return None
+        lockFile = open(self._path + '.lock', 'a')
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lockFile.close()
+            return False
+        return lockFile
+
+    def isWarming(self):
+        '''Check whether the index is being rebuilt (by this process).'''
+        # Threads do not survive a fork, so forked processes are not warming
+        return self._warming is not None and self._warming.is_alive()
+
+    def status(self):
+        '''Return a dictionary with the number of entries in the index, and
+        whether it is being warmed.'''
+        return {
+            'entries': len(self._entries),
+            'warming': self.isWarming()
+        }
+
+    def save(self):
+        '''Save the index to its (gzipped JSON) file.'''
+        data = {
+            'signature': self.signature,
+            'cleaning': self.cleaning,
+            'entries': [[list(termList), dict(params), results, links]
+                        for (termList, params), (results, links)
+                        in self._entries.iteritems()]
+        }
+        # Written next to the index first, so readers never see a partial file
+        tmpPath = self._path + '.tmp'
+        with gzip.open(tmpPath, 'wb') as fout:
+            json.dump(data, fout, separators=(',', ':'))
+        os.rename(tmpPath, self._path)
+        self._mtime = os.path.getmtime(self._path)
+
+    @classmethod
+    def load(cls, path):
+        '''Load an index saved with save.'''
+        with gzip.open(path, 'rb') as fin:
+            data = json.load(fin)
+        index = cls(data['signature'], data['cleaning'], path)
+        for termList, params, results, links in data['entries']:
+            results = SortedDict(
+                (key, [tuple(pair) for pair in terms])
+                for key, terms in results.iteritems())
+            links = SortedDict(
+                (key, {seed: [tuple(pair) for pair in related]
+                       for seed, related in seedLinks.iteritems()})
+                for key, seedLinks in links.iteritems())
+            index.add(termList, params, results, links)
+        index._mtime = os.path.getmtime(path)
+        return index
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+    from shico.vocabularymonitor import VocabularyMonitor
+    from shico.server.utils import initParamParser, normalizeTerms, \
+        _getCallableFunction
+
+    arguments = docopt(__doc__)
+    vm = VocabularyMonitor(arguments['-f'],
+                           binary=not arguments['--non-binary'],
+                           useCache=True, useMmap=False,
+                           w2vFormat=arguments['--w2v-format'],
+                           initSims=True,
+                           useNeighbours=arguments['--neighbours'],
+                           useVariants=arguments['--variants'])
+    cleaning = arguments['-c']
+    concepts = loadConcepts(arguments['CONCEPTS'], normalizeTerms)
+    presets = loadPresets(arguments['-p'], initParamParser())
+
+    index = TrackIndex(modelSignature(vm), cleaning, arguments['INDEX'])
+    index.build(vm, _getCallableFunction(cleaning), concepts, presets)
+    index.save()
+    print 'Indexed %d concepts with %d presets' % (len(concepts), len(presets))
@@ -1,7 +1,12 @@
 from flask_restful import reqparse
-from shico.server.validations import validatestr, validAlgorithm, validWeighting, validDirection, sumSimilarity, validCleaning
+from shico.server.validations import validatestr, validAlgorithm, validWeighting, validDirection, sumSimilarity, validCleaning, validYesNo, validFormat
 
 from shico.vocabularymonitor import VocabularyMonitor
+from shico.server.compute import ComputePool
+from shico.server.profiling import Profiler
+from shico.server.trackindex import TrackIndex, modelSignature, loadConcepts, \
+    loadPresets
+from shico.metrics import metrics
 
 
 def initParamParser():
@@ -18,6 +23,10 @@ def initParamParser():
     trackParser.add_argument(
         'algorithm', type=validAlgorithm, default='adaptive')
     trackParser.add_argument('doCleaning', type=validCleaning, default=False)
+    trackParser.add_argument('fillCleaned', type=validYesNo, default=False)
+    trackParser.add_argument('minOverlap', type=float, default=None)
+    trackParser.add_argument('minAvgSim', type=float, default=None)
+    trackParser.add_argument('maxDrift', type=float, default=None)
 
     # VocabularyAggregator parameters:
     trackParser.add_argument('aggWeighFunction', type=validWeighting,
@@ -26,10 +35,20 @@ def initParamParser():
     trackParser.add_argument('aggYearsInInterval', type=int, default=5)
     trackParser.add_argument('aggWordsPerYear', type=int, default=10)
 
+    # Response parameters:
+    trackParser.add_argument('timings', type=validYesNo, default=False)
+    trackParser.add_argument('format', type=validFormat, default='default')
+
     return trackParser
 
 
-def initApp(app, files, binary, useMmap, w2vFormat, cleaningFunctionStr):
+def initApp(app, files, binary, useMmap, w2vFormat, cleaningFunctionStr,
+            align=False, computeWorkers=2, computeTimeout=None,
+            computeMaxQueued=None, enableMetrics=False, profileDir=None,
+            profileToken=None, trackIndexPath=None, trackIndexConcepts=None,
+            trackIndexPresets=None, useNeighbours=False,
+            similarityBlockSize=None, periodWorkers=None,
+            prefetchPeriods=None, useVariants=False, maxAnchors=10000):
     '''Initialize Flask app by loading VocabularyMonitor,
     tracker parameter parser and callable functions (if any).
 
@@ -38,16 +57,95 @@ def initApp(app, files, binary, useMmap, w2vFormat, cleaningFunctionStr):
     useMmap  ???
     w2vFormat ???
     cleaningFunctionStr   ???
+    align    Align vector spaces of consecutive models
+    maxAnchors         Maximum number of anchor words used to align models
+                       without saved alignments (None for all shared words)
+    computeWorkers     Number of /track requests computed at the same time
+    computeTimeout     Seconds after which a /track request gives up (None to
+                       wait until it is done)
+    computeMaxQueued   Maximum number of /track requests waiting to be computed
+                       (None for no limit)
+    enableMetrics      Record timings and counters (served on /metrics)
+    profileDir         Directory where profiles of /track requests are stored
+                       (None to disable profiling)
+    profileToken       Token requests must present to be profiled (None to
+                       profile no request)
+    trackIndexPath     Index of precomputed results (see trackindex.py)
+    trackIndexConcepts File listing concepts to be indexed. If given, the
+                       index can be rebuilt in the background when it is
+                       missing or was built on other models (see
+                       warmTrackIndex).
+    trackIndexPresets  File with parameter presets to be indexed
+    useNeighbours      Use neighbours precomputed by shico.neighbours
+    similarityBlockSize
+                       Scan vectors in blocks of this many words for
+                       similarity queries (None to use gensim's most_similar)
+    periodWorkers      Number of periods tracked at the same time by the
+                       non-adaptive algorithm (None for one at a time)
+    prefetchPeriods    Number of periods ahead queried speculatively by the
+                       adaptive algorithm (requires periodWorkers)
+    useVariants        Clean with spelling variants precomputed by
+                       shico.variants, where available
     '''
+    # Enabled before loading, so model loading is timed as well
+    metrics.enabled = enableMetrics
+
     # TODO: 'Add use cache on initApp'
+    # Scanning in blocks does not need normalized copies of the vectors
     vm = VocabularyMonitor(files, binary=binary,
-                           useMmap=useMmap, w2vFormat=w2vFormat)
+                           useMmap=useMmap, w2vFormat=w2vFormat, align=align,
+                           initSims=similarityBlockSize is None,
+                           useNeighbours=useNeighbours,
+                           similarityBlockSize=similarityBlockSize,
+                           periodWorkers=periodWorkers,
+                           prefetchPeriods=prefetchPeriods,
+                           useVariants=useVariants,
+                           maxAnchors=maxAnchors)
     cleaningFunction = _getCallableFunction(cleaningFunctionStr)
     trackParser = initParamParser()
 
     app.config['vm'] = vm
     app.config['cleaningFunction'] = cleaningFunction
     app.config['trackParser'] = trackParser
+    app.config['computePool'] = ComputePool(maxWorkers=computeWorkers,
+                                            maxQueued=computeMaxQueued)
+    app.config['computeTimeout'] = computeTimeout
+    app.config['profiler'] = Profiler(profileDir, profileToken) \
+        if profileDir is not None else None
+    app.config['trackIndex'] = None
+    app.config['trackIndexSources'] = None
+    if trackIndexPath is not None:
+        trackIndex = TrackIndex(modelSignature(vm), cleaningFunctionStr,
+                                trackIndexPath)
+        trackIndex.reload()
+        if trackIndexConcepts is not None:
+            concepts = loadConcepts(trackIndexConcepts, normalizeTerms)
+            presets = loadPresets(trackIndexPresets, trackParser)
+            app.config['trackIndexSources'] = (concepts, presets)
+        app.config['trackIndex'] = trackIndex
+
+
+def warmTrackIndex(app):
+    '''Rebuild the index of precomputed results in the background, if it is
+    missing or out of date and concepts to be indexed were given to initApp.
+    Called in the process serving requests, not in a gunicorn master which
+    forks workers afterwards (see TrackIndex.warm). Returns the warming
+    thread, or None.'''
+    trackIndex = app.config['trackIndex']
+    sources = app.config['trackIndexSources']
+    if trackIndex is None or sources is None or trackIndex.isCurrent():
+        return None
+    concepts, presets = sources
+    return trackIndex.warm(app.config['vm'], app.config['cleaningFunction'],
+                           concepts, presets)
+
+
+def normalizeTerms(terms):
+    '''Turn comma separated terms into a sorted list of unique, lower case
+    terms. Requests for the same terms (in any order or case) therefore
+    produce the same list, and can share one computation.'''
+    termList = [term.strip().lower() for term in terms.split(',')]
+    return sorted(set(term for term in termList if len(term) > 0))
 
 
 def _getCallableFunction(functionFullName):
@@ -4,6 +4,7 @@ _weighFuncs = ('Gaussian', 'Linear', 'JSD')
 _directions = ('Forward', 'Backward')
 _boostMethods = ('Sum similarity', 'Counts')
 _yesNo = ('Yes', 'No')
+_formats = ('Default', 'Columnar')
 
 
 def validatestr(value):
@@ -47,3 +48,13 @@ def sumSimilarity(value):
 
 def validCleaning(value):
     return _isValidOption(value, _yesNo) == 'Yes'
+
+
+def validYesNo(value):
+    '''Validate Yes / No option (true means Yes)'''
+    return _isValidOption(value, _yesNo) == 'Yes'
+
+
+def validFormat(value):
+    '''Validate response format -- in lower case'''
+    return _isValidOption(value, _formats).lower()
@@ -7,8 +7,39 @@ from shico.server.utils import initApp
 
 from flask import current_app
 
+import shico.server.config as config
 from shico.server.config import files, binary, useMmap, w2vFormat, cleaningFunctionStr
 
+# Optional settings
+align = getattr(config, 'align', False)
+maxAnchors = getattr(config, 'maxAnchors', 10000)
+computeWorkers = getattr(config, 'computeWorkers', 2)
+computeTimeout = getattr(config, 'computeTimeout', None)
+computeMaxQueued = getattr(config, 'computeMaxQueued', None)
+enableMetrics = getattr(config, 'enableMetrics', False)
+profileDir = getattr(config, 'profileDir', None)
+profileToken = getattr(config, 'profileToken', None)
+trackIndexPath = getattr(config, 'trackIndexPath', None)
+trackIndexConcepts = getattr(config, 'trackIndexConcepts', None)
+trackIndexPresets = getattr(config, 'trackIndexPresets', None)
+useNeighbours = getattr(config, 'useNeighbours', False)
+similarityBlockSize = getattr(config, 'similarityBlockSize', None)
+periodWorkers = getattr(config, 'periodWorkers', None)
+prefetchPeriods = getattr(config, 'prefetchPeriods', None)
+useVariants = getattr(config, 'useVariants', False)
+
 with app.app_context():
     initApp(current_app, files, binary, useMmap,
-            w2vFormat, cleaningFunctionStr)
+            w2vFormat, cleaningFunctionStr, align=align,
+            maxAnchors=maxAnchors,
+            computeWorkers=computeWorkers, computeTimeout=computeTimeout,
+            computeMaxQueued=computeMaxQueued, enableMetrics=enableMetrics,
+            profileDir=profileDir, profileToken=profileToken,
+            trackIndexPath=trackIndexPath,
+            trackIndexConcepts=trackIndexConcepts,
+            trackIndexPresets=trackIndexPresets,
+            useNeighbours=useNeighbours,
+            similarityBlockSize=similarityBlockSize,
+            periodWorkers=periodWorkers,
+            prefetchPeriods=prefetchPeriods,
+            useVariants=useVariants)
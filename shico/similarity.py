@@ -0,0 +1,77 @@
+'''Memory bounded similarity queries.
+
+gensim's most_similar multiplies the whole (normalized) vector matrix of a
+model with the query, allocating a vocabulary sized array for every query,
+and needs a normalized copy of the vectors. topSimilar instead scans the
+vectors in blocks of rows, keeping a running top N of every query, so the
+memory used by a query is bounded by the block size. Rows are normalized per
+block, so the vectors can be used as they are stored (e.g. memory mapped),
+and only the pages of the block being scanned need to be resident.
+'''
+import numpy as np
+
+
+def vectorNorms(vectors, blockSize=65536):
+    '''Calculate the norms of the rows of the given vectors, one block of
+    rows at a time. Zero norms are returned as 1.'''
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), blockSize):
+        block = vectors[start:start + blockSize]
+        norms[start:start + len(block)] = np.sqrt(
+            np.einsum('ij,ij->i', block, block))
+    norms[norms == 0] = 1
+    return norms
+
+
+def topSimilar(vectors, queries, topn, norms=None, exclude=None,
+               blockSize=65536):
+    '''Find the topn rows of vectors with the highest cosine similarity to
+    each of the given queries.
+
+    vectors    Matrix of word vectors (one row per word).
+    queries    Matrix of unit length query vectors (one row per query).
+    topn       Number of rows returned for each query.
+    norms      Norms of the rows of vectors (see vectorNorms), or None if the
+               rows are unit length already.
+    exclude    List with, for each query, the ids of rows which should not be
+               returned (e.g. the query word itself).
+    blockSize  Number of rows multiplied at once.
+
+    Returns matrices of row ids and similarities, one row per query, in order
+    of decreasing similarity. When fewer than topn rows can be returned, the
+    last columns have similarity -inf.
+    '''
+    queries = np.asarray(queries, dtype=vectors.dtype)
+    nQueries = len(queries)
+    rows = np.arange(nQueries)[:, np.newaxis]
+    bestIds = np.empty((nQueries, 0), dtype=np.int64)
+    bestSims = np.empty((nQueries, 0), dtype=vectors.dtype)
+
+    for start in range(0, len(vectors), blockSize):
+        block = vectors[start:start + blockSize]
+        sims = queries.dot(block.T)
+        if norms is not None:
+            sims /= norms[start:start + len(block)]
+        if exclude is not None:
+            for q, excluded in enumerate(exclude):
+                for i in excluded:
+                    if start <= i < start + len(block):
+                        sims[q, i - start] = -np.inf
+
+        # Keep the top of this block, and merge it into the running top
+        if sims.shape[1] > topn:
+            top = np.argpartition(-sims, topn - 1, axis=1)[:, :topn]
+            sims = sims[rows, top]
+            ids = top + start
+        else:
+            ids = np.repeat(np.arange(start, start + len(block))[np.newaxis],
+                            nQueries, axis=0)
+        bestIds = np.hstack([bestIds, ids])
+        bestSims = np.hstack([bestSims, sims])
+        if bestSims.shape[1] > topn:
+            top = np.argpartition(-bestSims, topn - 1, axis=1)[:, :topn]
+            bestIds = bestIds[rows, top]
+            bestSims = bestSims[rows, top]
+
+    order = np.argsort(-bestSims, axis=1, kind='mergesort')
+    return bestIds[rows, order], bestSims[rows, order]
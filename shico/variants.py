@@ -0,0 +1,142 @@
+'''Precompute spelling variants in the vocabulary of each model.
+
+OCR'd newspapers produce many spellings of the same word, which cleaning
+functions such as shico.extras.cleanTermList remove from every query. As the
+vocabulary of a model does not change, its spelling variants can be found
+once instead: two words are variants of each other if one is among the
+nearest neighbours of the other (with at least a minimum similarity), and
+their edit distance is small (as in cleanTermList). Variants are grouped
+transitively, and every word is mapped to the most frequent word of its group
+(its canonical form). The mapping is stored next to the model file, as the
+index of the canonical form of every word (int32, NAME.variants.npy).
+
+VocabularyMonitor(useVariants=True) then cleans the results of queries which
+ask for cleaning by keeping only the first word of every group, which is a
+lookup per word.
+
+Usage:
+  variants.py [-f FILES] [-n] [--w2v-format] [-k K] [-r ROWS] [-s MINSIM]
+              [-p PROCESSES]
+
+  -f FILES         Path to word2vec model files (glob format is supported)
+                   [default: word2vecModels/????_????.w2v]
+  -n,--non-binary  w2v files are NOT binary.
+  --w2v-format     Models are in word2vec format (not gensim's own format).
+  -k K             Number of neighbours of each word considered
+                   [default: 20].
+  -r ROWS          Number of (most frequent) words whose neighbours are
+                   considered (default: all words).
+  -s MINSIM        Minimum similarity of variants [default: 0.5].
+  -p PROCESSES     Number of parallel processes (default: number of CPUs).
+'''
+import os
+import editdistance
+import numpy as np
+
+from neighbours import topNeighbours
+
+
+def variantClusters(index2word, ids, sims, minSim=0.5, maxEditDiff=0.20):
+    '''Group words into spelling variants, given the ids and similarities of
+    the nearest neighbours of (the most frequent) words. Returns the index of
+    the canonical form of every word in index2word.'''
+    canonical = np.arange(len(index2word), dtype=np.int32)
+
+    def root(i):
+        while canonical[i] != i:
+            canonical[i] = canonical[canonical[i]]
+            i = canonical[i]
+        return i
+
+    for i in range(len(ids)):
+        word = index2word[i]
+        for j, sim in zip(ids[i].tolist(), sims[i].tolist()):
+            if sim < minSim:
+                break
+            other = index2word[j]
+            shortest = min(len(word), len(other))
+            if shortest > 0 and float(editdistance.eval(word, other)) / \
+                    shortest < maxEditDiff:
+                rootI, rootJ = root(i), root(j)
+                # Words are sorted by frequency, so the most frequent word of
+                # a group is the one with the lowest index
+                canonical[max(rootI, rootJ)] = min(rootI, rootJ)
+
+    for i in range(len(canonical)):
+        canonical[i] = root(i)
+    return canonical
+
+
+def variantsPath(modelFile):
+    '''Path where the variants of the given model file are stored.'''
+    return os.path.splitext(modelFile)[0] + '.variants.npy'
+
+
+def saveVariants(modelFile, canonical):
+    '''Store variants next to the given model file.'''
+    np.save(variantsPath(modelFile), canonical)
+
+
+def loadVariants(modelFile, mmap=True):
+    '''Load the variants stored next to the given model file (memory mapped,
+    unless mmap is False). Returns None if there are none.'''
+    path = variantsPath(modelFile)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+class VariantTable():
+
+    '''Precomputed spelling variants of the words of one model.'''
+
+    def __init__(self, canonical, vocab):
+        self._canonical = canonical
+        self._vocab = vocab
+
+    def canonicalIndex(self, word):
+        '''Return the index of the canonical form of word, or None if word is
+        not in the vocabulary.'''
+        entry = self._vocab.get(word)
+        if entry is None:
+            return None
+        return int(self._canonical[entry.index])
+
+    def clean(self, termList):
+        '''Remove items from a list of (word, weight) tuples which are
+        variants of an earlier item on the list.'''
+        seen = set()
+        cleanTerms = []
+        for word, weight in termList:
+            index = self.canonicalIndex(word)
+            key = word if index is None else index
+            if key not in seen:
+                seen.add(key)
+                cleanTerms.append((word, weight))
+        return cleanTerms
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+    from shico.vocabularymonitor import VocabularyMonitor
+
+    arguments = docopt(__doc__)
+    nRows = arguments['-r']
+    nRows = int(nRows) if nRows is not None else None
+    processes = arguments['-p']
+    processes = int(processes) if processes is not None else None
+
+    vm = VocabularyMonitor(arguments['-f'],
+                           binary=not arguments['--non-binary'],
+                           useCache=False, useMmap=False,
+                           w2vFormat=arguments['--w2v-format'],
+                           initSims=True)
+    for key in vm.getAvailableYears():
+        wv = vm.getKeyedVectors(key)
+        ids, sims = topNeighbours(wv.vectors_norm, K=int(arguments['-k']),
+                                  nRows=nRows, processes=processes)
+        canonical = variantClusters(wv.index2word, ids, sims,
+                                    minSim=float(arguments['-s']))
+        saveVariants(vm.getModelFile(key), canonical)
+        nVariants = int((canonical != np.arange(len(canonical))).sum())
+        print '[%s]: %d words are variants of another word' % (key, nVariants)
@@ -1,6 +1,6 @@
 import six
 from sortedcontainers import SortedDict
-from collections import defaultdict
+from collections import defaultdict, deque
 from utils import weightJSD, weightGauss, weightLinear
 from format import getRangeMiddle
 
@@ -66,6 +66,77 @@ class VocabularyAggregator():
                                     param=self._wfParam,
                                     freq=self._yIntervalFreq)
 
+    def incremental(self):
+        '''Returns an IncrementalAggregator with the settings of this
+        vocabularyaggregator.'''
+        return IncrementalAggregator(weighF=self._weighF,
+                                     wfParam=self._wfParam,
+                                     yearsInInterval=self._yearsInInterval,
+                                     nWordsPerYear=self._nWordsPerYear,
+                                     yIntervalFreq=self._yIntervalFreq)
+
+    def iterAggregate(self, periods):
+        '''Aggregate the vocabularies of the given (key, words) periods as
+        they come in (e.g. from VocabularyMonitor.iterClouds, with forwards
+        tracking). Yields (key, words, periodGroup) for every aggregated
+        vocabulary, as soon as all periods it aggregates are in. Yields the
+        same vocabularies and groups as aggregate.'''
+        aggregator = self.incremental()
+        for key, words in periods:
+            for window in aggregator.add(key, words):
+                yield window
+        for window in aggregator.finish():
+            yield window
+
+
+class IncrementalAggregator():
+    '''Aggregates vocabularies period by period, in the same way as
+    VocabularyAggregator.aggregate. Only the last yearsInInterval periods are
+    kept, and every aggregated vocabulary is returned as soon as its last
+    period is added.
+
+    Periods must be added in increasing order of their keys. Keyword
+    arguments are those of VocabularyAggregator.
+    '''
+
+    def __init__(self, weighF='Gaussian', wfParam=10,
+                 yearsInInterval=5, nWordsPerYear=10, yIntervalFreq=None):
+        if yIntervalFreq is None:
+            yIntervalFreq = yearsInInterval
+        self._f = _selectWeightingFunction(weighF, wfParam)
+        self._yearsInInterval = yearsInInterval
+        self._nWordsPerYear = nWordsPerYear
+        self._yIntervalFreq = yIntervalFreq
+        self._window = deque(maxlen=yearsInInterval)
+        self._nPeriods = 0
+        self._nWindows = 0
+
+    def add(self, key, words):
+        '''Add the vocabulary of one period. Returns a list with the
+        (key, words, periodGroup) of the aggregated vocabulary completed by
+        this period, if any.'''
+        if len(self._window) > 0 and key <= self._window[-1][0]:
+            raise ValueError('Periods must be added in order: %s after %s'
+                             % (key, self._window[-1][0]))
+        self._window.append((key, words))
+        self._nPeriods += 1
+        start = self._nPeriods - self._yearsInInterval
+        if start < 0 or start % self._yIntervalFreq != 0:
+            return []
+        self._nWindows += 1
+        return [_aggregateWindow(list(self._window), self._f,
+                                 self._nWordsPerYear)]
+
+    def finish(self):
+        '''Returns the aggregated vocabularies which remain when all periods
+        have been added: when there are fewer periods than yearsInInterval,
+        all periods are aggregated together (as aggregate does).'''
+        if self._nWindows > 0 or len(self._window) == 0:
+            return []
+        self._nWindows += 1
+        return [_aggregateWindow(list(self._window), self._f,
+                                 self._nWordsPerYear)]
+
 
 def _adaptiveAggregation(V, n, yIntervals, weightF, param, freq):
     '''Apply adaptive aggregation algorithm to the given vocabulary.
@@ -78,26 +149,33 @@ def _adaptiveAggregation(V, n, yIntervals, weightF, param, freq):
     # Select weighting function
     f = _selectWeightingFunction(weightF, param)
     for t in _arrangeIntervals(V, yIntervals, freq):
-        mu_t = getRangeMiddle(t[0], t[-1])
-        V_prime = SortedDict({tx: V[tx] for tx in t})
-
-        score = defaultdict(float)
-        for years_v, words_v in V_prime.iteritems():
-            mu_v = getRangeMiddle(years_v)
-            fvt = f(mu_v, mu_t)
-            for word, score_wv in words_v:
-                score[word] += fvt * score_wv
-
-        # Top n terms w sorted by score_w
-        scoreList = [(k, v) for k, v in score.iteritems()]
-        scoreList = sorted(scoreList, key=lambda pair: pair[1], reverse=True)
-        topN = scoreList[:n]
-
-        finalVocabs[str(int(mu_t))] = topN
-        periodGroups[str(int(mu_t))] = t
+        key, topN, t = _aggregateWindow([(tx, V[tx]) for tx in t], f, n)
+        finalVocabs[key] = topN
+        periodGroups[key] = t
     return finalVocabs, periodGroups
 
 
+def _aggregateWindow(V_prime, f, n):
+    '''Aggregate the given (sorted) list of (years, words) periods of one
+    time window. Returns the year in the center of the window (as a string),
+    its top n terms and the years of the periods.'''
+    t = [years_v for years_v, _ in V_prime]
+    mu_t = getRangeMiddle(t[0], t[-1])
+
+    score = defaultdict(float)
+    for years_v, words_v in V_prime:
+        mu_v = getRangeMiddle(years_v)
+        fvt = f(mu_v, mu_t)
+        for word, score_wv in words_v:
+            score[word] += fvt * score_wv
+
+    # Top n terms w sorted by score_w
+    scoreList = [(k, v) for k, v in score.iteritems()]
+    scoreList = sorted(scoreList, key=lambda pair: pair[1], reverse=True)
+    topN = scoreList[:n]
+    return str(int(mu_t)), topN, t
+
+
 def _selectWeightingFunction(weightF, param):
     '''Create a weighting function specified by weightF, which uses
     the given parameter param. Returns a function which takes two
@@ -2,7 +2,7 @@ import numpy as np
 
 from sortedcontainers import SortedDict
 from sklearn import manifold
-from format import wordLocationAsDict, getRangeMiddle
+from format import wordLocationsAsDicts, getRangeMiddle
 
 
 def _getPairwiseDistances(wordsT1, model):
@@ -34,6 +34,22 @@ def _normalizeCloud(X):
     return X
 
 
+def _normalizeClouds(clouds):
+    '''Normalize a dictionary of clouds like _normalizeCloud, but with the
+    minimum, range and mean of all of them, so the same location is mapped to
+    the same normalized location in every cloud.'''
+    allLocs = np.vstack(clouds.values())
+    if len(allLocs) == 0:
+        return clouds
+    minLoc = allLocs.min(axis=0)
+    rangeLoc = allLocs.max(axis=0) - minLoc
+    # Avoid dividing by zero when all locations are the same along an axis
+    rangeLoc[rangeLoc == 0] = 1
+    meanLoc = ((allLocs - minLoc) / rangeLoc).mean(axis=0)
+    return {label: (locs - minLoc) / rangeLoc - meanLoc
+            for label, locs in clouds.iteritems()}
+
+
 def _findTransform(wordsT0, locsT0, wordsT1, locsT1):
     matchingTerms = list(set(wordsT0).intersection(set(wordsT1)))
 
@@ -56,8 +72,33 @@ def _findTransform(wordsT0, locsT0, wordsT1, locsT1):
     return T
 
 
+def _getAlignedEmbedding(monitor, results):
+    '''Create 2D locations of the words of every period, by projecting their
+    aligned vectors on the two principal axes of all of them. As the
+    projection is shared by all periods, locations are comparable across
+    periods without any further transformation.'''
+    vectors = SortedDict()
+    for label, r in results.iteritems():
+        vectors[label] = monitor.getAlignedVectors(label, [w for w, _ in r])
+
+    allVectors = np.vstack(vectors.values())
+    allVectors = allVectors[~np.isnan(allVectors).any(axis=1)]
+    if len(allVectors) < 2:
+        return {label: np.zeros((len(v), 2))
+                for label, v in vectors.iteritems()}
+    mean = allVectors.mean(axis=0)
+    _, _, Vt = np.linalg.svd(allVectors - mean, full_matrices=False)
+    projection = Vt[:2].T
+
+    return {label: (v - mean).dot(projection)
+            for label, v in vectors.iteritems()}
+
+
 def doSpaceEmbedding(monitor, results, aggMetadata):
     '''Create 2D word embedding from given set of results'''
+    if monitor.isAligned():
+        return _doAlignedSpaceEmbedding(monitor, results, aggMetadata)
+
     embeddedResults = SortedDict()
 
     wordsT0 = None
@@ -78,8 +119,31 @@ def doSpaceEmbedding(monitor, results, aggMetadata):
         locsT0 = locsT1
 
         str_label = str(int(getRangeMiddle(label)))
-        embeddedResults[str_label] = [wordLocationAsDict(
-            wordsT1[i], locsT1[i, :]) for i in range(len(wordsT1))]
+        embeddedResults[str_label] = wordLocationsAsDicts(wordsT1, locsT1)
+
+    # Aggregation step (more like throwing away some years)
+    embeddedResultsAgg = {year: embeddedResults[year] for year in aggMetadata if year in embeddedResults}
+    embeddedResultsAgg = SortedDict(embeddedResultsAgg)
+
+    return embeddedResultsAgg
+
+
+def _doAlignedSpaceEmbedding(monitor, results, aggMetadata):
+    '''Create 2D word embedding from given set of results, using the
+    aligned vector spaces of the monitor'''
+    embeddedResults = SortedDict()
+
+    locations = _getAlignedEmbedding(monitor, results)
+    # Words missing from the model are placed in the center (of the
+    # projection). Normalized together, to keep locations comparable.
+    locations = _normalizeClouds({label: np.nan_to_num(locs)
+                                  for label, locs in locations.iteritems()})
+    for label, r in results.iteritems():
+        words = [w for w, _ in r]
+        locs = locations[label]
+
+        str_label = str(int(getRangeMiddle(label)))
+        embeddedResults[str_label] = wordLocationsAsDicts(words, locs)
 
     # Aggregation step (more like throwing away some years)
     embeddedResultsAgg = {year: embeddedResults[year] for year in aggMetadata if year in embeddedResults}
@@ -2,11 +2,22 @@ import glob
 import os
 import six
 import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from gensim.models import KeyedVectors
 
 from sortedcontainers import SortedDict
 from collections import defaultdict, Counter
 from functools32 import lru_cache
+from alignment import alignModels, loadTransform, unitVectors
+from metrics import metrics
+from neighbours import NeighbourTable, loadNeighbours
+from similarity import topSimilar, vectorNorms
+from variants import VariantTable, loadVariants
+
+
+# Maximum number of terms fetched for fillCleaned, relative to maxRelatedTerms
+_maxOverfetch = 8
 
 
 class VocabularyMonitor():
@@ -22,7 +33,10 @@ class VocabularyMonitor():
     '''
 
     def __init__(self, globPattern, binary=True, useCache=True, useMmap=True,
-                 w2vFormat=True):
+                 w2vFormat=True, align=False, initSims=False,
+                 useNeighbours=False, similarityBlockSize=None,
+                 periodWorkers=None, prefetchPeriods=None,
+                 useVariants=False, maxAnchors=10000):
         '''Create a Vocabulary monitor using the gensim w2v models located in
         the given glob pattern.
 
@@ -32,12 +46,63 @@ class VocabularyMonitor():
         useCache        ???
         useMmap         ???
         w2vFormat       ???
+        align           Align the vector space of every model onto the
+                        previous one (see shico.alignment). Alignments stored
+                        next to the model files are used if available for all
+                        models, otherwise they are calculated when loading.
+        maxAnchors      Maximum number of anchor words (most frequent shared
+                        words) used to calculate each alignment when loading
+                        (None to use all shared words).
+        initSims        Prepare normalized vectors when loading, instead of on
+                        the first query. Models are then ready to be shared by
+                        forked processes (e.g. gunicorn workers with
+                        preload_app), and stored vectors which are already
+                        normalized are used without making a copy.
+        useNeighbours   Answer most_similar queries from the neighbours
+                        precomputed by shico.neighbours (if they are stored
+                        next to the model file).
+        similarityBlockSize
+                        Answer most_similar queries by scanning the vectors
+                        in blocks of this many words (see shico.similarity),
+                        which bounds the memory used by each query and does
+                        not need normalized vectors. None to use gensim's
+                        most_similar.
+        periodWorkers   Number of periods tracked at the same time by the
+                        non-adaptive algorithm, whose periods do not depend on
+                        each other. None to track periods one after another.
+        prefetchPeriods Number of periods ahead for which the adaptive
+                        algorithm speculatively queries the seeds of the
+                        current period (on the periodWorkers threads), as
+                        seeds of consecutive periods tend to overlap.
+                        Results are the same; how often speculation is used
+                        is counted in the speculative_queries metric.
+        useVariants     When cleaning is asked for, remove the spelling
+                        variants precomputed by shico.variants (if they are
+                        stored next to the model file) instead of calling the
+                        cleaning function.
         '''
         self._models = SortedDict()
+        self._modelFiles = {}
+        self._variants = {}
+        self._neighbours = set()
+        self._transforms = None
+        # Threads are only started on first use (e.g. after forking)
+        self._periodPool = ThreadPoolExecutor(max_workers=periodWorkers) \
+            if periodWorkers is not None else None
+        if prefetchPeriods and self._periodPool is None:
+            raise ValueError('prefetchPeriods requires periodWorkers')
+        self._prefetchPeriods = prefetchPeriods
         self._loadAllModels(globPattern, binary=True, useCache=useCache,
-                            useMmap=useMmap, w2vFormat=w2vFormat)
-
-    def _loadAllModels(self, globPattern, binary, useCache, useMmap, w2vFormat):
+                            useMmap=useMmap, w2vFormat=w2vFormat,
+                            initSims=initSims, useNeighbours=useNeighbours,
+                            similarityBlockSize=similarityBlockSize,
+                            useVariants=useVariants)
+        if align:
+            self._loadTransforms(maxAnchors)
+
+    def _loadAllModels(self, globPattern, binary, useCache, useMmap, w2vFormat,
+                       initSims=False, useNeighbours=False,
+                       similarityBlockSize=None, useVariants=False):
         '''Load word2vec models from given globPattern and return a dictionary
         of Word2Vec models.
         '''
@@ -56,21 +121,102 @@ class VocabularyMonitor():
                 def loader(name): return KeyedVectors.load(name, mmap=mmap)
 
             print '[%s]: %s' % (sModelName, sModelFile)
-            self._models[sModelName] = loader(sModelFile)
+            with metrics.timer('model_load', model=sModelName):
+                self._models[sModelName] = loader(sModelFile)
+                self._modelFiles[sModelName] = sModelFile
+                if initSims:
+                    _initSims(_keyedVectors(self._models[sModelName]))
+                if similarityBlockSize is not None:
+                    self._models[sModelName] = BlockedW2VModelEvaluator(
+                        self._models[sModelName], similarityBlockSize)
+            if useNeighbours:
+                neighbours = loadNeighbours(sModelFile, mmap=useMmap)
+                if neighbours is not None:
+                    print '...using precomputed neighbours of ', sModelName
+                    wv = _keyedVectors(self._models[sModelName])
+                    table = NeighbourTable(neighbours[0], neighbours[1],
+                                           wv.index2word, wv.vocab)
+                    self._models[sModelName] = NeighbourW2VModelEvaluator(
+                        self._models[sModelName], table)
+                    self._neighbours.add(sModelName)
+            if useVariants:
+                canonical = loadVariants(sModelFile, mmap=useMmap)
+                if canonical is not None:
+                    print '...using precomputed variants of ', sModelName
+                    wv = _keyedVectors(self._models[sModelName])
+                    self._variants[sModelName] = VariantTable(canonical,
+                                                              wv.vocab)
             if useCache:
                 print '...caching model ', sModelName
                 self._models[sModelName] = CachedW2VModelEvaluator(
                     self._models[sModelName])
 
+    def _loadTransforms(self, maxAnchors=None):
+        '''Load (or calculate) the alignment matrices of all models.'''
+        transforms = SortedDict()
+        for sKey, sModelFile in self._modelFiles.iteritems():
+            transforms[sKey] = loadTransform(sModelFile)
+        if any(R is None for R in transforms.values()):
+            print '...aligning models'
+            models = SortedDict({sKey: self.getKeyedVectors(sKey)
+                                 for sKey in self._models.keys()})
+            transforms = alignModels(models, maxAnchors)
+        self._transforms = transforms
+
     def getAvailableYears(self):
         '''Returns a list of year key's of w2v models currently loaded on this
         vocabularymonitor.'''
         return list(self._models.keys())
 
+    def getTrackedYears(self, startKey=None, endKey=None, forwards=True):
+        '''Returns the year keys of the models trackClouds uses with the
+        given startKey, endKey and direction, in the order in which they are
+        tracked.'''
+        return list(self._selectKeys(startKey, endKey, forwards))
+
+    def getModelFile(self, key):
+        '''Returns the file the model with the given year key was loaded
+        from.'''
+        return self._modelFiles[key]
+
+    def hasNeighbours(self, key):
+        '''Returns True if the model with the given year key answers queries
+        from precomputed neighbours.'''
+        return key in self._neighbours
+
+    def hasVariants(self, key):
+        '''Returns True if cleaning of the model with the given year key uses
+        precomputed spelling variants.'''
+        return key in self._variants
+
+    def getKeyedVectors(self, key):
+        '''Returns the gensim KeyedVectors of the model with the given year
+        key.'''
+        return _keyedVectors(self._models[key])
+
+    def isAligned(self):
+        '''Returns True if models have been aligned.'''
+        return self._transforms is not None
+
+    def getAlignedVectors(self, key, words):
+        '''Returns a matrix with the (unit) vectors of the given words in the
+        model with the given year key, in the vector space shared by all
+        aligned models. Rows of words not in the model are NaN.'''
+        wv = self.getKeyedVectors(key)
+        R = self._transforms[key]
+        vectors = np.empty((len(words), R.shape[1]))
+        vectors.fill(np.nan)
+        known = [i for i, w in enumerate(words) if w in wv.vocab]
+        if len(known) > 0:
+            knownWords = [words[i] for i in known]
+            vectors[known] = unitVectors(wv, knownWords).dot(R)
+        return vectors
+
     def trackClouds(self, seedTerms, maxTerms=10, maxRelatedTerms=10,
                     startKey=None, endKey=None, minSim=0.0, wordBoost=1.00,
                     forwards=True, sumSimilarity=False, algorithm='adaptive',
-                    cleaningFunction=None):
+                    cleaningFunction=None, fillCleaned=False,
+                    stopCriteria=None):
         '''Given a list of seed terms, generate a set of results from the
         word2vec models currently loaded in this vocabularymonitor.
 
@@ -98,6 +244,13 @@ class VocabularyMonitor():
                            algorithm uses the initial seeds for every time
                            period.
         cleaningFunction -- ???
+        fillCleaned     -- Fetch more related terms when cleaning removes some
+                           of them (up to _maxOverfetch times as many), so
+                           every seed term keeps maxRelatedTerms related
+                           terms if possible.
+        stopCriteria    -- StopCriteria for ending tracking early. Periods
+                           after the first period which meets one of them are
+                           not tracked (see StopCriteria.whereStopped).
 
         Returns:
         terms  -- A dictionary with the year key of every model as its keys and
@@ -120,14 +273,69 @@ class VocabularyMonitor():
                             }
                   }
         '''
-        if isinstance(seedTerms, six.string_types):
-            seedTerms = [seedTerms]
-        aSeedSet = seedTerms
-
         # Initialize dicts to be returned
         yTerms = SortedDict()
         yLinks = SortedDict()
 
+        periods = self.iterClouds(
+            seedTerms, maxTerms=maxTerms, maxRelatedTerms=maxRelatedTerms,
+            startKey=startKey, endKey=endKey, minSim=minSim,
+            wordBoost=wordBoost, forwards=forwards,
+            sumSimilarity=sumSimilarity, algorithm=algorithm,
+            cleaningFunction=cleaningFunction, fillCleaned=fillCleaned)
+        previousTerms = None
+        for sKey, terms, links in periods:
+            # Store results of this time period
+            yTerms[sKey] = terms
+            yLinks[sKey] = links
+
+            if stopCriteria is not None:
+                if stopCriteria.check(seedTerms, previousTerms, terms,
+                                      links) is not None:
+                    # Remaining periods are not tracked
+                    periods.close()
+                    break
+                previousTerms = terms
+
+        return yTerms, yLinks
+
+    def iterClouds(self, seedTerms, maxTerms=10, maxRelatedTerms=10,
+                   startKey=None, endKey=None, minSim=0.0, wordBoost=1.00,
+                   forwards=True, sumSimilarity=False, algorithm='adaptive',
+                   cleaningFunction=None, fillCleaned=False):
+        '''Same as trackClouds, but returns an iterator of (key, terms, links)
+        tuples, one for every time period, yielded as soon as the period has
+        been tracked (in the order in which periods are tracked). Terms and
+        links are the values trackClouds gives for the period.
+
+        Periods which have not been yielded yet are not tracked, so closing
+        the iterator early (or dropping it) saves their computation.
+        '''
+        if isinstance(seedTerms, six.string_types):
+            seedTerms = [seedTerms]
+        if algorithm not in ('adaptive', 'non-adaptive'):
+            raise Exception('Algorithm not supported: ' + algorithm)
+        # Keys are checked here, not when the first period is tracked
+        sortedKeys = self._selectKeys(startKey, endKey, forwards)
+
+        if algorithm == 'non-adaptive' and self._periodPool is not None:
+            return self._iterParallel(sortedKeys, seedTerms,
+                                      maxTerms=maxTerms,
+                                      maxRelatedTerms=maxRelatedTerms,
+                                      minSim=minSim,
+                                      cleaningFunction=cleaningFunction,
+                                      fillCleaned=fillCleaned)
+        return self._iterPeriods(sortedKeys, seedTerms, maxTerms=maxTerms,
+                                 maxRelatedTerms=maxRelatedTerms,
+                                 minSim=minSim, wordBoost=wordBoost,
+                                 sumSimilarity=sumSimilarity,
+                                 algorithm=algorithm,
+                                 cleaningFunction=cleaningFunction,
+                                 fillCleaned=fillCleaned)
+
+    def _selectKeys(self, startKey, endKey, forwards):
+        '''Returns the year keys of the models to be used, in the order in
+        which they are tracked.'''
         # Keys are already sorted because we use a SortedDict
         sortedKeys = self._models.keys()
 
@@ -147,65 +355,123 @@ class VocabularyMonitor():
         # Reverse direction if necessary
         if not forwards:
             sortedKeys = sortedKeys[::-1]
-
-        # Iterate models
-        for sKey in sortedKeys:
-            if algorithm == 'adaptive':
-                terms, links, aSeedSet = \
-                    self._trackInlink(self._models[sKey], aSeedSet,
-                                      maxTerms=maxTerms,
-                                      maxRelatedTerms=maxRelatedTerms,
-                                      minSim=minSim,
-                                      wordBoost=wordBoost,
-                                      sumSimilarity=sumSimilarity,
-                                      cleaningFunction=cleaningFunction)
-            elif algorithm == 'non-adaptive':
-                # Non-adaptive algorithm uses always same set of seeds
-                terms, links = \
-                    self._trackCore(self._models[sKey], aSeedSet,
-                                    maxTerms=maxTerms,
-                                    maxRelatedTerms=maxRelatedTerms,
-                                    minSim=minSim,
-                                    cleaningFunction=cleaningFunction)
-            else:
-                raise Exception('Algorithm not supported: ' + algorithm)
-
-            # Store results of this time period
-            yTerms[sKey] = terms
-            yLinks[sKey] = links
-
-        return yTerms, yLinks
+        return sortedKeys
+
+    def _iterParallel(self, sortedKeys, seedTerms, maxTerms, maxRelatedTerms,
+                      minSim, cleaningFunction, fillCleaned):
+        '''Track the same seeds in all given periods at the same time, and
+        yield the results of each period in order.'''
+        timings = metrics.currentTimings()
+        profile = metrics.currentProfile()
+        futures = [self._periodPool.submit(
+            self._trackPeriod, timings, profile, sKey, seedTerms,
+            maxTerms=maxTerms, maxRelatedTerms=maxRelatedTerms,
+            minSim=minSim,
+            cleaningFunction=self._cleaning(sKey, cleaningFunction),
+            fillCleaned=fillCleaned)
+            for sKey in sortedKeys]
+        try:
+            for sKey, future in zip(sortedKeys, futures):
+                terms, links = future.result()
+                yield sKey, terms, links
+        finally:
+            # Periods which are no longer needed
+            for future in futures:
+                future.cancel()
+
+    def _iterPeriods(self, sortedKeys, aSeedSet, maxTerms, maxRelatedTerms,
+                     minSim, wordBoost, sumSimilarity, algorithm,
+                     cleaningFunction, fillCleaned):
+        '''Track seeds through the given periods one after another, and
+        yield the results of each period.'''
+        prefetcher = None
+        if algorithm == 'adaptive' and self._prefetchPeriods:
+            prefetcher = _Prefetcher(self._periodPool,
+                                     [self._models[sKey]
+                                      for sKey in sortedKeys],
+                                     self._prefetchPeriods, maxRelatedTerms)
+        try:
+            # Iterate models
+            for idx, sKey in enumerate(sortedKeys):
+                cleaning = self._cleaning(sKey, cleaningFunction)
+                with metrics.timer('period', period=sKey):
+                    if algorithm == 'adaptive':
+                        prefetched = None
+                        if prefetcher is not None:
+                            # Next periods are queried while this one is
+                            # tracked
+                            prefetcher.prefetch(idx, aSeedSet)
+                            prefetched = prefetcher.take(idx, aSeedSet)
+                        terms, links, aSeedSet = self._trackInlink(
+                            self._models[sKey], aSeedSet, maxTerms=maxTerms,
+                            maxRelatedTerms=maxRelatedTerms, minSim=minSim,
+                            wordBoost=wordBoost, sumSimilarity=sumSimilarity,
+                            cleaningFunction=cleaning,
+                            fillCleaned=fillCleaned, prefetched=prefetched)
+                    else:
+                        # Non-adaptive algorithm uses always same set of seeds
+                        terms, links = self._trackCore(
+                            self._models[sKey], aSeedSet, maxTerms=maxTerms,
+                            maxRelatedTerms=maxRelatedTerms, minSim=minSim,
+                            cleaningFunction=cleaning,
+                            fillCleaned=fillCleaned)
+                yield sKey, terms, links
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+    def _cleaning(self, sKey, cleaningFunction):
+        '''Returns the cleaning function used for the given period: its
+        precomputed variants, if cleaning is asked for and there are any.'''
+        if cleaningFunction is None or sKey not in self._variants:
+            return cleaningFunction
+        return self._variants[sKey].clean
+
+    def _trackPeriod(self, timings, profile, sKey, seedTerms, **kwargs):
+        '''Perform non-adaptive search on the model of the given period,
+        collecting durations in the given request timings (and profiling into
+        the given request profile).'''
+        with metrics.shareTimings(timings), metrics.shareProfile(profile):
+            with metrics.timer('period', period=sKey):
+                return self._trackCore(self._models[sKey], seedTerms,
+                                       **kwargs)
 
     def _trackInlink(self, model, seedTerms, maxTerms=10, maxRelatedTerms=10,
                      minSim=0.0, wordBoost=1.0, sumSimilarity=False,
-                     cleaningFunction=None):
+                     cleaningFunction=None, fillCleaned=False,
+                     prefetched=None):
         '''Perform in link search'''
         if sumSimilarity:
             terms, links = self._trackCore(
                 model, seedTerms, maxTerms=maxTerms,
                 maxRelatedTerms=maxRelatedTerms, minSim=minSim,
                 wordBoost=wordBoost,  reward=lambda tSim: 1.0 - tSim,
-                cleaningFunction=cleaningFunction)
+                cleaningFunction=cleaningFunction, fillCleaned=fillCleaned,
+                prefetched=prefetched)
         else:
             terms, links = self._trackCore(
                 model, seedTerms, maxTerms=maxTerms,
                 maxRelatedTerms=maxRelatedTerms, minSim=minSim,
-                cleaningFunction=cleaningFunction)
+                cleaningFunction=cleaningFunction, fillCleaned=fillCleaned,
+                prefetched=prefetched)
         # Make a new seed set
         newSeedSet = [word for word, weight in terms]
         return terms, links, newSeedSet
 
     def _trackCore(self, model, seedTerms, maxTerms=10, maxRelatedTerms=10,
                    minSim=0.0, wordBoost=1.0, reward=lambda x: 1.0,
-                   cleaningFunction=None):
+                   cleaningFunction=None, fillCleaned=False,
+                   prefetched=None):
         '''Given a list of seed terms, queries the given model to produce a
         list of terms. A dictionary of links is also returned as a dictionary:
-        { seed: [(word,weight),...]}'''
+        { seed: [(word,weight),...]}. Queries found in prefetched (a
+        dictionary of term: future most_similar result) are not repeated.'''
         dRelatedTerms = defaultdict(float)
         links = defaultdict(list)
 
         relatedTermQueries = _getRelatedTerms(
-            model, seedTerms, maxRelatedTerms, cleaningFunction)
+            model, seedTerms, maxRelatedTerms, cleaningFunction, fillCleaned,
+            prefetched)
 
         # Get the first tier related terms
         for term, newTerms in relatedTermQueries:
@@ -228,14 +494,18 @@ class VocabularyMonitor():
         return topTerms, links
 
 
-def _getRelatedTerms(model, seedTerms, maxRelatedTerms, cleaningFunction):
+def _getRelatedTerms(model, seedTerms, maxRelatedTerms, cleaningFunction,
+                     fillCleaned=False, prefetched=None):
     queries = []
     threads = []
+    profile = metrics.currentProfile()
 
     for term in seedTerms:
+        future = prefetched.get(term) if prefetched is not None else None
         t = threading.Thread(target=_getRelatedTermsThread,
                              args=(model, term, maxRelatedTerms, queries,
-                                   cleaningFunction))
+                                   cleaningFunction, fillCleaned, future,
+                                   profile))
         threads.append(t)
         t.start()
     for t in threads:
@@ -245,11 +515,39 @@ def _getRelatedTerms(model, seedTerms, maxRelatedTerms, cleaningFunction):
 
 
 def _getRelatedTermsThread(model, term, maxRelatedTerms, queries,
-                           cleaningFunction):
+                           cleaningFunction, fillCleaned=False, future=None,
+                           profile=None):
+    with metrics.shareProfile(profile):
+        _queryRelatedTerms(model, term, maxRelatedTerms, queries,
+                           cleaningFunction, fillCleaned, future)
+
+
+def _queryRelatedTerms(model, term, maxRelatedTerms, queries,
+                       cleaningFunction, fillCleaned, future):
     try:
-        newTerms = model.most_similar(term, topn=maxRelatedTerms)
+        # A prefetched query which has not started yet is run here instead
+        if future is not None and not future.cancel():
+            metrics.increment('speculative_queries', result='hit')
+            newTerms = future.result()
+        else:
+            if future is not None:
+                metrics.increment('speculative_queries', result='miss')
+            metrics.increment('most_similar_calls')
+            newTerms = model.most_similar(term, topn=maxRelatedTerms)
         if cleaningFunction is not None:
-            newTerms = cleaningFunction(newTerms)
+            cleanTerms = cleaningFunction(newTerms)
+            topn = maxRelatedTerms
+            # Fetch twice as many terms until enough are left after cleaning,
+            # or there are no more terms to fetch
+            while fillCleaned and len(cleanTerms) < maxRelatedTerms and \
+                    len(newTerms) == topn and \
+                    topn < maxRelatedTerms * _maxOverfetch:
+                topn = min(topn * 2, maxRelatedTerms * _maxOverfetch)
+                metrics.increment('most_similar_calls')
+                metrics.increment('cleaning_overfetch_calls')
+                newTerms = model.most_similar(term, topn=topn)
+                cleanTerms = cleaningFunction(newTerms)
+            newTerms = cleanTerms[:maxRelatedTerms]
 
         # list.append is thread safe, so we should be ok
         queries.append((term, newTerms))
@@ -258,6 +556,159 @@ def _getRelatedTermsThread(model, term, maxRelatedTerms, queries,
         pass
 
 
+class StopCriteria():
+
+    '''Rules for ending concept tracking early, when the tracked vocabulary
+    drifts away or collapses. Every rule is optional (None).
+
+    minOverlap  Minimum Jaccard overlap between the terms of a period and the
+                terms of the previous period.
+    minAvgSim   Minimum average similarity of the terms related to the seeds
+                of a period (0 if no related terms were found).
+    maxDrift    Maximum fraction of the initial seed terms which are missing
+                from the terms of a period.
+    '''
+
+    def __init__(self, minOverlap=None, minAvgSim=None, maxDrift=None):
+        self.minOverlap = minOverlap
+        self.minAvgSim = minAvgSim
+        self.maxDrift = maxDrift
+
+    def check(self, seedTerms, previousTerms, terms, links):
+        '''Check the terms and links of a period (see trackClouds) against
+        the rules, given the initial seed terms and the terms of the previous
+        period (None for the first period). Returns the name of the first
+        rule which is met and the value which met it, or None.'''
+        if isinstance(seedTerms, six.string_types):
+            seedTerms = [seedTerms]
+        words = set(word for word, _ in terms)
+        if self.minOverlap is not None and previousTerms is not None:
+            previous = set(word for word, _ in previousTerms)
+            union = words | previous
+            overlap = float(len(words & previous)) / len(union) \
+                if len(union) > 0 else 1.0
+            if overlap < self.minOverlap:
+                return 'minOverlap', overlap
+        if self.minAvgSim is not None:
+            sims = [sim for seed, pairs in links.iteritems()
+                    for word, sim in pairs if word != seed]
+            avgSim = sum(sims) / len(sims) if len(sims) > 0 else 0.0
+            if avgSim < self.minAvgSim:
+                return 'minAvgSim', avgSim
+        if self.maxDrift is not None and len(seedTerms) > 0:
+            missing = [seed for seed in seedTerms if seed not in words]
+            drift = float(len(missing)) / len(seedTerms)
+            if drift > self.maxDrift:
+                return 'maxDrift', drift
+        return None
+
+    def whereStopped(self, seedTerms, terms, links, forwards=True,
+                     lastKey=None):
+        '''Find where tracking with these rules stopped, given the results of
+        trackClouds and the key of the last period it would track otherwise
+        (see VocabularyMonitor.getTrackedYears). Returns a dictionary with
+        the key of the last period tracked, the rule which was met and its
+        value, or None if tracking went through all periods (also when a rule
+        is only met on lastKey, as no period was skipped then).'''
+        keys = list(terms.keys())
+        if not forwards:
+            keys = keys[::-1]
+        previousTerms = None
+        for key in keys:
+            met = self.check(seedTerms, previousTerms, terms[key], links[key])
+            if met is not None:
+                if key == lastKey:
+                    return None
+                return {'key': key, 'rule': met[0], 'value': met[1]}
+            previousTerms = terms[key]
+        return None
+
+
+class _Prefetcher():
+
+    '''Speculatively queries the models of the next periods for the seeds of
+    the current period, on a pool of threads. Results are kept per period, as
+    futures of most_similar results keyed by term.'''
+
+    def __init__(self, pool, models, ahead, topn):
+        self._pool = pool
+        self._models = models
+        self._ahead = ahead
+        self._topn = topn
+        self._futures = defaultdict(dict)
+        # Speculative queries are part of the request being profiled (if any)
+        self._profile = metrics.currentProfile()
+
+    def prefetch(self, idx, seedTerms):
+        '''Query seedTerms on the models of the periods following period
+        idx.'''
+        for nextIdx in range(idx + 1, min(idx + 1 + self._ahead,
+                                          len(self._models))):
+            futures = self._futures[nextIdx]
+            for term in seedTerms:
+                if term not in futures:
+                    futures[term] = self._pool.submit(
+                        self._query, self._models[nextIdx], term)
+
+    def _query(self, model, term):
+        with metrics.shareProfile(self._profile):
+            return model.most_similar(term, topn=self._topn)
+
+    def take(self, idx, seedTerms):
+        '''Return the queries prefetched for the given seeds of period idx.
+        Other queries prefetched for this period are cancelled.'''
+        futures = self._futures.pop(idx, {})
+        used = {term: futures.pop(term) for term in seedTerms
+                if term in futures}
+        self._cancel(futures)
+        metrics.increment('speculative_queries', len(seedTerms) - len(used),
+                          result='miss')
+        return used
+
+    def close(self):
+        '''Cancel queries which have not been used.'''
+        for futures in self._futures.values():
+            self._cancel(futures)
+        self._futures.clear()
+
+    def _cancel(self, futures):
+        for future in futures.values():
+            future.cancel()
+        metrics.increment('speculative_queries', len(futures),
+                          result='unused')
+
+
+def _keyedVectors(model):
+    '''Returns the gensim KeyedVectors of a model, whether it is wrapped in a
+    CachedW2VModelEvaluator and whether it is a Word2Vec model or only its
+    KeyedVectors.'''
+    while isinstance(model, (CachedW2VModelEvaluator,
+                             NeighbourW2VModelEvaluator,
+                             BlockedW2VModelEvaluator)):
+        model = model._model
+    return model.wv if hasattr(model, 'wv') else model
+
+
+def _initSims(wv, blockSize=65536):
+    '''Prepare the normalized vectors gensim uses for similarity queries. If
+    the vectors are already normalized, they are used as they are: this
+    avoids a private copy of memory mapped vectors in every process.'''
+    if getattr(wv, 'vectors_norm', None) is not None:
+        return
+    vectors = wv.vectors
+    normalized = True
+    for i in range(0, len(vectors), blockSize):
+        block = vectors[i:i + blockSize]
+        norms = np.sqrt((block ** 2).sum(axis=1))
+        if not np.allclose(norms, 1, atol=1e-4):
+            normalized = False
+            break
+    if normalized:
+        wv.vectors_norm = vectors
+    else:
+        wv.init_sims()
+
+
 def _pruned(pairs, words):
     '''Returns a list of (word, weight) tuples which is the same as the given
     list (pairs), except containing only words in the set (words)'''
@@ -291,3 +742,80 @@ class CachedW2VModelEvaluator():
             return self._model.n_similarity(term1, term2)
         except KeyError:
             return 0
+
+
+class NeighbourW2VModelEvaluator():
+
+    '''Wrapper class answering most_similar queries from a table of
+    precomputed neighbours (see shico.neighbours). Queries which are not in
+    the table are answered by the model.'''
+
+    def __init__(self, model, table):
+        self._model = model
+        self._table = table
+        self.vocab = model.vocab
+
+    def most_similar(self, term, topn=10):
+        neighbours = self._table.most_similar(term, topn)
+        metrics.increment('neighbour_table_lookups',
+                          result='miss' if neighbours is None else 'hit')
+        if neighbours is None:
+            return self._model.most_similar(term, topn=topn)
+        return neighbours
+
+    def n_similarity(self, term1, term2):
+        return self._model.n_similarity(term1, term2)
+
+
+class BlockedW2VModelEvaluator():
+
+    '''Wrapper class answering most_similar queries by scanning the vectors
+    of the model in blocks (see shico.similarity), like gensim's most_similar
+    for a single positive word.'''
+
+    def __init__(self, model, blockSize=65536):
+        self._model = model
+        self._blockSize = blockSize
+        wv = _keyedVectors(model)
+        self.vocab = wv.vocab
+        self._index2word = wv.index2word
+        if getattr(wv, 'vectors_norm', None) is not None:
+            self._vectors = wv.vectors_norm
+            self._norms = None
+        else:
+            # Calculated once (one float per word), so the vectors are never
+            # normalized as a whole
+            self._vectors = wv.vectors
+            self._norms = vectorNorms(wv.vectors, blockSize)
+
+    def most_similar(self, term, topn=10):
+        if topn is None or topn < 1:
+            return self._model.most_similar(term, topn=topn)
+        index = self.vocab[term].index
+        query = self._vectors[index]
+        if self._norms is not None:
+            query = query / self._norms[index]
+        ids, sims = topSimilar(self._vectors, query[np.newaxis], topn,
+                               norms=self._norms, exclude=[[index]],
+                               blockSize=self._blockSize)
+        return [(self._index2word[i], s)
+                for i, s in zip(ids[0].tolist(), sims[0].tolist())
+                if s != -np.inf]
+
+    def n_similarity(self, term1, term2):
+        return self._model.n_similarity(term1, term2)
+
+
+def _cacheMetrics():
+    '''Report use of the most_similar cache (shared by all
+    CachedW2VModelEvaluator's) as metrics.'''
+    info = CachedW2VModelEvaluator.most_similar.cache_info()
+    lookups = info.hits + info.misses
+    return [
+        ('most_similar_cache_hits', {}, info.hits),
+        ('most_similar_cache_misses', {}, info.misses),
+        ('most_similar_cache_hit_ratio', {},
+         float(info.hits) / lookups if lookups > 0 else 0)
+    ]
+
+metrics.addCollector(_cacheMetrics)
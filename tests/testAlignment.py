@@ -0,0 +1,133 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from shico import alignment
+from shico import VocabularyMonitor as shVM
+from shico import VocabularyAggregator as shVA
+from shico.vocabularyembedding import doSpaceEmbedding
+
+
+class AlignmentTest(unittest.TestCase):
+    '''Tests for alignment of model vector spaces.'''
+
+    @classmethod
+    def setUpClass(self):
+        # Fake models! Only made so we can do unittests
+        self.vm = shVM('tests/w2vModels/*.w2v', useCache=True, useMmap=False,
+                       w2vFormat=True, align=True)
+
+    def testProcrustes(self):
+        '''Test that procrustes recovers a known rotation.'''
+        rand = np.random.RandomState(0)
+        A = rand.randn(50, 5)
+        Q, _ = np.linalg.qr(rand.randn(5, 5))
+        R = alignment.procrustes(A, A.dot(Q))
+        self.assertTrue(np.allclose(R, Q), 'Should recover rotation')
+
+    def testTransformsAreOrthogonal(self):
+        '''Test that alignment matrices are rotations.'''
+        self.assertTrue(self.vm.isAligned(), 'Models should be aligned')
+        for key in self.vm.getAvailableYears():
+            R = self.vm._transforms[key]
+            self.assertTrue(np.allclose(R.dot(R.T), np.eye(R.shape[0])),
+                            'Alignment of %s should be orthogonal' % key)
+
+    def testMaxAnchors(self):
+        '''Test that alignments are calculated on the given number of
+        anchors.'''
+        vm = shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                  w2vFormat=True, align=True, maxAnchors=20)
+        allAnchors = shVM('tests/w2vModels/*.w2v', useCache=False,
+                          useMmap=False, w2vFormat=True, align=True,
+                          maxAnchors=None)
+        key = vm.getAvailableYears()[1]
+        R = vm._transforms[key]
+        self.assertTrue(np.allclose(R.dot(R.T), np.eye(R.shape[0])),
+                        'Alignment should be orthogonal')
+        self.assertFalse(np.allclose(R, allAnchors._transforms[key]),
+                         'Alignment should use fewer anchors')
+
+    def testAlignedVectors(self):
+        '''Test that aligned vectors preserve similarities within a model.'''
+        key = self.vm.getAvailableYears()[1]
+        words = ['x', 'the', 'notAWord']
+        vectors = self.vm.getAlignedVectors(key, words)
+        self.assertEqual(vectors.shape[0], len(words),
+                         'There should be a vector for every word')
+        self.assertTrue(np.isnan(vectors[2]).all(),
+                        'Unknown words should have NaN vectors')
+        wv = self.vm.getKeyedVectors(key)
+        self.assertAlmostEqual(vectors[0].dot(vectors[1]),
+                               wv.similarity('x', 'the'), places=4,
+                               msg='Similarity should not change')
+
+    def testSavedTransforms(self):
+        '''Test that saved alignments are used when loading.'''
+        tmpDir = tempfile.mkdtemp()
+        try:
+            for modelFile in glob.glob('tests/w2vModels/*.w2v'):
+                shutil.copy(modelFile, tmpDir)
+            globPattern = os.path.join(tmpDir, '*.w2v')
+            vm = shVM(globPattern, useCache=False, useMmap=False,
+                      w2vFormat=True)
+            self.assertFalse(vm.isAligned(),
+                             'Models should not be aligned by default')
+            for key in vm.getAvailableYears():
+                R = np.eye(vm.getKeyedVectors(key).vector_size)
+                alignment.saveTransform(vm.getModelFile(key), R)
+            vm = shVM(globPattern, useCache=False, useMmap=False,
+                      w2vFormat=True, align=True)
+            for key in vm.getAvailableYears():
+                self.assertTrue(np.allclose(vm._transforms[key],
+                                            np.eye(R.shape[0])),
+                                'Saved alignments should be loaded')
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def testAlignedSpaceEmbedding(self):
+        '''Test word embeddings using aligned models'''
+        results, links = self.vm.trackClouds('x')
+        agg = shVA(yearsInInterval=1)
+        aggResults, aggMetadata = agg.aggregate(results)
+        embedded = doSpaceEmbedding(self.vm, results, aggMetadata)
+        self.assertGreater(len(embedded), 0,
+                           'Dictionary should contain some years')
+        for year, embeddings in embedded.iteritems():
+            self.assertGreater(len(embeddings), 0,
+                               'Embeddings should contain some words')
+            for item in embeddings:
+                self.assertFalse(np.isnan(item['x']) or np.isnan(item['y']),
+                                 'Locations should be numbers')
+
+    def testAlignedEmbeddingComparable(self):
+        '''Test that a vector shared by two periods has the same location in
+        both.'''
+        rand = np.random.RandomState(0)
+        shared = rand.randn(5)
+        vectors = {
+            '1950_1959': {'a': shared, 'b': rand.randn(5),
+                          'c': rand.randn(5)},
+            '1951_1960': {'a': shared, 'd': rand.randn(5) * 10,
+                          'e': rand.randn(5)},
+        }
+
+        class AlignedMonitor():
+            def isAligned(self):
+                return True
+
+            def getAlignedVectors(self, key, words):
+                return np.array([vectors[key][w] for w in words])
+
+        results = {key: [(w, 1.0) for w in sorted(words)]
+                   for key, words in vectors.iteritems()}
+        embedded = doSpaceEmbedding(AlignedMonitor(), results,
+                                    ['1954', '1955'])
+        locations = [[(item['x'], item['y']) for item in embedded[year]
+                      if item['word'] == 'a'][0]
+                     for year in ['1954', '1955']]
+        self.assertTrue(np.allclose(locations[0], locations[1]),
+                        'Shared vector should have the same location')
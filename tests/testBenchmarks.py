@@ -0,0 +1,28 @@
+import unittest
+from benchmarks.synthetic import syntheticModels
+from benchmarks.compareBenchmarks import compareResults
+
+
+class BenchmarksTest(unittest.TestCase):
+    '''Tests for benchmark helpers.'''
+
+    def testSyntheticModels(self):
+        '''Test synthetic models have the requested size.'''
+        models = syntheticModels(vocabSize=100, dim=10, nPeriods=3)
+        self.assertEqual([name for name, _ in models],
+                         ['1950_1959', '1951_1960', '1952_1961'],
+                         'Models should be named after their periods')
+        for name, wv in models:
+            self.assertEqual(wv.vectors.shape, (100, 10),
+                             'Model %s has wrong size' % name)
+
+    def testCompareResults(self):
+        '''Test that regressions above the threshold are detected.'''
+        base = {'a': {'median': 1.0}, 'b': {'median': 1.0},
+                'c': {'median': 1.0}}
+        new = {'a': {'median': 1.1}, 'b': {'median': 1.5}}
+        comparison = compareResults(base, new, 0.2)
+        self.assertEqual([name for name, _, _, _, _ in comparison],
+                         ['a', 'b'], 'Only common benchmarks are compared')
+        self.assertEqual([regressed for _, _, _, _, regressed in comparison],
+                         [False, True], 'Only b should be a regression')
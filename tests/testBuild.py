@@ -0,0 +1,141 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from shico import build
+from shico import VocabularyMonitor as shVM
+
+
+class BuildTest(unittest.TestCase):
+    '''Tests for model building pipeline.'''
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.shardDir = os.path.join(self.tmpDir, 'shards')
+        self.modelDir = os.path.join(self.tmpDir, 'models')
+        os.makedirs(self.shardDir)
+        self.w2vParams = {'size': 10, 'min_count': 1, 'workers': 1, 'iter': 1}
+        self.years = range(1950, 1955)
+        shards = {}
+        for year in self.years:
+            checksum = build.writeShard(self.shardDir, year,
+                                        self._randomSentences(year))
+            shards[str(year)] = {'source': '', 'checksum': checksum}
+        build._saveManifest(self.shardDir, shards)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def _randomSentences(self, seed):
+        rand = np.random.RandomState(seed)
+        vocab = ['w%d' % i for i in range(20)]
+        return [rand.choice(vocab, 10).tolist() for _ in range(50)]
+
+    def testPeriodWindows(self):
+        '''Test grouping years in overlapping periods.'''
+        windows = build.periodWindows(range(1950, 1962), 10)
+        self.assertEqual(len(windows), 3, 'Should produce 3 periods')
+        self.assertEqual(build.periodName(windows[0]), '1950_1959',
+                         'First period should be 1950_1959')
+        self.assertEqual(build.periodName(windows[-1]), '1952_1961',
+                         'Last period should be 1952_1961')
+        windows = build.periodWindows(range(1950, 1962), 5, stepYears=5)
+        self.assertEqual([w[0] for w in windows], [1950, 1955],
+                         'Periods should start every 5 years')
+
+    def testShardSentences(self):
+        '''Test that shards stream back the sentences written.'''
+        sentences = list(build.ShardSentences(self.shardDir, [1950, 1951]))
+        expected = self._randomSentences(1950) + self._randomSentences(1951)
+        self.assertEqual(sentences, expected,
+                         'Shards should contain the sentences written')
+
+    def testBuildModels(self):
+        '''Test models are built and can be loaded by VocabularyMonitor.'''
+        timings = build.buildModels(self.shardDir, self.modelDir,
+                                    yearsInModel=3, processes=2,
+                                    w2vParams=self.w2vParams)
+        self.assertEqual(sorted(timings.keys()),
+                         ['1950_1952', '1951_1953', '1952_1954'],
+                         'A model should be built for each period')
+
+        vm = shVM(os.path.join(self.modelDir, '*.kv'), useCache=False,
+                  useMmap=True, w2vFormat=False)
+        self.assertEqual(vm.getAvailableYears(), sorted(timings.keys()),
+                         'VocabularyMonitor should load all models')
+        yTerms, _ = vm.trackClouds('w1', maxTerms=5)
+        self.assertEqual(len(yTerms), 3, 'Models should produce results')
+
+    def testBuildIncremental(self):
+        '''Test only periods with changed shards are rebuilt.'''
+        build.buildModels(self.shardDir, self.modelDir, yearsInModel=3,
+                          processes=2, w2vParams=self.w2vParams)
+        timings = build.buildModels(self.shardDir, self.modelDir,
+                                    yearsInModel=3, processes=2,
+                                    w2vParams=self.w2vParams)
+        self.assertEqual(len(timings), 0, 'Nothing should be rebuilt')
+
+        shards = build._loadManifest(self.shardDir)
+        shards['1954']['checksum'] = build.writeShard(
+            self.shardDir, 1954, self._randomSentences(0))
+        build._saveManifest(self.shardDir, shards)
+        timings = build.buildModels(self.shardDir, self.modelDir,
+                                    yearsInModel=3, processes=2,
+                                    w2vParams=self.w2vParams)
+        self.assertEqual(timings.keys(), ['1952_1954'],
+                         'Only period containing 1954 should be rebuilt')
+
+    def testTokenizeCorpus(self):
+        '''Test tokenizing a corpus into year shards.'''
+        corpusDir = os.path.join(self.tmpDir, 'corpus')
+        shardDir = os.path.join(self.tmpDir, 'corpusShards')
+        exampleFiles = sorted(
+            glob.glob('shico/kbTokenizer/example_files/*.txt'))
+        for year, exampleFile in zip([1950, 1951], exampleFiles):
+            os.makedirs(os.path.join(corpusDir, str(year)))
+            shutil.copy(exampleFile,
+                        os.path.join(corpusDir, str(year), 'doc.txt'))
+
+        manifest = build.tokenizeCorpus(corpusDir, shardDir, processes=2)
+        self.assertEqual(sorted(manifest.keys()), ['1950', '1951'],
+                         'A shard should be created for each year')
+        sentences = list(build.ShardSentences(shardDir, [1950]))
+        self.assertGreater(len(sentences), 0, 'Shard should have sentences')
+
+        before = os.path.getmtime(build.shardPath(shardDir, 1950))
+        build.tokenizeCorpus(corpusDir, shardDir, processes=2)
+        self.assertEqual(os.path.getmtime(build.shardPath(shardDir, 1950)),
+                         before, 'Unchanged years should not be tokenized')
+
+    def testBuildWarmStart(self):
+        '''Test warm started models are built, and rebuilt from the first
+        changed period onwards.'''
+        timings = build.buildModelsWarmStart(self.shardDir, self.modelDir,
+                                             yearsInModel=3,
+                                             w2vParams=self.w2vParams)
+        self.assertEqual(sorted(timings.keys()),
+                         ['1950_1952', '1951_1953', '1952_1954'],
+                         'A model should be built for each period')
+        vm = shVM(os.path.join(self.modelDir, '*.kv'), useCache=False,
+                  useMmap=True, w2vFormat=False)
+        self.assertEqual(vm.getAvailableYears(), sorted(timings.keys()),
+                         'VocabularyMonitor should load all models')
+
+        timings = build.buildModelsWarmStart(self.shardDir, self.modelDir,
+                                             yearsInModel=3,
+                                             w2vParams=self.w2vParams)
+        self.assertEqual(len(timings), 0, 'Nothing should be rebuilt')
+
+        shards = build._loadManifest(self.shardDir)
+        shards['1951']['checksum'] = build.writeShard(
+            self.shardDir, 1951, self._randomSentences(0))
+        build._saveManifest(self.shardDir, shards)
+        timings = build.buildModelsWarmStart(self.shardDir, self.modelDir,
+                                             yearsInModel=3,
+                                             w2vParams=self.w2vParams)
+        self.assertEqual(sorted(timings.keys()),
+                         ['1950_1952', '1951_1953', '1952_1954'],
+                         'All periods from 1951 onwards should be rebuilt')
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+from shico.server.compute import ComputePool, ComputeTimeout, \
+    ComputeQueueFull
+
+
+class ComputePoolTest(unittest.TestCase):
+    '''Tests for server compute pool.'''
+
+    def testRun(self):
+        '''Test that run returns the result of the function.'''
+        pool = ComputePool(maxWorkers=1)
+        self.assertEqual(pool.run('key', None, lambda x, y: x + y, 1, y=2), 3,
+                         'Should return the result of the function')
+        self.assertEqual(pool.status()['queued'], 0, 'Nothing should be queued')
+
+    def testErrors(self):
+        '''Test that exceptions of the function reach the caller.'''
+        pool = ComputePool(maxWorkers=1)
+
+        def fail():
+            raise KeyError('fail')
+        self.assertRaises(KeyError, pool.run, 'key', None, fail)
+
+    def testDeduplicate(self):
+        '''Test that identical requests in flight share one computation.'''
+        pool = ComputePool(maxWorkers=2)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait()
+            return len(calls)
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(pool.run('key', None, compute)))
+            for _ in range(5)]
+        for t in threads:
+            t.start()
+        while pool.status()['waiting'] < 5:
+            time.sleep(0.01)
+        self.assertEqual(pool.status()['running'], 1,
+                         'Only one computation should run')
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1, 'Function should only be called once')
+        self.assertEqual(results, [1] * 5, 'All requests should get a result')
+        status = pool.status()
+        self.assertEqual(status['requests'], 5, 'Should count all requests')
+        self.assertEqual(status['coalesced'], 4,
+                         'Should count requests sharing a computation')
+
+    def testTimeout(self):
+        '''Test that requests time out, and queued requests are cancelled.'''
+        pool = ComputePool(maxWorkers=1, maxQueued=1)
+        release = threading.Event()
+        blocker = threading.Thread(
+            target=lambda: pool.run('blocker', None, release.wait))
+        blocker.start()
+        while pool.status()['running'] < 1:
+            time.sleep(0.01)
+
+        calls = []
+        self.assertRaises(ComputeTimeout, pool.run, 'key', 0.05,
+                          calls.append, 1)
+        self.assertEqual(pool.status()['queued'], 0,
+                         'Timed out request should be cancelled')
+
+        queued = threading.Thread(
+            target=lambda: pool.run('queued', None, calls.append, 2))
+        queued.start()
+        while pool.status()['queued'] < 1:
+            time.sleep(0.01)
+        self.assertRaises(ComputeQueueFull, pool.run, 'other', None,
+                          calls.append, 3)
+
+        release.set()
+        blocker.join()
+        queued.join()
+        self.assertEqual(calls, [2], 'Only the queued request should run')
@@ -0,0 +1,43 @@
+import unittest
+import json
+import zlib
+import gzip
+import numpy as np
+from StringIO import StringIO
+
+from shico.server.encoding import encodeJSON, compress
+
+
+class EncodingTest(unittest.TestCase):
+
+    '''Tests for response encoding'''
+
+    def setUp(self):
+        self.data = {
+            'stream': {'1955': {'w1': np.float64(0.5), 'w2': 1.0}},
+            'embedded': {'1955': [{'word': u'w\xe9', 'x': 0.25, 'y': 0}]}
+        }
+
+    def testEncodeJSON(self):
+        '''Test that data is encoded as compact JSON.'''
+        body = encodeJSON(self.data)
+        self.assertEqual(json.loads(body), json.loads(json.dumps(self.data)),
+                         'Encoded JSON should contain the same data')
+        self.assertFalse('\n' in body, 'JSON should not be indented')
+
+    def testEncodeNumpy(self):
+        '''Test that NumPy arrays are encoded as lists.'''
+        body = encodeJSON({'a': np.array([1.0, 2.0])})
+        self.assertEqual(json.loads(body), {'a': [1.0, 2.0]},
+                         'Arrays should be encoded as lists')
+
+    def testCompress(self):
+        '''Test that compressed bodies can be decompressed.'''
+        body = encodeJSON(self.data)
+        gzipped = compress(body, 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(gzipped)).read(),
+                         body, 'gzip should decompress to the same body')
+        self.assertEqual(zlib.decompress(compress(body, 'deflate')), body,
+                         'deflate should decompress to the same body')
+        with self.assertRaises(ValueError):
+            compress(body, 'br')
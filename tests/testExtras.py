@@ -27,3 +27,26 @@ class ExtrasTest(unittest.TestCase):
                             'List with similar items should be changed')
         self.assertLess(len(cleanedList), len(withSimilars),
                         'Cleaned version should have less items')
+
+    def testCleanTermListBounds(self):
+        '''Test words are only compared when their lengths allow them to be
+        close.'''
+        # Distance 1 is close for words of 6 letters or more
+        terms = [('abcdef', 1), ('abcdefg', 2), ('abcde', 3), ('abcd', 4),
+                 ('xbcd', 5), ('abcdefgh', 6)]
+        self.assertEqual(cleanTermList(terms),
+                         [('abcdef', 1), ('abcde', 3), ('abcd', 4),
+                          ('xbcd', 5), ('abcdefgh', 6)],
+                         'Only words close to a kept word should be removed')
+
+    def testCleanTermListCopies(self):
+        '''Test cleaned lists can be changed without affecting later
+        results.'''
+        terms = [('alice', 0), ('alice', 0), ('bob', 0)]
+        cleanedList = cleanTermList(terms)
+        cleanedList.append(('charles', 0))
+        self.assertEqual(cleanTermList(terms), [('alice', 0), ('bob', 0)],
+                         'Cached result should not be changed')
+        self.assertEqual(cleanTermList([['alice', 0], ['bob', 0]]),
+                         [('alice', 0), ('bob', 0)],
+                         'Unhashable items should be cleaned too')
@@ -1,6 +1,8 @@
 import unittest
+import numpy as np
 from sortedcontainers import SortedDict
 from shico import format as fmt
+from shico.metrics import metrics
 
 
 class TestFormat(unittest.TestCase):
@@ -68,6 +70,33 @@ class TestFormat(unittest.TestCase):
                                  'and "value", but a link on %s does not'
                                  % year)
 
+    def testYearlyNetworkLinks(self):
+        '''Test network links point to the right nodes, and links to words
+        which are not nodes are counted as missing'''
+        links = SortedDict(self._links)
+        links['1950_1959'] = {'w1': [('w1', 0.0), ('w2', 1.0), ('x', 0.5)]}
+        metrics.enabled = True
+        metrics.reset()
+        try:
+            networks = fmt.yearlyNetwork(self._aggPeriods, self._aggVocab,
+                                         self._vocab, links)
+            rendered = metrics.render()
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+
+        net = networks['1954']
+        names = [node['name'] for node in net['nodes']]
+        self.assertEqual(sorted(names), ['w1', 'w2'],
+                         'Nodes should be the results and seeds')
+        self.assertEqual(sorted((names[link['source']], names[link['target']],
+                                 link['value']) for link in net['links']),
+                         [('w1', 'w1', 1.0), ('w1', 'w2', 0.5)],
+                         'Links should connect seeds to their results')
+        self.assertIn('shico_network_links_missing_total 1.0',
+                      rendered.splitlines(),
+                      'Link to word which is not a node should be counted')
+
     def testYearTuplesAsDict(self):
         '''Test converting tuple dictionary to nested dictionary'''
         dicts = fmt.yearTuplesAsDict(self._aggVocab)
@@ -88,3 +117,36 @@ class TestFormat(unittest.TestCase):
         self.assertEqual(sorted(d.keys()),
                          sorted(['word', 'x', 'y']),
                          'Should contain "word", "x" and "y"')
+
+    def testWordLocationsAsDicts(self):
+        '''Test creating word-location dictionaries in bulk'''
+        words = ['w1', 'w2']
+        locs = np.array([[0.5, 1.0], [np.nan, 2.0]])
+        dicts = fmt.wordLocationsAsDicts(words, locs)
+        self.assertEqual(dicts, [{'word': 'w1', 'x': 0.5, 'y': 1.0},
+                                 {'word': 'w2', 'x': 0.0, 'y': 2.0}],
+                         'Should contain one dictionary per word, with NaN '
+                         'locations replaced by 0')
+        self.assertIsInstance(dicts[0]['x'], float,
+                              'Locations should be Python floats')
+
+    def testColumnar(self):
+        '''Test conversion to and from the columnar format'''
+        networks = fmt.yearlyNetwork(self._aggPeriods, self._aggVocab,
+                                     self._vocab, self._links)
+        response = {
+            'stream': fmt.yearTuplesAsDict(self._aggVocab),
+            'networks': networks,
+            'embedded': {'1954': [{'word': 'w1', 'x': 0.5, 'y': 1.0},
+                                  {'word': 'w2', 'x': 0.0, 'y': 2.0}]},
+            'vocabs': self._links
+        }
+        columnar = fmt.asColumnar(response)
+        self.assertEqual(sorted(columnar['strings']),
+                         ['w%d' % i for i in range(1, 9)],
+                         'String table should contain every word once')
+        self.assertEqual(len(columnar['stream']['1954']['words']),
+                         len(columnar['stream']['1954']['weights']),
+                         'Words and weights should be parallel lists')
+        self.assertEqual(fmt.fromColumnar(columnar), response,
+                         'Converting back should produce the same response')
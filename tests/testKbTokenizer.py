@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import glob
+import random
+import unittest
+from shico.kbTokenizer.kbTokenizer import kbTokenizer
+
+
+class KbTokenizerTest(unittest.TestCase):
+    '''Tests for kbTokenizer.'''
+
+    @classmethod
+    def setUpClass(self):
+        self.tokenizer = kbTokenizer()
+        self.fusedTokenizer = kbTokenizer(bFused=True)
+        self.exampleFiles = sorted(
+            glob.glob('shico/kbTokenizer/example_files/*.txt'))
+
+    def testTokenizeFile(self):
+        '''Test that example files produce lists of tokens.'''
+        self.assertGreater(len(self.exampleFiles), 0,
+                           'Should have at least one example file')
+        for exampleFile in self.exampleFiles:
+            aTextTokens = self.tokenizer.tokenizeFile(exampleFile)
+            for aTokens in aTextTokens:
+                self.assertGreater(len(aTokens), 0,
+                                   'Sentences should not be empty')
+                for sToken in aTokens:
+                    self.assertEqual(sToken, sToken.lower(),
+                                     'Tokens should be lower case')
+
+    def testFusedExampleFiles(self):
+        '''Test that fused mode produces identical tokens on example files.'''
+        for exampleFile in self.exampleFiles:
+            self.assertEqual(self.fusedTokenizer.tokenizeFile(exampleFile),
+                             self.tokenizer.tokenizeFile(exampleFile),
+                             'Fused tokens differ on %s' % exampleFile)
+
+    def testFusedNonTokenChars(self):
+        '''Test that fused mode produces identical tokens on sentences full of
+        non-token characters.'''
+        rand = random.Random(0)
+        chars = list(u'aB1 _ª.πƒﬁﬂˆ,;-"\'\t\n ()#')
+        for _ in range(20000):
+            sString = u''.join(rand.choice(chars)
+                               for _ in range(rand.randint(0, 15)))
+            self.assertEqual(self.fusedTokenizer.tokenizeSentence(sString),
+                             self.tokenizer.tokenizeSentence(sString),
+                             'Fused tokens differ on %r' % sString)
+
+    def testFusedNoLowerCase(self):
+        '''Test that fused mode respects bLowerCase.'''
+        tokenizer = kbTokenizer(bLowerCase=False)
+        fusedTokenizer = kbTokenizer(bLowerCase=False, bFused=True)
+        sString = u'_Hello, (World)_. «Foo» bar_ ﬁ'
+        self.assertEqual(fusedTokenizer.tokenizeSentence(sString),
+                         tokenizer.tokenizeSentence(sString),
+                         'Fused tokens differ when not lower casing')
@@ -0,0 +1,108 @@
+import unittest
+import shutil
+import tempfile
+import threading
+from multiprocessing import Process
+from shico.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    '''Tests for metrics.'''
+
+    def testDisabled(self):
+        '''Test that nothing is recorded when metrics are disabled.'''
+        metrics = Metrics()
+        with metrics.timer('stage', stage='a'):
+            pass
+        metrics.increment('calls')
+        self.assertEqual(metrics.render(), '\n', 'Nothing should be recorded')
+
+    def testRender(self):
+        '''Test that recorded metrics are rendered in Prometheus format.'''
+        metrics = Metrics()
+        metrics.enabled = True
+        for _ in range(2):
+            with metrics.timer('stage', stage='a'):
+                pass
+        metrics.increment('calls', 3)
+        metrics.setGauge('size', 5, model='m1')
+        metrics.addCollector(lambda: [('ratio', {}, 0.5)])
+        lines = metrics.render().splitlines()
+
+        self.assertIn('# TYPE shico_stage_seconds summary', lines,
+                      'Timers should be summaries')
+        self.assertIn('shico_stage_seconds_count{stage="a"} 2.0', lines,
+                      'Timers should be counted')
+        self.assertIn('shico_calls_total 3.0', lines,
+                      'Counters should be rendered')
+        self.assertIn('shico_size{model="m1"} 5.0', lines,
+                      'Gauges should be rendered with labels')
+        self.assertIn('shico_ratio 0.5', lines,
+                      'Collected gauges should be rendered')
+
+    def testRequestTimings(self):
+        '''Test that timings are collected for a request even if metrics are
+        disabled.'''
+        metrics = Metrics()
+        with metrics.requestTimings() as timings:
+            with metrics.timer('stage', stage='a'):
+                pass
+            with metrics.timer('total'):
+                pass
+        self.assertEqual(sorted(timings.keys()), ['stage', 'total'],
+                         'Timings should be collected')
+        self.assertEqual(timings['stage'].keys(), ['a'],
+                         'Timings should be grouped by label')
+        self.assertEqual(metrics.render(), '\n',
+                         'Nothing should be recorded globally')
+
+    def testShareTimings(self):
+        '''Test that other threads can collect timings for a request.'''
+        metrics = Metrics()
+
+        def work(timings):
+            with metrics.shareTimings(timings):
+                with metrics.timer('period', period='p1'):
+                    pass
+
+        with metrics.requestTimings() as timings:
+            thread = threading.Thread(target=work,
+                                      args=(metrics.currentTimings(),))
+            thread.start()
+            thread.join()
+        self.assertEqual(timings.get('period', {}).keys(), ['p1'],
+                         'Timings of other threads should be collected')
+        self.assertIsNone(metrics.currentTimings(),
+                          'Timings should no longer be collected')
+
+    def testShareAcross(self):
+        '''Test that timers and counters are summed over the processes
+        sharing them.'''
+        shareDir = tempfile.mkdtemp()
+        try:
+            metrics = Metrics()
+            metrics.enabled = True
+            metrics.shareAcross(shareDir)
+            metrics.increment('calls', 2)
+            with metrics.timer('stage', stage='a'):
+                pass
+            metrics.save()
+
+            def record():
+                # As a forked worker does
+                metrics.reset()
+                metrics.increment('calls', 3)
+                with metrics.timer('stage', stage='a'):
+                    pass
+                metrics.save()
+            worker = Process(target=record)
+            worker.start()
+            worker.join()
+
+            lines = metrics.render().splitlines()
+            self.assertIn('shico_calls_total 5.0', lines,
+                          'Counters of all processes should be summed')
+            self.assertIn('shico_stage_seconds_count{stage="a"} 2.0', lines,
+                          'Timers of all processes should be summed')
+        finally:
+            shutil.rmtree(shareDir)
@@ -0,0 +1,128 @@
+import unittest
+import glob
+import shutil
+import tempfile
+import numpy as np
+
+from shico.neighbours import blockNeighbours, topNeighbours, saveNeighbours, \
+    loadNeighbours, NeighbourTable
+from shico.vocabularymonitor import VocabularyMonitor, \
+    NeighbourW2VModelEvaluator
+from shico.server.trackindex import modelSignature
+from benchmarks.synthetic import saveSyntheticModels
+
+
+class NeighboursTest(unittest.TestCase):
+
+    '''Tests for precomputed neighbours'''
+
+    def setUp(self):
+        self.modelDir = tempfile.mkdtemp()
+        self.globPattern = saveSyntheticModels(self.modelDir, vocabSize=300,
+                                               dim=20, nPeriods=2)
+        self.modelFiles = sorted(glob.glob(self.globPattern))
+
+    def tearDown(self):
+        shutil.rmtree(self.modelDir)
+
+    def _liveModel(self):
+        vm = VocabularyMonitor(self.globPattern, useCache=False,
+                               useMmap=False, w2vFormat=False, initSims=True)
+        return vm.getKeyedVectors(vm.getAvailableYears()[0])
+
+    def testTopNeighbours(self):
+        '''Test neighbours are the same as those found by most_similar.'''
+        wv = self._liveModel()
+        for processes, columnBlockSize in [(1, 65536), (2, 65536), (1, 32)]:
+            ids, sims = topNeighbours(wv.vectors_norm, K=10, nRows=50,
+                                      blockSize=16, processes=processes,
+                                      columnBlockSize=columnBlockSize)
+            self.assertEqual(ids.shape, (50, 10),
+                             'Neighbours should be found for 50 words')
+            self.assertEqual((ids.dtype, sims.dtype),
+                             (np.int32, np.float16),
+                             'Neighbours should be stored compactly')
+            for i in [0, 17, 49]:
+                live = wv.most_similar(wv.index2word[i], topn=10)
+                self.assertEqual([wv.index2word[j] for j in ids[i]],
+                                 [w for w, _ in live],
+                                 'Neighbours should match most_similar')
+                np.testing.assert_allclose(sims[i], [s for _, s in live],
+                                           atol=1e-3)
+
+    def testBlockNeighbours(self):
+        '''Test that a word is not its own neighbour.'''
+        vectors = np.eye(4)
+        ids, sims = blockNeighbours(vectors, 1, 3, 10)
+        self.assertEqual(ids.shape, (2, 3),
+                         'At most all other words should be neighbours')
+        self.assertFalse(1 in ids[0] or 2 in ids[1],
+                         'Words should not be their own neighbours')
+
+    def testModelSignature(self):
+        '''Test that indexes built with and without neighbours (or with other
+        neighbours) have different model signatures.'''
+        wv = self._liveModel()
+        ids, sims = topNeighbours(wv.vectors_norm, K=5, processes=1)
+        saveNeighbours(self.modelFiles[0], ids, sims)
+        plain = VocabularyMonitor(self.globPattern, useCache=False,
+                                  useMmap=False, w2vFormat=False)
+        vm = VocabularyMonitor(self.globPattern, useCache=False,
+                               useMmap=False, w2vFormat=False,
+                               useNeighbours=True)
+        signature = modelSignature(vm)
+        self.assertNotEqual(modelSignature(plain), signature,
+                            'Signature should record the use of neighbours')
+
+        # Regenerated with another K
+        ids, sims = topNeighbours(wv.vectors_norm, K=10, processes=1)
+        saveNeighbours(self.modelFiles[0], ids, sims)
+        vm = VocabularyMonitor(self.globPattern, useCache=False,
+                               useMmap=False, w2vFormat=False,
+                               useNeighbours=True)
+        self.assertNotEqual(modelSignature(vm), signature,
+                            'Signature should change with the neighbours')
+
+    def testTable(self):
+        '''Test that the table only answers queries it can answer.'''
+        wv = self._liveModel()
+        ids, sims = topNeighbours(wv.vectors_norm, K=10, nRows=50,
+                                  processes=1)
+        saveNeighbours(self.modelFiles[0], ids, sims)
+        ids, sims = loadNeighbours(self.modelFiles[0])
+        table = NeighbourTable(ids, sims, wv.index2word, wv.vocab)
+
+        self.assertEqual(len(table.most_similar(wv.index2word[0], 5)), 5,
+                         'Table should answer queries with topn <= K')
+        self.assertIsNone(table.most_similar(wv.index2word[0], 20),
+                          'Table cannot answer queries with topn > K')
+        self.assertIsNone(table.most_similar(wv.index2word[100], 5),
+                          'Table cannot answer queries on rare words')
+        self.assertIsNone(table.most_similar('unknown', 5),
+                          'Table cannot answer queries on unknown words')
+        self.assertIsNone(loadNeighbours(self.modelFiles[1]),
+                          'Model without neighbours should have no table')
+
+    def testVocabularyMonitor(self):
+        '''Test VocabularyMonitor uses stored neighbours, and falls back to the
+        model for other queries.'''
+        wv = self._liveModel()
+        ids, sims = topNeighbours(wv.vectors_norm, K=10, nRows=50,
+                                  processes=1)
+        saveNeighbours(self.modelFiles[0], ids, sims)
+
+        vm = VocabularyMonitor(self.globPattern, useCache=True,
+                               useMmap=True, w2vFormat=False,
+                               useNeighbours=True)
+        key = vm.getAvailableYears()[0]
+        self.assertIs(vm._models[key]._model.__class__,
+                      NeighbourW2VModelEvaluator,
+                      'Model with stored neighbours should use them')
+        for word, topn in [(wv.index2word[3], 10), (wv.index2word[3], 20),
+                           (wv.index2word[200], 10)]:
+            self.assertEqual(
+                [w for w, _ in vm._models[key].most_similar(word, topn)],
+                [w for w, _ in wv.most_similar(word, topn=topn)],
+                'Results should be the same as most_similar')
+        self.assertIs(vm.getKeyedVectors(key).__class__, wv.__class__,
+                      'KeyedVectors should be unwrapped')
@@ -0,0 +1,79 @@
+import unittest
+import pstats
+import shutil
+import tempfile
+
+from shico import VocabularyMonitor as shVM
+from shico.server.profiling import Profiler
+
+
+class ProfilingTest(unittest.TestCase):
+
+    '''Tests for request profiling'''
+
+    def setUp(self):
+        self.profileDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.profileDir)
+
+    def testRun(self):
+        '''Test that profiled functions return their result, and their profile
+        is stored.'''
+        profiler = Profiler(self.profileDir)
+        profileId, result = profiler.run(sorted, [3, 1, 2])
+        self.assertEqual(result, [1, 2, 3],
+                         'Profiled function should return its result')
+        self.assertEqual(profiler.listProfiles(), [profileId],
+                         'Profile should be stored')
+        self.assertTrue('sorted' in profiler.summary(profileId),
+                        'Summary should include profiled function')
+
+    def testWorkerThreads(self):
+        '''Test that work done by other threads on behalf of the profiled
+        function is included in its profile.'''
+        profiler = Profiler(self.profileDir)
+        for kwargs, params in [({}, {}),
+                               ({'periodWorkers': 2},
+                                {'algorithm': 'non-adaptive'}),
+                               ({'periodWorkers': 2, 'prefetchPeriods': 2},
+                                {})]:
+            vm = shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                      w2vFormat=True, **kwargs)
+            profileId, _ = profiler.run(vm.trackClouds, ['x', 'y'], **params)
+            stats = pstats.Stats(profiler.profilePath(profileId))
+            functions = set(name for _, _, name in stats.stats)
+            self.assertTrue('most_similar' in functions,
+                            'most_similar should be profiled for %s' % kwargs)
+
+    def testMissingProfile(self):
+        '''Test that unknown or invalid profile ids are not served.'''
+        profiler = Profiler(self.profileDir)
+        for profileId in ['20000101-000000-000000-0000', '../etc/passwd']:
+            self.assertIsNone(profiler.profilePath(profileId),
+                              'No path should exist for ' + profileId)
+            self.assertIsNone(profiler.summary(profileId),
+                              'No summary should exist for ' + profileId)
+
+    def testMaxProfiles(self):
+        '''Test that only the newest profiles are kept.'''
+        profiler = Profiler(self.profileDir, maxProfiles=2)
+        profileIds = [profiler.run(sum, [i])[0] for i in range(4)]
+        self.assertEqual(len(profiler.listProfiles()), 2,
+                         'Only 2 profiles should be kept')
+        self.assertTrue(profileIds[-1] in profiler.listProfiles(),
+                        'Newest profile should be kept')
+
+    def testToken(self):
+        '''Test that only requests with the right token are allowed.'''
+        profiler = Profiler(self.profileDir)
+        self.assertFalse(profiler.isAllowed(None) or
+                         profiler.isAllowed('guess'),
+                         'No request is allowed if there is no token')
+        profiler = Profiler(self.profileDir, token='secret')
+        self.assertTrue(profiler.isAllowed('secret'),
+                        'Requests with the right token are allowed')
+        self.assertFalse(profiler.isAllowed('guess'),
+                         'Requests with the wrong token are not allowed')
+        self.assertFalse(profiler.isAllowed(None),
+                         'Requests without token are not allowed')
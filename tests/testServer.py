@@ -1,8 +1,14 @@
 import unittest
 import json
+import shutil
+import gzip
+from StringIO import StringIO
+import tempfile
 import shico.server
 import shico.server.app
-from shico.server.utils import initApp
+from shico.server.utils import initApp, normalizeTerms
+from shico.server.profiling import Profiler
+from shico.format import fromColumnar
 
 class ServerTest(unittest.TestCase):
 
@@ -94,6 +100,146 @@ class ServerTest(unittest.TestCase):
             self.assertGreater(len(seedVocabs), 0,
                                'List should contain some seed-vocabulary dictionaries')
 
+    def testTrackCompression(self):
+        '''Test that /track responses are compressed when accepted.'''
+        plain = self.app.get('/track/x')
+        self.assertFalse('Content-Encoding' in plain.headers,
+                         'Response should not be compressed by default')
+        resp = self.app.get('/track/x', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip',
+                         'Response should be gzip compressed')
+        data = gzip.GzipFile(fileobj=StringIO(resp.data)).read()
+        self.assertEqual(json.loads(data), json.loads(plain.data),
+                         'Compressed response should contain the same data')
+
+    def testTrackColumnar(self):
+        '''Test that /track responses use the columnar format when asked.'''
+        plain = self.app.get('/track/x')
+        for resp in [self.app.get('/track/x?format=Columnar'),
+                     self.app.get('/track/x', headers={
+                         'Accept': 'application/vnd.shico.columnar+json'})]:
+            self.assertEqual(resp.mimetype,
+                             'application/vnd.shico.columnar+json',
+                             'Response should be in columnar format')
+            columnar = json.loads(resp.data)
+            converted = json.loads(json.dumps(fromColumnar(columnar)))
+            self.assertEqual(converted, json.loads(plain.data),
+                             'Columnar response should contain the same data')
+            self.assertLess(len(resp.data), len(plain.data),
+                            'Columnar response should be smaller')
+
+        resp = self.app.get('/track/x', headers={'Accept': '*/*'})
+        self.assertEqual(resp.mimetype, 'application/json',
+                         'Default format should be used unless asked')
+
+    def testTrackTimings(self):
+        '''Test that /track reports timings when requested.'''
+        resp = self.app.get('/track/x?timings=Yes')
+        respJson = json.loads(resp.data)
+        self.assertTrue('timings' in respJson,
+                        'Response should include timings')
+        for stage in ['trackClouds', 'aggregate', 'yearlyNetwork',
+                      'doSpaceEmbedding']:
+            self.assertTrue(stage in respJson['timings']['stage'],
+                            'Timings should include ' + stage)
+        self.assertGreater(len(respJson['timings']['period']), 0,
+                           'Timings should include periods')
+
+        resp = self.app.get('/track/x')
+        self.assertFalse('timings' in json.loads(resp.data),
+                         'Timings should only be included when requested')
+
+    def testTrackStopped(self):
+        '''Test that /track says where tracking stopped early.'''
+        resp = self.app.get('/track/x?minOverlap=0.99')
+        respJson = json.loads(resp.data)
+        self.assertIsNotNone(respJson.get('stopped'),
+                             'Tracking should stop when terms change')
+        self.assertEqual(respJson['stopped']['rule'], 'minOverlap',
+                         'Response should say which rule stopped tracking')
+        self.assertEqual(sorted(respJson['vocabs'].keys())[-1],
+                         respJson['stopped']['key'],
+                         'No period should be tracked after stopping')
+
+        resp = self.app.get('/track/x?minAvgSim=-1')
+        self.assertIsNone(json.loads(resp.data)['stopped'],
+                          'Tracking should not stop if no rule is met')
+        # The rule is met on the second period, which is the last one
+        resp = self.app.get('/track/x?minOverlap=0.99&endKey=1952_1961')
+        respJson = json.loads(resp.data)
+        self.assertEqual(sorted(respJson['vocabs'].keys())[-1], '1951_1960',
+                         'All selected periods should be tracked')
+        self.assertIsNone(respJson['stopped'],
+                          'Rule met on the last period is not stopping')
+        resp = self.app.get('/track/x')
+        self.assertFalse('stopped' in json.loads(resp.data),
+                         'Response should not include stopped without rules')
+
+    def testMetrics(self):
+        '''Test /metrics is only served when metrics are enabled.'''
+        resp = self.app.get('/metrics')
+        self.assertEqual(resp.status_code, 404,
+                         'Metrics should not be served when disabled')
+
+    def testProfiling(self):
+        '''Test /track requests are profiled when asked to and allowed.'''
+        resp = self.app.get('/profiles')
+        self.assertEqual(resp.status_code, 404,
+                         'Profiles should not be served when disabled')
+        resp = self.app.get('/track/x', headers={'X-Shico-Profile': 'x'})
+        self.assertFalse('X-Shico-Profile-Id' in resp.headers,
+                         'Requests should not be profiled when disabled')
+
+        app = shico.server.app.app
+        profileDir = tempfile.mkdtemp()
+        app.config['profiler'] = Profiler(profileDir, token='secret')
+        try:
+            resp = self.app.get('/track/x',
+                                headers={'X-Shico-Profile': 'guess'})
+            self.assertEqual(resp.status_code, 403,
+                             'Wrong token should not be allowed')
+
+            header = {'X-Shico-Profile': 'secret'}
+            resp = self.app.get('/track/x', headers=header)
+            self.assertEqual(resp.status_code, 200,
+                             'Profiled request should succeed')
+            profileId = resp.headers['X-Shico-Profile-Id']
+            resp = self.app.get('/profiles', headers=header)
+            self.assertEqual(json.loads(resp.data)['profiles'], [profileId],
+                             'Profile should be listed')
+            resp = self.app.get('/profiles/' + profileId, headers=header)
+            self.assertTrue('trackClouds' in resp.data,
+                            'Profile summary should include trackClouds')
+            resp = self.app.get('/profiles/' + profileId + '?raw=Yes',
+                                headers=header)
+            self.assertEqual(resp.status_code, 200,
+                             'Raw profile should be served')
+            resp = self.app.get('/profiles/' + profileId)
+            self.assertEqual(resp.status_code, 403,
+                             'Profiles should require the token')
+        finally:
+            app.config['profiler'] = None
+            shutil.rmtree(profileDir)
+
+    def testNormalizeTerms(self):
+        '''Test that equivalent term lists are normalized to the same list.'''
+        normalize = normalizeTerms
+        self.assertEqual(normalize('b, A,a,'), ['a', 'b'],
+                         'Terms should be unique, sorted and lower case')
+        self.assertEqual(normalize('a,b'), normalize('B ,a'),
+                         'Equivalent term lists should be the same')
+
+    def testStatus(self):
+        '''Test calls to /status. Response should be valid JSON.'''
+        resp = self.app.get('/status')
+
+        self.assertEqual(resp.status_code, 200,
+                         'Response should be code 200')
+        respJson = json.loads(resp.data)
+        for key in ['queued', 'running', 'waiting', 'requests', 'coalesced']:
+            self.assertTrue(key in respJson['compute'],
+                            '"' + key + '" should be a key in the response')
+
     def testAppData(self):
         '''Test calls to /load-settings. Response should be valid JSON.'''
         resp = self.app.get('/load-settings')
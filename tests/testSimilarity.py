@@ -0,0 +1,114 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from shico.similarity import topSimilar, vectorNorms
+from shico.vocabularymonitor import VocabularyMonitor, \
+    BlockedW2VModelEvaluator
+
+
+class SimilarityTest(unittest.TestCase):
+
+    '''Tests for memory bounded similarity queries'''
+
+    @classmethod
+    def setUpClass(self):
+        rng = np.random.RandomState(0)
+        self.vectors = rng.randn(1000, 20).astype(np.float32)
+        self.norms = np.sqrt((self.vectors ** 2).sum(axis=1))
+        self.unit = self.vectors / self.norms[:, np.newaxis]
+
+    def _expected(self, queries, topn):
+        sims = queries.dot(self.unit.T)
+        ids = np.argsort(-sims, axis=1)[:, :topn]
+        return ids, sims[np.arange(len(queries))[:, np.newaxis], ids]
+
+    def testTopSimilar(self):
+        '''Test results do not depend on the block size.'''
+        queries = self.unit[[3, 500, 999]]
+        expectedIds, expectedSims = self._expected(queries, 10)
+        for blockSize in [1, 7, 10, 256, 5000]:
+            ids, sims = topSimilar(self.unit, queries, 10,
+                                   blockSize=blockSize)
+            np.testing.assert_array_equal(ids, expectedIds)
+            np.testing.assert_allclose(sims, expectedSims, atol=1e-6)
+
+    def testNorms(self):
+        '''Test unnormalized vectors are normalized per block.'''
+        norms = vectorNorms(self.vectors, blockSize=64)
+        np.testing.assert_allclose(norms, self.norms, rtol=1e-5)
+        queries = self.unit[[3, 500]]
+        expectedIds, expectedSims = self._expected(queries, 10)
+        ids, sims = topSimilar(self.vectors, queries, 10, norms=norms,
+                               blockSize=64)
+        np.testing.assert_array_equal(ids, expectedIds)
+        np.testing.assert_allclose(sims, expectedSims, atol=1e-6)
+
+    def testExclude(self):
+        '''Test excluded rows are not returned.'''
+        ids, sims = topSimilar(self.unit, self.unit[[3, 500]], 5,
+                               exclude=[[3], [500, 3]], blockSize=64)
+        self.assertFalse(3 in ids[0], 'Excluded row should not be returned')
+        self.assertFalse(500 in ids[1] or 3 in ids[1],
+                         'Excluded rows should not be returned')
+
+        ids, sims = topSimilar(self.unit[:4], self.unit[[0]], 10,
+                               exclude=[[0]], blockSize=3)
+        self.assertEqual(ids.shape, (1, 4),
+                         'At most all rows should be returned')
+        self.assertEqual(sims[0, -1], -np.inf,
+                         'Excluded row should be last, with similarity -inf')
+
+    def testMmap(self):
+        '''Test vectors can be scanned memory mapped.'''
+        tmpDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpDir, 'vectors.npy')
+            np.save(path, self.vectors)
+            vectors = np.load(path, mmap_mode='r')
+            norms = vectorNorms(vectors, blockSize=100)
+            ids, _ = topSimilar(vectors, self.unit[[3]], 10, norms=norms,
+                                blockSize=100)
+            expectedIds, _ = self._expected(self.unit[[3]], 10)
+            np.testing.assert_array_equal(ids, expectedIds)
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def testVocabularyMonitor(self):
+        '''Test VocabularyMonitor finds the same terms by scanning in
+        blocks.'''
+        vm = VocabularyMonitor('tests/gensimModels/*.w2v', useCache=False,
+                               useMmap=True, w2vFormat=False)
+        vmBlocked = VocabularyMonitor('tests/gensimModels/*.w2v',
+                                      useCache=False, useMmap=True,
+                                      w2vFormat=False, similarityBlockSize=7)
+        key = vm.getAvailableYears()[0]
+        self.assertIs(vmBlocked._models[key].__class__,
+                      BlockedW2VModelEvaluator,
+                      'Models should be scanned in blocks')
+        wv = vm.getKeyedVectors(key)
+        for word in wv.index2word[:10]:
+            expected = vm._models[key].most_similar(word, topn=10)
+            found = vmBlocked._models[key].most_similar(word, topn=10)
+            self.assertEqual([w for w, _ in found], [w for w, _ in expected],
+                             'Same terms should be found as most_similar')
+            np.testing.assert_allclose([s for _, s in found],
+                                       [s for _, s in expected], atol=1e-5)
+        with self.assertRaises(KeyError):
+            vmBlocked._models[key].most_similar('unknown', topn=10)
+
+        seeds = wv.index2word[:2]
+        terms, links = vm.trackClouds(seeds)
+        blockedTerms, blockedLinks = vmBlocked.trackClouds(seeds)
+        self.assertEqual(blockedTerms, terms,
+                         'Tracking should find the same terms')
+        for key, seedLinks in links.iteritems():
+            for seed, pairs in seedLinks.iteritems():
+                blockedPairs = blockedLinks[key][seed]
+                self.assertEqual([w for w, _ in blockedPairs],
+                                 [w for w, _ in pairs],
+                                 'Tracking should find the same links')
+                np.testing.assert_allclose([s for _, s in blockedPairs],
+                                           [s for _, s in pairs], atol=1e-5)
@@ -0,0 +1,116 @@
+import unittest
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from shico.scripts.times_parsing import iterArticles_fast, convertYears
+
+_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<issue>
+  <page>
+    <article>
+      <text>
+        <text.title><p>%(title)s</p></text.title>
+        <text.cr><p>First   paragraph &amp; more</p></text.cr>
+        <text.cr><p>Second paragraph</p></text.cr>
+      </text>
+    </article>
+    <article>
+      <text>
+        <text.cr><p>Untitled</p></text.cr>
+      </text>
+    </article>
+  </page>
+</issue>
+'''
+
+
+class TimesParsingTest(unittest.TestCase):
+
+    '''Tests for conversion of Times XML files to CSV'''
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.origPath = os.path.join(self.tmpDir, 'orig')
+        self.savePath = os.path.join(self.tmpDir, 'save')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def _writeXML(self, year, name, title):
+        yearPath = os.path.join(self.origPath, year)
+        if not os.path.exists(yearPath):
+            os.makedirs(yearPath)
+        path = os.path.join(yearPath, name)
+        with open(path, 'w') as fout:
+            fout.write(_xml % {'title': title})
+        return path
+
+    def _readRows(self, year):
+        with gzip.open(os.path.join(self.savePath, year + '.csv.gz')) as fin:
+            return list(csv.reader(fin))
+
+    def testIterArticles(self):
+        '''Test that articles are read with their title and body text.'''
+        path = self._writeXML('1950', '0FFO-1950-0101.xml', 'A   title')
+        self.assertEqual(list(iterArticles_fast(path)),
+                         [('A title',
+                           'First paragraph & more Second paragraph'),
+                          ('', 'Untitled')],
+                         'Articles should be read in order')
+
+    def testConvertYears(self):
+        '''Test that converted files are skipped, and new files appended.'''
+        self._writeXML('1950', '0FFO-1950-0101.xml', 'First')
+        self.assertEqual(convertYears(['1950'], self.origPath, self.savePath,
+                                      processes=1), 1,
+                         'File should be converted')
+        rows = self._readRows('1950')
+        self.assertEqual(rows[0], ['Source', 'Title', 'Content'],
+                         'CSV should start with its header')
+        self.assertEqual([row[1] for row in rows[1:]], ['First', ''],
+                         'Every article should be a row')
+
+        self.assertEqual(convertYears(['1950'], self.origPath, self.savePath,
+                                      processes=1), 0,
+                         'Converted files should be skipped')
+        self.assertEqual(self._readRows('1950'), rows,
+                         'Rows should not be appended again')
+
+        self._writeXML('1950', '0FFO-1950-0102.xml', 'Second')
+        self.assertEqual(convertYears(['1950'], self.origPath, self.savePath,
+                                      processes=1), 1,
+                         'Only the new file should be converted')
+        self.assertEqual([row[1] for row in self._readRows('1950')[1:]],
+                         ['First', '', 'Second', ''],
+                         'Rows of the new file should be appended')
+
+    def testInterruptedConversion(self):
+        '''Test that rows appended before an interruption (before saving the
+        manifest) are not appended twice.'''
+        self._writeXML('1950', '0FFO-1950-0101.xml', 'First')
+        convertYears(['1950'], self.origPath, self.savePath, processes=1)
+        manifestFile = os.path.join(self.savePath, 'manifest.json')
+        with open(manifestFile) as fin:
+            manifest = json.load(fin)
+
+        self._writeXML('1950', '0FFO-1950-0102.xml', 'Second')
+        self._writeXML('1951', '0FFO-1951-0101.xml', 'Other')
+        convertYears(['1950', '1951'], self.origPath, self.savePath,
+                     processes=1)
+        # As if interrupted after appending rows, before saving the manifest
+        with open(manifestFile, 'w') as fout:
+            json.dump(manifest, fout)
+
+        self.assertEqual(convertYears(['1950', '1951'], self.origPath,
+                                      self.savePath, processes=1), 2,
+                         'Unrecorded files should be converted again')
+        self.assertEqual([row[1] for row in self._readRows('1950')[1:]],
+                         ['First', '', 'Second', ''],
+                         'Rows should not be duplicated')
+        self.assertEqual([row[1] for row in self._readRows('1951')[1:]],
+                         ['Other', ''],
+                         'Rows should not be duplicated')
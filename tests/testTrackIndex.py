@@ -0,0 +1,171 @@
+import unittest
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import shico.server.app
+from shico.vocabularymonitor import VocabularyMonitor
+from shico.server.app import _trackPipeline
+from shico.server.trackindex import TrackIndex, modelSignature, trackTerms, \
+    loadConcepts, loadPresets
+from shico.server.utils import initApp, initParamParser, normalizeTerms, \
+    warmTrackIndex
+
+
+class TrackIndexTest(unittest.TestCase):
+
+    '''Tests for the index of precomputed trackClouds results'''
+    @classmethod
+    def setUpClass(self):
+        self._vm = VocabularyMonitor('tests/w2vModels/*.w2v', binary=True,
+                                     useMmap=False, w2vFormat=True)
+        with shico.server.app.app.test_request_context('/track/x'):
+            self._params = initParamParser().parse_args()
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, 'index.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testSaveLoad(self):
+        '''Test indexed results are the same as those of trackClouds, after
+        saving and loading the index.'''
+        index = TrackIndex(modelSignature(self._vm), None, self.path)
+        index.build(self._vm, None, [['x']], [self._params])
+        index.save()
+
+        loaded = TrackIndex.load(self.path)
+        self.assertEqual(loaded.signature, modelSignature(self._vm),
+                         'Index should record the models it was built on')
+        self.assertEqual(loaded.get(['x'], self._params),
+                         trackTerms(self._vm, None, ['x'], self._params),
+                         'Indexed results should be those of trackClouds')
+        self.assertIsNone(loaded.get(['y'], self._params),
+                          'Terms which were not indexed should be a miss')
+        self.assertIsNone(loaded.get(['x'], dict(self._params, maxTerms=5)),
+                          'Parameters which were not indexed should be a miss')
+
+    def testReload(self):
+        '''Test that an index only loads entries built on the same models, and
+        picks up changes to its file.'''
+        index = TrackIndex(modelSignature(self._vm), None, self.path,
+                           checkInterval=0)
+        self.assertFalse(index.reload(), 'Missing index cannot be loaded')
+
+        stale = TrackIndex([['1950_1959', 'old.w2v', 1, 1]], None, self.path)
+        stale.build(self._vm, None, [['x']], [self._params])
+        stale.save()
+        self.assertFalse(index.reload(),
+                         'Index built on other models should not be loaded')
+        self.assertEqual(len(index), 0, 'Index should remain empty')
+
+        built = TrackIndex(modelSignature(self._vm), None, self.path)
+        built.build(self._vm, None, [['x']], [self._params])
+        built.save()
+        # Make sure the change is noticed on file systems with coarse times
+        os.utime(self.path, (0, 0))
+        self.assertIsNotNone(index.get(['x'], self._params),
+                             'Index should be reloaded when its file changes')
+
+    def testCheckInterval(self):
+        '''Test that lookups only check the index file once per interval.'''
+        index = TrackIndex(modelSignature(self._vm), None, self.path,
+                           checkInterval=3600)
+        self.assertIsNone(index.get(['x'], self._params),
+                          'Missing index should be a miss')
+        built = TrackIndex(modelSignature(self._vm), None, self.path)
+        built.build(self._vm, None, [['x']], [self._params])
+        built.save()
+        self.assertIsNone(index.get(['x'], self._params),
+                          'Index file should not be checked again yet')
+        self.assertTrue(index.reload(),
+                        'Explicit reload should pick up the change')
+        self.assertIsNotNone(index.get(['x'], self._params),
+                             'Reloaded entries should be found')
+
+    def testWarm(self):
+        '''Test that warming rebuilds and saves the index.'''
+        index = TrackIndex(modelSignature(self._vm), None, self.path)
+        index.warm(self._vm, None, [['x']], [self._params]).join()
+        self.assertFalse(index.status()['warming'],
+                         'Index should not be warming any more')
+        self.assertEqual(index.status()['entries'], 1,
+                         'Index should contain the warmed concept')
+        self.assertTrue(os.path.exists(self.path), 'Index should be saved')
+        self.assertTrue(index.isCurrent(), 'Warmed index should be current')
+
+        other = TrackIndex(modelSignature(self._vm), None, self.path)
+        self.assertIsNone(other.warm(self._vm, None, [['x']],
+                                     [self._params]),
+                          'Index which is up to date should not be warmed')
+        self.assertEqual(len(other), 1,
+                         'Saved index should be loaded instead')
+
+    def testWarmOnce(self):
+        '''Test that an index being warmed by another process is not warmed
+        again.'''
+        index = TrackIndex(modelSignature(self._vm), None, self.path)
+        with open(self.path + '.lock', 'a') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            # Lock is held by another open file (e.g. another process)
+            self.assertIsNone(index.warm(self._vm, None, [['x']],
+                                         [self._params]),
+                              'Index should not be warmed twice')
+        index.warm(self._vm, None, [['x']], [self._params]).join()
+        self.assertEqual(len(index), 1,
+                         'Index should be warmed once the lock is free')
+
+    def testInitAppNoThreads(self):
+        '''Test that initApp starts no threads (it may run in a process which
+        forks workers), and the index is warmed by warmTrackIndex.'''
+        conceptsFile = os.path.join(self.tmpDir, 'concepts.txt')
+        with open(conceptsFile, 'w') as fout:
+            fout.write('x\n')
+        before = set(threading.enumerate())
+        app = shico.server.app.app
+        initApp(app, 'tests/w2vModels/*.w2v', True, False, True, None,
+                trackIndexPath=self.path, trackIndexConcepts=conceptsFile)
+        self.assertEqual(set(threading.enumerate()) - before, set(),
+                         'initApp should not start threads')
+        warmTrackIndex(app).join()
+        self.assertTrue(os.path.exists(self.path), 'Index should be saved')
+        self.assertIsNone(warmTrackIndex(app),
+                          'Index which is up to date should not be warmed')
+
+    def testPipeline(self):
+        '''Test that responses computed from the index are the same as live
+        responses.'''
+        index = TrackIndex(modelSignature(self._vm), None)
+        index.build(self._vm, None, [['x']], [self._params])
+        live = _trackPipeline(self._vm, None, ['x'], self._params)
+        for _ in range(2):
+            indexed = _trackPipeline(self._vm, None, ['x'], self._params,
+                                     index)
+            self.assertEqual(json.dumps(indexed, sort_keys=True),
+                             json.dumps(live, sort_keys=True),
+                             'Indexed response should equal live response')
+
+    def testLoadConceptsPresets(self):
+        '''Test reading concepts and parameter presets.'''
+        conceptsFile = os.path.join(self.tmpDir, 'concepts.txt')
+        with open(conceptsFile, 'w') as fout:
+            fout.write('Labour, work\n\ncolony\n')
+        self.assertEqual(loadConcepts(conceptsFile, normalizeTerms),
+                         [['labour', 'work'], ['colony']],
+                         'Concepts should be normalized, one per line')
+
+        presetsFile = os.path.join(self.tmpDir, 'presets.json')
+        with open(presetsFile, 'w') as fout:
+            json.dump([{}, {'algorithm': 'Non-adaptive', 'maxTerms': 20}],
+                      fout)
+        presets = loadPresets(presetsFile, initParamParser())
+        self.assertEqual(presets[0], self._params,
+                         'Missing parameters should take default values')
+        self.assertEqual((presets[1]['algorithm'], presets[1]['maxTerms']),
+                         ('non-adaptive', 20),
+                         'Parameters should be validated like requests')
@@ -0,0 +1,120 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from gensim.models import KeyedVectors
+
+from shico.extras import cleanTermList
+from shico.neighbours import topNeighbours
+from shico.variants import variantClusters, saveVariants, loadVariants, \
+    variantsPath, VariantTable
+from shico.vocabularymonitor import VocabularyMonitor
+from shico.server.trackindex import modelSignature
+
+
+class VariantsTest(unittest.TestCase):
+
+    '''Tests for precomputed spelling variants'''
+
+    def setUp(self):
+        # Variants of a word have (nearly) the same vector
+        words = ['amsterdam', 'rotterdam', 'amsterdan', 'parijs',
+                 'amstcrdam', 'haven', 'paryjs', 'schip']
+        bases = {'amsterdam': 0, 'amsterdan': 0, 'amstcrdam': 0,
+                 'rotterdam': 1, 'parijs': 2, 'paryjs': 2, 'haven': 3,
+                 'schip': 4}
+        rng = np.random.RandomState(0)
+        vectors = np.eye(8)[[bases[w] for w in words]] + \
+            rng.rand(len(words), 8) * 0.01
+        self.wv = KeyedVectors(8)
+        self.wv.add(words, vectors.astype(np.float32))
+        self.wv.init_sims()
+        self.modelDir = tempfile.mkdtemp()
+        self.modelFile = os.path.join(self.modelDir, '1950_1959.kv')
+        self.wv.save(self.modelFile)
+
+    def tearDown(self):
+        shutil.rmtree(self.modelDir)
+
+    def _canonical(self):
+        ids, sims = topNeighbours(self.wv.vectors_norm, K=3, processes=1)
+        return variantClusters(self.wv.index2word, ids, sims)
+
+    def testClusters(self):
+        '''Test variants are mapped to the most frequent variant.'''
+        canonical = self._canonical()
+        index2word = self.wv.index2word
+        found = {word: index2word[canonical[i]]
+                 for i, word in enumerate(index2word)}
+        self.assertEqual(found['amsterdan'], 'amsterdam',
+                         'Variant should map to the most frequent variant')
+        self.assertEqual(found['amstcrdam'], 'amsterdam',
+                         'Variant should map to the most frequent variant')
+        self.assertEqual(found['paryjs'], 'parijs',
+                         'Variant should map to the most frequent variant')
+        self.assertEqual(found['rotterdam'], 'rotterdam',
+                         'Similar spelling alone does not make a variant')
+        self.assertEqual(found['haven'], 'haven',
+                         'Words without variants should map to themselves')
+
+    def testClean(self):
+        '''Test cleaning keeps the first variant of every group.'''
+        table = VariantTable(self._canonical(), self.wv.vocab)
+        terms = [('amstcrdam', 0.9), ('rotterdam', 0.8), ('amsterdam', 0.7),
+                 ('unknown', 0.6), ('paryjs', 0.5), ('unknown', 0.4)]
+        self.assertEqual(table.clean(terms),
+                         [('amstcrdam', 0.9), ('rotterdam', 0.8),
+                          ('unknown', 0.6), ('paryjs', 0.5)],
+                         'Only the first variant should be kept')
+        self.assertEqual(table.clean(terms), cleanTermList(terms),
+                         'Cleaning should agree with cleanTermList')
+
+    def testVocabularyMonitor(self):
+        '''Test VocabularyMonitor cleans with stored variants.'''
+        self.assertIsNone(loadVariants(self.modelFile),
+                          'Model without variants should have no table')
+        saveVariants(self.modelFile, self._canonical())
+
+        calls = []
+
+        def cleaning(termList):
+            calls.append(termList)
+            return termList
+
+        vm = VocabularyMonitor(os.path.join(self.modelDir, '*.kv'),
+                               useCache=False, w2vFormat=False,
+                               useVariants=True)
+        terms, _ = vm.trackClouds('amsterdam', maxTerms=10, maxRelatedTerms=5,
+                                  cleaningFunction=cleaning)
+        words = [word for word, _ in terms['1950_1959']]
+        self.assertEqual(len(calls), 0,
+                         'Cleaning function should not be called')
+        # Only the first variant found for the seed is kept
+        self.assertIn('amsterdan', words, 'First variant should be kept')
+        self.assertNotIn('amstcrdam', words, 'Variants should be removed')
+
+        terms, _ = vm.trackClouds('amsterdam', maxTerms=10, maxRelatedTerms=5)
+        words = [word for word, _ in terms['1950_1959']]
+        self.assertIn('amstcrdam', words,
+                      'Variants should be kept when not cleaning')
+
+    def testModelSignature(self):
+        '''Test that indexes built with and without variants (or with other
+        variants) have different model signatures.'''
+        saveVariants(self.modelFile, self._canonical())
+        pattern = os.path.join(self.modelDir, '*.kv')
+        plain = VocabularyMonitor(pattern, useCache=False, w2vFormat=False)
+        withVariants = VocabularyMonitor(pattern, useCache=False,
+                                         w2vFormat=False, useVariants=True)
+        signature = modelSignature(withVariants)
+        self.assertNotEqual(modelSignature(plain), signature,
+                            'Signature should record the use of variants')
+
+        # Regenerated variants (at another time)
+        saveVariants(self.modelFile, self._canonical())
+        os.utime(variantsPath(self.modelFile), (0, 0))
+        withVariants = VocabularyMonitor(pattern, useCache=False,
+                                         w2vFormat=False, useVariants=True)
+        self.assertNotEqual(modelSignature(withVariants), signature,
+                            'Signature should change with the variants file')
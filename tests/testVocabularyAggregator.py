@@ -110,6 +110,34 @@ class TestVocabularyAggregation(unittest.TestCase):
         self.assertGreater(len(times1), len(times2),
                            'Should have more intervals')
 
+    def testIterAggregate(self):
+        '''Test aggregating period by period gives the same results as
+        aggregating all periods at once'''
+        for yearsInInterval, freq in [(1, 1), (2, 1), (2, 2), (3, 1), (3, 2),
+                                      (4, None), (6, None)]:
+            agg = shVA(yearsInInterval=yearsInInterval, yIntervalFreq=freq)
+            data, times = agg.aggregate(self._data)
+            windows = list(agg.iterAggregate(self._data.iteritems()))
+            self.assertEqual([key for key, _, _ in windows], list(data.keys()),
+                             'Should produce the same intervals')
+            for key, words, periods in windows:
+                self.assertEqual(words, data[key],
+                                 'Should produce the same vocabularies')
+                self.assertEqual(periods, list(times[key]),
+                                 'Should aggregate the same years')
+
+    def testIncremental(self):
+        '''Test aggregated vocabularies are returned as soon as their periods
+        are in'''
+        agg = shVA(yearsInInterval=2).incremental()
+        keys = list(self._data.keys())
+        self.assertEqual(agg.add(keys[0], self._data[keys[0]]), [],
+                         'Interval should not be complete')
+        self.assertEqual(len(agg.add(keys[1], self._data[keys[1]])), 1,
+                         'Interval should be complete')
+        with self.assertRaises(ValueError):
+            agg.add(keys[0], self._data[keys[0]])
+
     def testArrangeIntervals1(self):
         targetKeys = SortedList(['1950_1959', '1951_1960', '1952_1961', '1953_1962', '1954_1963'])
         targetIntervals = [ ['1950_1959', '1951_1960', '1952_1961'],
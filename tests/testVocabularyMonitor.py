@@ -1,6 +1,8 @@
 import gensim
 
 from shico import VocabularyMonitor as shVM
+from shico.vocabularymonitor import StopCriteria
+from shico.metrics import metrics
 
 from vocabularyMonitorHelper import VocabularyMonitorBase
 
@@ -25,3 +27,160 @@ class VocabularyMonitorTest(VocabularyMonitorBase):
         for label, model in self.vm._models.iteritems():
             self.assertIsInstance(model, gensim.models.keyedvectors.KeyedVectors,
                                   'Object should be a Word2Vec model')
+
+    def testPeriodWorkers(self):
+        '''Test that tracking periods at the same time gives the same results
+        as tracking them one after another.'''
+        vm = shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                  w2vFormat=True, periodWorkers=4)
+        for kwargs in [{}, {'forwards': False},
+                       {'startKey': '1952_1961', 'endKey': '1957_1966'}]:
+            expected = self.vm.trackClouds(['x', 'y'],
+                                           algorithm='non-adaptive', **kwargs)
+            found = vm.trackClouds(['x', 'y'], algorithm='non-adaptive',
+                                   **kwargs)
+            self.assertEqual(found, expected,
+                             'Results should not depend on periodWorkers')
+            self.assertEqual(found[0].keys(), expected[0].keys(),
+                             'Periods should be in the same order')
+
+    def testPrefetch(self):
+        '''Test that speculative queries do not change results, and are
+        counted.'''
+        vm = shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                  w2vFormat=True, periodWorkers=2, prefetchPeriods=2)
+        metrics.reset()
+        metrics.enabled = True
+        try:
+            for kwargs in [{}, {'forwards': False}, {'sumSimilarity': True}]:
+                expected = self.vm.trackClouds(['x', 'y'], **kwargs)
+                found = vm.trackClouds(['x', 'y'], **kwargs)
+                self.assertEqual(found, expected,
+                                 'Results should not depend on prefetching')
+            rendered = metrics.render()
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+        self.assertIn('shico_speculative_queries_total{result="hit"}',
+                      rendered, 'Speculative queries should be used')
+        self.assertIn('shico_speculative_queries_total{result="miss"}',
+                      rendered, 'Queries not prefetched should be counted')
+        with self.assertRaises(ValueError):
+            shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                 w2vFormat=True, prefetchPeriods=2)
+
+    def testFillCleaned(self):
+        '''Test that more terms are fetched when cleaning removes some.'''
+        def dropHalf(termList):
+            return termList[::2]
+
+        _, links = self.vm.trackClouds(['x'], maxRelatedTerms=6, minSim=-1,
+                                       algorithm='non-adaptive',
+                                       cleaningFunction=dropHalf)
+        _, filledLinks = self.vm.trackClouds(['x'], maxRelatedTerms=6,
+                                             minSim=-1,
+                                             algorithm='non-adaptive',
+                                             cleaningFunction=dropHalf,
+                                             fillCleaned=True)
+        for key in links:
+            # Links include the seed itself
+            related = links[key]['x'][1:]
+            filled = filledLinks[key]['x'][1:]
+            self.assertEqual(len(related), 3,
+                             'Cleaning should remove half of the terms')
+            self.assertEqual(len(filled), 6,
+                             'Cleaned terms should be filled up')
+            self.assertEqual(filled[:3], related,
+                             'Filling up should not change the first terms')
+
+    def testIterClouds(self):
+        '''Test that periods are yielded as they are tracked.'''
+        for kwargs in [{}, {'algorithm': 'non-adaptive'},
+                       {'forwards': False}]:
+            terms, links = self.vm.trackClouds(['x', 'y'], **kwargs)
+            found = list(self.vm.iterClouds(['x', 'y'], **kwargs))
+            expectedKeys = list(terms.keys())
+            if kwargs.get('forwards') is False:
+                expectedKeys = expectedKeys[::-1]
+            self.assertEqual([key for key, _, _ in found], expectedKeys,
+                             'Periods should be yielded in tracking order')
+            for key, periodTerms, periodLinks in found:
+                self.assertEqual(periodTerms, terms[key],
+                                 'Terms should be those of trackClouds')
+                self.assertEqual(periodLinks, links[key],
+                                 'Links should be those of trackClouds')
+
+        with self.assertRaises(KeyError):
+            self.vm.iterClouds(['x'], startKey='1900_1909')
+
+    def testIterCloudsStops(self):
+        '''Test that periods which are not consumed are not tracked.'''
+        class FailingModel():
+            vocab = {}
+
+            def most_similar(self, term, topn):
+                raise AssertionError('Period should not be tracked')
+
+        vm = shVM('tests/w2vModels/*.w2v', useCache=False, useMmap=False,
+                  w2vFormat=True)
+        keys = vm.getAvailableYears()
+        vm._models[keys[2]] = FailingModel()
+        iterator = vm.iterClouds(['x', 'y'])
+        self.assertEqual([next(iterator)[0], next(iterator)[0]], keys[:2],
+                         'First periods should be yielded')
+        iterator.close()
+
+    def testStopCriteria(self):
+        '''Test that tracking stops at the first period meeting a rule.'''
+        terms, links = self.vm.trackClouds(['x', 'y'])
+        keys = list(terms.keys())
+        never = StopCriteria(minOverlap=0, minAvgSim=-1, maxDrift=1)
+        self.assertEqual(self.vm.trackClouds(['x', 'y'],
+                                             stopCriteria=never),
+                         (terms, links),
+                         'Tracking should not stop if no rule is met')
+        self.assertIsNone(never.whereStopped(['x', 'y'], terms, links),
+                          'Tracking should not have stopped')
+
+        # The seeds of adaptive tracking change from the second period on
+        criteria = StopCriteria(minOverlap=1)
+        stopped, stoppedLinks = self.vm.trackClouds(['x', 'y'],
+                                                    stopCriteria=criteria)
+        self.assertEqual(list(stopped.keys()), keys[:2],
+                         'Periods after stopping should not be tracked')
+        self.assertEqual(stopped[keys[1]], terms[keys[1]],
+                         'Periods before stopping should not change')
+        where = criteria.whereStopped(['x', 'y'], stopped, stoppedLinks)
+        self.assertEqual((where['key'], where['rule']),
+                         (keys[1], 'minOverlap'),
+                         'Should say where and why tracking stopped')
+
+        criteria = StopCriteria(minAvgSim=2)
+        stopped, stoppedLinks = self.vm.trackClouds(['x', 'y'],
+                                                    forwards=False,
+                                                    stopCriteria=criteria)
+        self.assertEqual(list(stopped.keys()), keys[-1:],
+                         'Backward tracking should stop at the last period')
+        self.assertEqual(criteria.whereStopped(['x', 'y'], stopped,
+                                               stoppedLinks,
+                                               forwards=False)['key'],
+                         keys[-1], 'Should say where tracking stopped')
+
+    def testStopCriteriaLastPeriod(self):
+        '''Test that a rule met on the last period does not count as
+        stopping, as no period is skipped.'''
+        keys = self.vm.getAvailableYears()
+        # The end key is not tracked
+        tracked = self.vm.getTrackedYears(endKey=keys[2])
+        self.assertEqual(tracked, keys[:2],
+                         'Periods before the end key should be tracked')
+        criteria = StopCriteria(minOverlap=1)
+        terms, links = self.vm.trackClouds(['x', 'y'], endKey=keys[2],
+                                           stopCriteria=criteria)
+        self.assertEqual(list(terms.keys()), tracked,
+                         'All periods should be tracked')
+        self.assertEqual(criteria.whereStopped(['x', 'y'], terms, links)['key'],
+                         keys[1], 'Rule should be met on the last period')
+        self.assertIsNone(criteria.whereStopped(['x', 'y'], terms, links,
+                                                lastKey=tracked[-1]),
+                          'Tracking should not have stopped early')